@@ -0,0 +1,234 @@
+# dash/aggregates.py
+
+import argparse
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+CACHE_DIR = "cache/dashboard"   # under DATA_DIR
+CHUNK_ROWS = 500_000
+
+# PARAMETERS
+MAP_CELL_DEGREES = 0.002   # map layers are counts per cell of this size (~200 m), not raw points
+CATEGORICAL = {"WorkerID", "DriverID", "WorkplaceID", "ShiftID", "Status", "Day", "ShiftType"}
+
+
+# 1. Read tables in chunks, like ml/storage.py: the Parquet copy when up to date, else the CSV
+def table_path(name, data_dir=DATA_DIR):
+    """The file a table is read from, or None if it does not exist."""
+    csv, parquet = os.path.join(data_dir, f"{name}.csv"), os.path.join(data_dir, f"{name}.parquet")
+    if os.path.exists(parquet) and (not os.path.exists(csv) or os.path.getmtime(parquet) >= os.path.getmtime(csv)):
+        return parquet
+    return csv if os.path.exists(csv) else None
+
+
+def read_chunks(name, columns, data_dir=DATA_DIR, chunk_rows=CHUNK_ROWS):
+    path = table_path(name, data_dir)
+    if path is None:
+        return
+    if path.endswith(".parquet"):
+        for batch in pq.ParquetFile(path).iter_batches(chunk_rows, columns=columns):
+            yield batch.to_pandas()
+        return
+    dtype = {c: "category" for c in columns if c in CATEGORICAL}
+    yield from pd.read_csv(path, usecols=columns, dtype=dtype, chunksize=chunk_rows)
+
+
+def read_table(name, columns, data_dir=DATA_DIR):
+    """A whole (small) table, or an empty frame with `columns` if it does not exist."""
+    chunks = list(read_chunks(name, columns, data_dir))
+    return pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+
+def combine(name, columns, partial, keys, data_dir=DATA_DIR):
+    """Stream a table and add up partial(chunk) aggregates grouped by `keys`, so memory stays bounded."""
+    parts = [partial(chunk) for chunk in read_chunks(name, columns, data_dir)]
+    if not parts:
+        return None
+    combined = pd.concat(parts).reset_index()
+    combined[keys] = combined[keys].astype(str)   # chunks can have different categories
+    return combined.groupby(keys).sum()
+
+
+def cell(values):
+    return np.floor(values.to_numpy(dtype=np.float64) / MAP_CELL_DEGREES).astype(np.int64)
+
+
+def cell_center(cells):
+    return (cells + 0.5) * MAP_CELL_DEGREES
+
+
+# 2. Aggregates: each a small frame the dashboard filters and plots directly
+def shift_coverage(data_dir=DATA_DIR):
+    """Per shift: planned workers and drivers (optimized) and attendance (assignments)."""
+    shifts = read_table("shifts", ["ShiftID", "Week", "Day", "ShiftType"], data_dir).astype({"ShiftID": str})
+    pairs = combine("optimized_assignments", ["ShiftID", "DriverID"],
+                    lambda c: c.groupby(["ShiftID", "DriverID"], observed=True).size().rename("Planned").to_frame(),
+                    ["ShiftID", "DriverID"], data_dir)
+    status = combine("assignments", ["ShiftID", "Status"],
+                     lambda c: c.groupby(["ShiftID", "Status"], observed=True).size().rename("Rows").to_frame(),
+                     ["ShiftID", "Status"], data_dir)
+
+    result = shifts.set_index("ShiftID")
+    if pairs is not None:
+        planned = pairs.groupby("ShiftID")["Planned"].agg(Planned="sum", Drivers="size")
+        result = result.join(planned, how="outer")
+    if status is not None:
+        result = result.join(status["Rows"].unstack(fill_value=0), how="outer")
+    counts = ["Planned", "Drivers", "Assigned", "Absent"]
+    result = result.reindex(columns=[*shifts.columns[1:], *counts])
+    result[counts] = result[counts].fillna(0).astype(np.int64)
+    result["AttendanceRate"] = (result["Assigned"] / (result["Assigned"] + result["Absent"])).round(4)
+    return result.reset_index()[["ShiftID", "Week", "Day", "ShiftType", *counts, "AttendanceRate"]]
+
+
+def driver_distance(data_dir=DATA_DIR):
+    """Per driver: workers carried and their total and mean distance to the workplace."""
+    # Summed in float64: the Parquet copy stores float32 km, whose sums show as 12.300000190734863
+    totals = combine("optimized_assignments", ["DriverID", "Distance"],
+                     lambda c: c.astype({"Distance": np.float64}).groupby("DriverID", observed=True)["Distance"].agg(
+                         Workers="size", TotalKm="sum"),
+                     ["DriverID"], data_dir)
+    if totals is None:
+        return pd.DataFrame(columns=["DriverID", "Workers", "TotalKm", "MeanKm"])
+    totals["MeanKm"] = totals["TotalKm"] / totals["Workers"]
+    return totals.round(3).sort_values("TotalKm", ascending=False).reset_index()
+
+
+def absence_rates(data_dir=DATA_DIR):
+    """Per (workplace, day): assignments, absences and the absence rate."""
+    per_shift = combine("assignments", ["WorkplaceID", "ShiftID", "Status"],
+                        lambda c: c.assign(Absent=c["Status"].eq("Absent")).groupby(
+                            ["WorkplaceID", "ShiftID"], observed=True)["Absent"].agg(Assignments="size", Absent="sum"),
+                        ["WorkplaceID", "ShiftID"], data_dir)
+    if per_shift is None:
+        return pd.DataFrame(columns=["WorkplaceID", "Day", "Assignments", "Absent", "AbsenceRate"])
+    shifts = read_table("shifts", ["ShiftID", "Day"], data_dir)
+    day_of = pd.Series(shifts["Day"].astype(str).to_numpy(), index=shifts["ShiftID"].astype(str))
+    per_shift = per_shift.reset_index()
+    per_shift["Day"] = day_of.reindex(per_shift["ShiftID"]).fillna("?").to_numpy()
+    result = per_shift.groupby(["WorkplaceID", "Day"], as_index=False)[["Assignments", "Absent"]].sum()
+    result["AbsenceRate"] = (result["Absent"] / result["Assignments"]).round(4)
+    return result
+
+
+def cluster_map(data_dir=DATA_DIR):
+    """Workers per map cell and location cluster (eda.py's workers_clustered)."""
+    cells = combine("workers_clustered", ["Latitude", "Longitude", "Cluster"],
+                    lambda c: pd.DataFrame({"LatCell": cell(c["Latitude"]), "LonCell": cell(c["Longitude"]),
+                                            "Cluster": c["Cluster"].to_numpy()}).value_counts().rename("Workers"),
+                    ["LatCell", "LonCell", "Cluster"], data_dir)
+    if cells is None:
+        return pd.DataFrame(columns=["Latitude", "Longitude", "Cluster", "Workers"])
+    cells = cells.reset_index()
+    return pd.DataFrame({"Latitude": cell_center(cells["LatCell"].astype(np.int64)),
+                         "Longitude": cell_center(cells["LonCell"].astype(np.int64)),
+                         "Cluster": cells["Cluster"].astype(np.int64), "Workers": cells["Workers"]})
+
+
+def assignment_map(data_dir=DATA_DIR):
+    """Optimized assignments per map cell of the worker's home, with their mean distance."""
+    workers = read_table("workers", ["WorkerID", "Latitude", "Longitude"], data_dir)
+    index = pd.Index(workers["WorkerID"].astype(str))
+    lat_cell, lon_cell = cell(workers["Latitude"]), cell(workers["Longitude"])
+
+    def partial(chunk):
+        ids = chunk["WorkerID"].astype("category")
+        wi = index.get_indexer(ids.cat.categories.astype(str))[ids.cat.codes.to_numpy()]   # one lookup per distinct ID
+        known = wi >= 0
+        return pd.DataFrame({"LatCell": lat_cell[wi[known]], "LonCell": lon_cell[wi[known]],
+                             "Distance": chunk["Distance"].to_numpy(dtype=np.float64)[known]}).groupby(
+            ["LatCell", "LonCell"])["Distance"].agg(Assignments="size", TotalKm="sum")
+
+    cells = combine("optimized_assignments", ["WorkerID", "Distance"], partial, ["LatCell", "LonCell"], data_dir)
+    if cells is None:
+        return pd.DataFrame(columns=["Latitude", "Longitude", "Assignments", "MeanKm"])
+    cells = cells.reset_index()
+    return pd.DataFrame({"Latitude": cell_center(cells["LatCell"].astype(np.int64)),
+                         "Longitude": cell_center(cells["LonCell"].astype(np.int64)),
+                         "Assignments": cells["Assignments"],
+                         "MeanKm": (cells["TotalKm"] / cells["Assignments"]).round(3)})
+
+
+# Aggregate name → (builder, tables it is computed from)
+AGGREGATES = {
+    "shift_coverage": (shift_coverage, ["optimized_assignments", "assignments", "shifts"]),
+    "driver_distance": (driver_distance, ["optimized_assignments"]),
+    "absence_rates": (absence_rates, ["assignments", "shifts"]),
+    "cluster_map": (cluster_map, ["workers_clustered"]),
+    "assignment_map": (assignment_map, ["optimized_assignments", "workers"]),
+}
+
+
+# 3. Server-side cache
+class AggregateCache:
+    """Aggregates kept in memory and in data/cache/dashboard, rebuilt when a source table changes.
+
+    A table counts as changed when the file it is read from, or its size or
+    modification time, differs from when the aggregate was built. The disk copy
+    lets several server processes (and restarts) share one build.
+    """
+
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = data_dir
+        self.cache_dir = os.path.join(data_dir, CACHE_DIR)
+        self.memory = {}   # name → (signature, frame)
+        self.lock = threading.Lock()
+
+    def signature(self, name):
+        files = []
+        for table in AGGREGATES[name][1]:
+            path = table_path(table, self.data_dir)
+            stat = os.stat(path) if path else None
+            files.append([path, stat.st_mtime_ns, stat.st_size] if stat else None)
+        return files
+
+    def version(self):
+        """Changes whenever any aggregate would be rebuilt; cheap enough to poll."""
+        return json.dumps([self.signature(name) for name in AGGREGATES])
+
+    def get(self, name):
+        signature = self.signature(name)
+        with self.lock:
+            cached = self.memory.get(name)
+            if cached is None or cached[0] != signature:
+                self.memory[name] = (signature, self._load_or_build(name, signature))
+            return self.memory[name][1]
+
+    def warm(self):
+        return {name: len(self.get(name)) for name in AGGREGATES}
+
+    def _load_or_build(self, name, signature):
+        frame_path = os.path.join(self.cache_dir, f"{name}.parquet")
+        signature_path = os.path.join(self.cache_dir, f"{name}.json")
+        if os.path.exists(frame_path) and os.path.exists(signature_path):
+            with open(signature_path) as f:
+                if json.load(f) == signature:
+                    return pd.read_parquet(frame_path)
+
+        start = time.perf_counter()
+        frame = AGGREGATES[name][0](self.data_dir)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Write then rename, so another process never reads a half-written copy
+        frame.to_parquet(f"{frame_path}.tmp", index=False)
+        os.replace(f"{frame_path}.tmp", frame_path)
+        with open(f"{signature_path}.tmp", "w") as f:
+            json.dump(signature, f)
+        os.replace(f"{signature_path}.tmp", signature_path)
+        print(f"✅ Aggregate {name} built with {len(frame)} rows in {time.perf_counter() - start:.2f}s")
+        return frame
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute the dashboard aggregates into the server-side cache.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    sizes = AggregateCache(args.data_dir).warm()
+    print(f"✅ {len(sizes)} aggregates ready in {time.perf_counter() - start:.2f}s: {sizes}")
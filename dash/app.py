@@ -0,0 +1,139 @@
+# dash/app.py
+
+import os
+
+import numpy as np
+import plotly.graph_objects as go
+from dash import Dash, Input, Output, State, dcc, html, no_update
+
+from aggregates import AggregateCache
+
+# PARAMETERS
+PORT = int(os.environ.get("PORT", 8050))
+REFRESH_SECONDS = 30       # how often the page checks whether the data files changed
+TOP_DRIVERS = 30           # drivers shown in the distance chart
+TOP_WORKPLACES = 40        # workplaces (by assignments) shown in the absence heatmap
+DAY_ORDER = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# Every callback reads the small precomputed aggregates, never the raw files
+cache = AggregateCache()
+app = Dash(__name__, title="AI Workforce Scheduler")
+server = app.server   # for gunicorn: gunicorn app:server
+
+
+def kpi(label, value):
+    return html.Div([html.Div(value, style={"fontSize": "1.6em", "fontWeight": "bold"}), html.Div(label)],
+                    style={"padding": "0.5em 1.5em", "border": "1px solid #ddd", "borderRadius": "6px"})
+
+
+app.layout = html.Div([
+    html.H1("AI Workforce Scheduler"),
+    html.Div(id="kpis", style={"display": "flex", "gap": "1em", "flexWrap": "wrap"}),
+    dcc.Interval(id="refresh", interval=REFRESH_SECONDS * 1000),
+    dcc.Store(id="version"),
+
+    html.H2("Coverage per shift"),
+    dcc.Dropdown(id="week", placeholder="All weeks", clearable=True),
+    dcc.Graph(id="coverage"),
+
+    html.H2("Distance per driver"),
+    dcc.RadioItems(id="driver-order", inline=True, value="TotalKm",
+                   options=[{"label": "Total km", "value": "TotalKm"}, {"label": "Mean km", "value": "MeanKm"},
+                            {"label": "Workers", "value": "Workers"}]),
+    dcc.Graph(id="drivers"),
+
+    html.H2("Absence rate per workplace and day"),
+    dcc.Graph(id="absences"),
+
+    html.H2("Map"),
+    dcc.RadioItems(id="layer", inline=True, value="clusters",
+                   options=[{"label": "Worker clusters", "value": "clusters"},
+                            {"label": "Optimized assignments", "value": "assignments"}]),
+    dcc.Graph(id="map", style={"height": "600px"}),
+], style={"fontFamily": "sans-serif", "margin": "1em 2em"})
+
+
+@app.callback(Output("version", "data"), Input("refresh", "n_intervals"), State("version", "data"))
+def check_files(_, current):
+    """Bump the version when a data file changed; the charts below then rebuild from the new aggregates."""
+    version = cache.version()
+    return version if version != current else no_update
+
+
+@app.callback(Output("kpis", "children"), Output("week", "options"), Input("version", "data"))
+def update_kpis(_):
+    coverage, drivers = cache.get("shift_coverage"), cache.get("driver_distance")
+    attended, absent = coverage["Assigned"].sum(), coverage["Absent"].sum()
+    planned_km = drivers["TotalKm"].sum()
+    cards = [
+        kpi("Planned assignments", f"{coverage['Planned'].sum():,}"),
+        kpi("Shifts covered", f"{(coverage['Planned'] > 0).sum()} / {len(coverage)}"),
+        kpi("Drivers used", f"{(drivers['Workers'] > 0).sum():,}"),
+        kpi("Total km", f"{planned_km:,.1f}"),
+        kpi("Absence rate", f"{absent / max(attended + absent, 1):.1%}"),
+    ]
+    weeks = sorted(coverage["Week"].dropna().astype(int).unique())
+    return cards, [{"label": f"Week {week}", "value": int(week)} for week in weeks]
+
+
+@app.callback(Output("coverage", "figure"), Input("week", "value"), Input("version", "data"))
+def update_coverage(week, _):
+    coverage = cache.get("shift_coverage")
+    if week is not None:
+        coverage = coverage[coverage["Week"] == week]
+    fig = go.Figure([go.Bar(name=column, x=coverage["ShiftID"], y=coverage[column])
+                     for column in ("Planned", "Assigned", "Absent")])
+    fig.update_layout(barmode="group", xaxis_title="Shift", yaxis_title="Workers", margin={"t": 20})
+    return fig
+
+
+@app.callback(Output("drivers", "figure"), Input("driver-order", "value"), Input("version", "data"))
+def update_drivers(order, _):
+    top = cache.get("driver_distance").nlargest(TOP_DRIVERS, order)
+    fig = go.Figure(go.Bar(x=top[order], y=top["DriverID"], orientation="h",
+                           customdata=top[["Workers", "TotalKm", "MeanKm"]],
+                           hovertemplate="%{y}: %{customdata[0]} workers, %{customdata[1]} km "
+                                         "(mean %{customdata[2]} km)<extra></extra>"))
+    fig.update_layout(yaxis={"autorange": "reversed"}, xaxis_title=order, margin={"t": 20},
+                      height=max(300, 18 * len(top)))
+    return fig
+
+
+@app.callback(Output("absences", "figure"), Input("version", "data"))
+def update_absences(_):
+    rates = cache.get("absence_rates")
+    busiest = rates.groupby("WorkplaceID")["Assignments"].sum().nlargest(TOP_WORKPLACES).index
+    grid = rates[rates["WorkplaceID"].isin(busiest)].pivot(index="WorkplaceID", columns="Day", values="AbsenceRate")
+    grid = grid.reindex(columns=[day for day in DAY_ORDER if day in grid.columns])
+    fig = go.Figure(go.Heatmap(z=grid.to_numpy(), x=grid.columns, y=grid.index, colorscale="Reds", zmin=0,
+                               colorbar={"title": "Absence rate"}))
+    fig.update_layout(margin={"t": 20}, height=max(300, 18 * len(grid)))
+    return fig
+
+
+@app.callback(Output("map", "figure"), Input("layer", "value"), Input("version", "data"))
+def update_map(layer, _):
+    """Pre-binned cells (a few thousand points at most) instead of one marker per worker."""
+    if layer == "clusters":
+        cells = cache.get("cluster_map")
+        traces = [go.Scattergl(x=group["Longitude"], y=group["Latitude"], mode="markers", name=f"Cluster {cluster}",
+                               marker={"size": 3 + 2 * np.log1p(group["Workers"]), "opacity": 0.7},
+                               text=group["Workers"], hovertemplate="%{text} workers<extra></extra>")
+                  for cluster, group in cells.groupby("Cluster")]
+    else:
+        cells = cache.get("assignment_map")
+        traces = [go.Scattergl(x=cells["Longitude"], y=cells["Latitude"], mode="markers", name="Assignments",
+                               marker={"size": 3 + 2 * np.log1p(cells["Assignments"]), "color": cells["MeanKm"],
+                                       "colorscale": "Viridis", "colorbar": {"title": "Mean km"}, "opacity": 0.8},
+                               customdata=cells[["Assignments", "MeanKm"]],
+                               hovertemplate="%{customdata[0]} assignments, mean %{customdata[1]} km<extra></extra>")]
+    fig = go.Figure(traces)
+    # A degree of longitude is ~1/1.6 of a degree of latitude at Amsterdam's latitude
+    fig.update_layout(xaxis_title="Longitude", yaxis_title="Latitude", yaxis={"scaleanchor": "x", "scaleratio": 1.6},
+                      margin={"t": 20})
+    return fig
+
+
+if __name__ == "__main__":
+    print(f"✅ Aggregates ready: {cache.warm()}")
+    app.run(host="0.0.0.0", port=PORT, debug=False)
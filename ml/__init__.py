@@ -0,0 +1,55 @@
+# ml/__init__.py
+"""Workforce scheduling stages as a library and as one `python -m ml <command>` CLI.
+
+The modules import each other by plain name, as they do when run as scripts
+from this directory, so that directory has to be on sys.path. Importing `ml`
+leaves sys.path alone, so generic names like `storage` or `pipeline` cannot
+shadow other packages: `python -m ml` adds the directory, and so does the
+first `ml.run("generate", "--workers", "1000")` or `ml.optimize_schedule`
+(`from ml import eda`), which import only the module behind it.
+"""
+
+import importlib
+import os
+import sys
+
+_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def add_to_path():
+    """Put this directory on sys.path, for the modules' imports of each other."""
+    if _DIR not in sys.path:
+        sys.path.insert(0, _DIR)
+
+
+# Command → (module, what it does). Each module has main(argv=None) and parse_args(argv=None).
+COMMANDS = {
+    "generate": ("generate_all", "Generate the synthetic datasets"),
+    "convert": ("storage", "Convert the CSV datasets to typed Parquet"),
+    "eda": ("eda", "Cluster workers and summarize the datasets"),
+    "predict-absences": ("predict_absences", "Train the absence prediction models"),
+    "score-absences": ("absence_scoring", "Score assignments with a trained absence model"),
+    "map-zones": ("spatial", "Map workers to zones and their nearest workplaces"),
+    "optimize": ("optimize_schedule", "Optimize the worker, driver and shift assignments"),
+    "benchmark": ("benchmark_solver", "Benchmark the optimizer on synthetic instances"),
+    "route": ("routing", "Plan each driver's pickup order"),
+    "visualize": ("visualize_schedule", "Plot the optimized schedule"),
+    "repair-service": ("repair_service", "Serve same-day absence repairs of the schedule over HTTP"),
+    "pipeline": ("pipeline", "Run the stages whose code or input data changed"),
+}
+MODULES = {module for module, _ in COMMANDS.values()} | {"candidates", "distances", "npy_cache"}
+
+
+def run(command, *argv):
+    """Run a command in this process, like `python -m ml <command> <argv...>`."""
+    if command not in COMMANDS:
+        raise ValueError(f"Unknown command {command!r}, expected one of: {', '.join(COMMANDS)}")
+    add_to_path()
+    return importlib.import_module(COMMANDS[command][0]).main(list(argv))
+
+
+def __getattr__(name):
+    if name in MODULES:
+        add_to_path()
+        return importlib.import_module(name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
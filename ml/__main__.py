@@ -0,0 +1,30 @@
+# ml/__main__.py
+
+import sys
+
+from . import COMMANDS, add_to_path, run
+
+add_to_path()
+
+
+def usage():
+    width = max(map(len, COMMANDS))
+    lines = [f"  {name:<{width}}  {help}" for name, (_, help) in COMMANDS.items()]
+    return "usage: python -m ml <command> [options]\n\ncommands:\n" + "\n".join(lines) \
+        + "\n\n`python -m ml <command> --help` shows the options of a command."
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return
+    command, rest = argv[0], argv[1:]
+    if command not in COMMANDS:
+        sys.exit(f"{usage()}\n\n❌ Unknown command: {command}")
+    sys.argv[0] = f"python -m ml {command}"   # the command's --help and errors name it
+    run(command, *rest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# ml/absence_scoring.py
+
+import argparse
+import os
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.base import BaseEstimator, TransformerMixin
+
+from storage import AVAILABILITY, load
+
+OUTPUT_DIR = "data"
+SCORE_BLOCK_ROWS = 65_536   # rows walked through the compact forest at a time
+MODELS = {
+    "rf": f"{OUTPUT_DIR}/absence_model_rf.pkl",
+    "logreg": f"{OUTPUT_DIR}/absence_model_logreg.pkl",
+    "rf-compact": f"{OUTPUT_DIR}/absence_model_rf_compact.npz",
+}
+
+
+class AbsenceFeatures(BaseEstimator, TransformerMixin):
+    """Worker features used by the absence models: availability, skill one-hots, gender one-hots.
+
+    fit() fixes the skill and gender vocabularies, so transform() always returns
+    the same columns in the same order as at training time.
+    """
+
+    def fit(self, X, y=None):
+        self.availability_ = [c for c in X.columns if "Available_" in c]
+        self.skills_ = sorted(X["Skills"].astype(str).str.get_dummies(sep=",").columns)
+        self.genders_ = sorted(X["Gender"].dropna().astype(str).unique())
+        return self
+
+    def transform(self, X):
+        # One-hot the distinct skill combinations once, then gather per row
+        combos = X["Skills"].astype(str).astype("category")
+        skills = (pd.Series(combos.cat.categories).str.get_dummies(sep=",")
+                  .reindex(columns=self.skills_, fill_value=0).to_numpy()[combos.cat.codes.to_numpy()])
+        gender = pd.get_dummies(pd.Categorical(X["Gender"].astype(str), categories=self.genders_)).to_numpy()
+        return np.hstack([X[self.availability_].to_numpy(), skills, gender]).astype(np.float32)
+
+    def get_feature_names_out(self, input_features=None):
+        return np.array(self.availability_ + self.skills_ + [f"Gender_{g}" for g in self.genders_], dtype=object)
+
+
+class CompactForest:
+    """A fitted random forest flattened into a few typed arrays.
+
+    All trees share one node table; predict_proba walks every (row, tree) pair
+    down one level per step with array operations.
+    """
+
+    def __init__(self, feature, threshold, left, right, proba, roots):
+        self.feature, self.threshold = feature, threshold
+        self.left, self.right, self.proba, self.roots = left, right, proba, roots
+
+    @classmethod
+    def from_forest(cls, forest):
+        trees = [est.tree_ for est in forest.estimators_]
+        offsets = np.concatenate([[0], np.cumsum([t.node_count for t in trees])[:-1]])
+        leaf = np.concatenate([t.children_left == -1 for t in trees])
+        # Leaves point to themselves, so finished walks stay in place
+        node_ids = np.arange(len(leaf))
+        left = np.where(leaf, node_ids, np.concatenate([t.children_left + o for t, o in zip(trees, offsets)]))
+        right = np.where(leaf, node_ids, np.concatenate([t.children_right + o for t, o in zip(trees, offsets)]))
+        value = np.concatenate([t.value[:, 0, :] for t in trees])
+        return cls(
+            feature=np.concatenate([np.maximum(t.feature, 0) for t in trees]).astype(np.int16),
+            threshold=np.concatenate([t.threshold for t in trees]).astype(np.float32),
+            left=left.astype(np.int32),
+            right=right.astype(np.int32),
+            proba=(value[:, 1] / value.sum(axis=1)).astype(np.float32),
+            roots=offsets.astype(np.int32),
+        )
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        p = np.empty(len(X), dtype=np.float32)
+        for start in range(0, len(X), SCORE_BLOCK_ROWS):
+            block = X[start:start + SCORE_BLOCK_ROWS]
+            rows = np.arange(len(block))[:, None]
+            node = np.broadcast_to(self.roots, (len(block), len(self.roots))).copy()
+            while True:
+                goes_left = block[rows, self.feature[node]] <= self.threshold[node]
+                nxt = np.where(goes_left, self.left[node], self.right[node])
+                if np.array_equal(nxt, node):
+                    break
+                node = nxt
+            p[start:start + len(block)] = self.proba[node].mean(axis=1)
+        return np.column_stack([1 - p, p])
+
+    def arrays(self):
+        return {"feature": self.feature, "threshold": self.threshold, "left": self.left,
+                "right": self.right, "proba": self.proba, "roots": self.roots}
+
+
+class AbsenceScorer:
+    """Fitted feature pipeline + model, saved and loaded as one unit."""
+
+    def __init__(self, features, model):
+        self.features = features
+        self.model = model
+
+    def score(self, pairs, workers):
+        """Absence probability for every (WorkerID, ShiftID) row of `pairs` in one call.
+
+        Features depend only on the worker and are all 0/1, so the model only sees
+        the distinct feature rows of the workers in `pairs`; the result is gathered
+        back for all pairs. Unknown workers get NaN.
+        """
+        rows = pd.Index(workers["WorkerID"]).get_indexer(pairs["WorkerID"])
+        known = rows >= 0
+        used = np.flatnonzero(np.bincount(rows[known], minlength=len(workers)))
+        X = self.features.transform(workers.iloc[used])
+        # Pack each 0/1 row into one integer to find the distinct rows with a 1-D unique
+        codes = X.astype(np.uint64) @ (np.uint64(1) << np.arange(X.shape[1], dtype=np.uint64))
+        _, first, worker_row = np.unique(codes, return_index=True, return_inverse=True)
+        proba = np.full(len(workers), np.nan)
+        proba[used] = self.model.predict_proba(X[first])[:, 1][worker_row]
+        return pd.Series(np.where(known, proba[rows], np.nan), index=pairs.index, name="AbsenceProbability")
+
+    def save(self, path):
+        joblib.dump(self, path)
+
+    def save_compact(self, path):
+        """Export a random forest scorer as a small .npz of typed arrays (no pickle needed to load)."""
+        np.savez_compressed(
+            path, **CompactForest.from_forest(self.model).arrays(),
+            availability=np.array(self.features.availability_), skills=np.array(self.features.skills_),
+            genders=np.array(self.features.genders_))
+
+    @staticmethod
+    def load(path):
+        if not path.endswith(".npz"):
+            return joblib.load(path)
+        with np.load(path) as data:
+            features = AbsenceFeatures()
+            features.availability_ = data["availability"].tolist()
+            features.skills_ = data["skills"].tolist()
+            features.genders_ = data["genders"].tolist()
+            forest = CompactForest(*(data[k] for k in ("feature", "threshold", "left", "right", "proba", "roots")))
+        return AbsenceScorer(features, forest)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Score upcoming assignments with a trained absence model.")
+    parser.add_argument("--model", choices=sorted(MODELS), default="rf-compact")
+    parser.add_argument("--input", default="optimized_assignments",
+                        help="Table in data/ with WorkerID and ShiftID columns to score")
+    parser.add_argument("--output", default=f"{OUTPUT_DIR}/absence_scores.csv")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    scorer = AbsenceScorer.load(MODELS[args.model])
+    workers = load("workers", columns=["WorkerID", "Gender", "Skills", *AVAILABILITY])
+    pairs = load(args.input, columns=["WorkerID", "ShiftID"])
+
+    pairs["AbsenceProbability"] = scorer.score(pairs, workers).round(4)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    pairs.to_csv(args.output, index=False)
+    print(f"✅ {len(pairs)} assignments scored with {args.model}, saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
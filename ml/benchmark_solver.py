@@ -0,0 +1,190 @@
+# ml/benchmark_solver.py
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+from ortools import __version__ as ortools_version
+
+from generate_all import (DAYS, SHIFTS, generate_drivers, generate_shifts, generate_workers, generate_workplaces,
+                          name_pools)
+from distances import worker_workplace_distances
+from optimize_schedule import (TIME_LIMIT_SECONDS, model_columns, select_candidates, solve_decomposed,
+                               solve_subproblem)
+
+OUTPUT_DIR = "data/benchmarks"
+RESULT_FILE = f"{OUTPUT_DIR}/solver_benchmark"   # .json and .csv
+
+# PARAMETERS
+# Instance ladder: name → (workers, drivers, workplaces, weeks)
+SIZES = {
+    "xs": (50, 10, 5, 1),
+    "s": (800, 50, 15, 2),
+    "m": (5_000, 200, 50, 2),
+    "l": (20_000, 500, 150, 4),
+    "xl": (100_000, 2_000, 500, 8),
+}
+# Solving mode → largest worker count it is run for (None: every size); CP-SAT models
+# grow with workers x drivers, so beyond these sizes they only hit the time limit
+MODES = {
+    "flow": None,
+    "flow-decomposed": None,
+    "cpsat-factorized": 800,
+    "cpsat-tensor": 50,
+}
+COUNT_COLUMNS = ["Workers", "Drivers", "Workplaces", "Shifts", "Candidates", "Variables", "Constraints",
+                 "Subproblems", "Assignments"]
+REGRESSION_FACTOR = 1.5   # --baseline flags runs this many times slower than before
+
+
+def generate_instance(size, seed):
+    """Seeded instance of the given ladder size, built with the generate_all generators."""
+    n_workers, n_drivers, n_workplaces, n_weeks = SIZES[size]
+    rng = np.random.default_rng(seed)
+    names = name_pools(seed)
+    return (generate_workers(n_workers, rng, names), generate_drivers(n_drivers, rng, names),
+            generate_workplaces(n_workplaces, rng, names), generate_shifts(n_weeks))
+
+
+def instance_size(size):
+    n_workers, n_drivers, n_workplaces, n_weeks = SIZES[size]
+    return {"Size": size, "Workers": n_workers, "Drivers": n_drivers, "Workplaces": n_workplaces,
+            "Shifts": n_weeks * len(DAYS) * len(SHIFTS)}
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process and of any finished pool children, in MB."""
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+def run_mode(mode, workers, drivers, workplaces, shifts, dist, candidates, time_limit):
+    """Solve with one mode; returns (solution tuples or None, measurements)."""
+    if mode == "flow-decomposed":
+        start = time.perf_counter()
+        solution, stats = solve_decomposed(workers, drivers, workplaces, shifts, dist, candidates, "day",
+                                           backend="flow", formulation=None, time_limit=time_limit)
+        # Build and solve interleave across the pool: the build column holds the coordination step
+        # Model sizes, extract seconds and objective are summed over the subproblems
+        return solution, {"Variables": stats.get("Variables"), "Constraints": stats.get("Constraints"),
+                          "BuildSeconds": round(time.perf_counter() - start - stats["WallSeconds"], 3),
+                          "SolveSeconds": stats["WallSeconds"], "ExtractSeconds": stats["ExtractSeconds"],
+                          "Status": "FEASIBLE" if solution else "INFEASIBLE", "Objective": stats.get("Objective"),
+                          "Subproblems": stats["Subproblems"]}
+
+    backend, _, formulation = mode.partition("-")
+    solution, stats = solve_subproblem(workers, drivers, workplaces, shifts, dist, candidates, backend,
+                                       formulation or None, time_limit)
+    return solution, model_columns(stats)
+
+
+def run_case(size, mode, seed, time_limit):
+    """Generate one instance and solve it with one mode (run in a fresh process, so peak memory is its own)."""
+    workers, drivers, workplaces, shifts = generate_instance(size, seed)
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as cache_dir:   # no distance or neighbor cache hits between runs
+        dist = np.array(worker_workplace_distances(workers, workplaces, cache_dir=cache_dir))
+        candidates = select_candidates(workers, workplaces, shifts, cache_dir=cache_dir)
+    prepare_time = time.perf_counter() - start
+
+    solution, result = run_mode(mode, workers, drivers, workplaces, shifts, dist, candidates, time_limit)
+    if solution is not None:
+        wi, _, wpi, _ = np.array(solution, dtype=np.int64).reshape(-1, 4).T
+        result.update(Assignments=len(solution), TotalKm=round(float(dist[wi, wpi].sum()), 3))
+    return {**instance_size(size), "Mode": mode, "Candidates": len(candidates), "PrepareSeconds": round(prepare_time, 3), **result, "PeakMB": round(peak_memory_mb(), 1)}
+
+
+def run_benchmark(sizes, modes, seed=42, time_limit=TIME_LIMIT_SECONDS, all_modes=False):
+    """Every (size, mode) case in its own spawned process, one at a time so timings do not compete.
+
+    An executor rather than a Pool: its processes are not daemonic, so the
+    decomposed mode can start its own pool inside.
+    """
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for size in sizes:
+        for mode in modes:
+            limit = MODES[mode]
+            if not all_modes and limit is not None and SIZES[size][0] > limit:
+                results.append({**instance_size(size), "Mode": mode, "Status": "SKIPPED"})
+                continue
+            print(f"⏱️ {size} / {mode} ...", flush=True)
+            try:
+                with ProcessPoolExecutor(1, mp_context=context) as executor:
+                    results.append(executor.submit(run_case, size, mode, seed, time_limit).result())
+            except BrokenProcessPool:   # e.g. killed when out of memory
+                print(f"❌ {size} / {mode} crashed")
+                results.append({**instance_size(size), "Mode": mode, "Status": "CRASHED"})
+    results = pd.DataFrame(results)
+    counts = [c for c in COUNT_COLUMNS if c in results]
+    results[counts] = results[counts].astype("Int64")   # skipped cases leave gaps
+    return results
+
+
+def save_results(results, path, **metadata):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(f"{path}.json", "w") as f:
+        json.dump({**metadata, "results": json.loads(results.to_json(orient="records"))}, f, indent=2)
+    results.to_csv(f"{path}.csv", index=False)
+    print(f"✅ Results saved to {path}.json and {path}.csv")
+
+
+def summary_table(results):
+    columns = ["Size", "Mode", "Workers", "Shifts", "Candidates", "Variables", "Constraints", "BuildSeconds",
+               "SolveSeconds", "ExtractSeconds", "PeakMB", "Status", "TotalKm"]
+    return results.reindex(columns=columns).astype(object).fillna("-").to_string(index=False)
+
+
+def compare_to_baseline(results, path, factor=REGRESSION_FACTOR):
+    """Solve time and objective of each case against an earlier results file; flags regressions."""
+    with open(path) as f:
+        baseline = pd.DataFrame(json.load(f)["results"])
+    keys = ["Size", "Mode"]
+    merged = results.reindex(columns=keys + ["SolveSeconds", "PeakMB", "TotalKm"]).merge(
+        baseline.reindex(columns=keys + ["SolveSeconds", "PeakMB", "TotalKm"]), on=keys, suffixes=("", "Before"))
+    merged = merged.dropna(subset=["SolveSeconds", "SolveSecondsBefore"])
+    merged["SolveRatio"] = (merged["SolveSeconds"] / merged["SolveSecondsBefore"].clip(lower=1e-3)).round(2)
+    merged["Regression"] = (merged["SolveRatio"] > factor) | (merged["TotalKm"] > merged["TotalKmBefore"] + 1e-6)
+    print(f"\n--- Against {path} ---")
+    print(merged.astype(object).fillna("-").to_string(index=False))
+    if merged["Regression"].any():
+        print(f"⚠️ {merged['Regression'].sum()} cases are slower than x{factor} or found a worse solution")
+    return merged
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the schedule solvers on a ladder of generated instances.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the generated instances")
+    parser.add_argument("--time-limit", type=float, default=TIME_LIMIT_SECONDS, help="CP-SAT time limit per case")
+    parser.add_argument("--all-modes", action="store_true",
+                        help="Also run CP-SAT modes on sizes above their limit in MODES")
+    parser.add_argument("--output", default=RESULT_FILE, help="Results path without extension")
+    parser.add_argument("--baseline", metavar="JSON", help="Earlier results to check for regressions")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.strftime("%Y-%m-%dT%H:%M:%S")
+    results = run_benchmark(args.sizes, args.modes, args.seed, args.time_limit, args.all_modes)
+    print(summary_table(results))
+    save_results(results, args.output, started=started, seed=args.seed, time_limit=args.time_limit,
+                 sizes={size: SIZES[size] for size in args.sizes}, cpu_count=os.cpu_count(),
+                 python=platform.python_version(), ortools=ortools_version)
+    if args.baseline:
+        compare_to_baseline(results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
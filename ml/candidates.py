@@ -0,0 +1,123 @@
+# ml/candidates.py
+
+import numpy as np
+import pandas as pd
+
+from npy_cache import CACHE_DIR
+from distances import coordinates
+from spatial import SpatialIndex, workplace_neighbors
+from storage import SKILL_POOL, skill_mask
+
+# PARAMETERS
+K_NEAREST = 5          # keep only each worker's k closest workplaces
+MAX_DISTANCE = None    # km; drop workplaces further than this from the worker
+
+# Skills a workplace type can use; a worker needs at least one of them
+WORKPLACE_SKILLS = {
+    "Factory": {"Welding", "Assembly", "QA", "Packaging"},
+    "Office": {"Admin", "QA"},
+    "Warehouse": {"Logistics", "Forklift", "Packaging"},
+    "Construction": {"Welding", "Assembly", "Forklift"},
+}
+
+
+def availability_matrix(workers, shifts):
+    """(workers x shifts) bool: worker is available on the shift's Day."""
+    return np.array(workers[[f"Available_{day}" for day in shifts["Day"]]], dtype=bool)
+
+
+def absence_matrix(workers, shifts, absences):
+    """(workers x shifts) bool: worker is marked Absent for that shift in assignments.csv."""
+    absent = np.zeros((len(workers), len(shifts)), dtype=bool)
+    if absences is None or absences.empty:
+        return absent
+    wi = pd.Index(workers["WorkerID"]).get_indexer(absences["WorkerID"])
+    si = pd.Index(shifts["ShiftID"]).get_indexer(absences["ShiftID"])
+    known = (wi >= 0) & (si >= 0)
+    absent[wi[known], si[known]] = True
+    return absent
+
+
+def workplace_skill_masks(workplaces):
+    """uint8 bitmask per workplace of the skills its type uses, like storage.skill_mask()."""
+    type_masks = {wp_type: sum(1 << SKILL_POOL.index(s) for s in skills) for wp_type, skills in WORKPLACE_SKILLS.items()}
+    return np.array([type_masks.get(wp_type, 0) for wp_type in workplaces["Type"]], dtype=np.uint8)
+
+
+def skill_match_matrix(workers, workplaces):
+    """(workers x workplaces) bool: worker has a skill the workplace type uses."""
+    worker_masks = workers["SkillMask"].to_numpy() if "SkillMask" in workers else skill_mask(workers["Skills"])
+    return (worker_masks[:, None] & workplace_skill_masks(workplaces)[None, :]) != 0
+
+
+def proximity_matrix(workers, workplaces, k_nearest=K_NEAREST, max_distance=MAX_DISTANCE, cache_dir=CACHE_DIR):
+    """(workers x workplaces) bool: workplace is among the worker's k nearest and within reach.
+
+    The k nearest come from the cached spatial.workplace_neighbors table, so the
+    dense distance matrix is never scanned.
+    """
+    near = np.zeros((len(workers), len(workplaces)), dtype=bool)
+    if k_nearest and k_nearest < len(workplaces):
+        nearest, km = workplace_neighbors(workers, workplaces, k_nearest, cache_dir=cache_dir)
+        reach = km <= (np.inf if max_distance is None else max_distance)
+        near[np.nonzero(reach)[0], nearest[reach]] = True
+    elif max_distance is not None:
+        wi, wpi, _ = SpatialIndex.from_frame(workplaces).within(coordinates(workers), max_distance)
+        near[wi, wpi] = True
+    else:
+        near[:] = True
+    return near
+
+
+def build_candidates(workers, workplaces, shifts, k_nearest=K_NEAREST, max_distance=MAX_DISTANCE,
+                     match_skills=True, absences=None, cache_dir=CACHE_DIR):
+    """Sparse list of (worker, workplace, shift) index triples worth a model variable.
+
+    Rules are applied in order (availability, absence, skills, distance) and each
+    pruned triple is counted against the first rule that rejects it.
+    """
+    available = availability_matrix(workers, shifts)
+    absent = absence_matrix(workers, shifts, absences) & available
+    n_unavailable = available.size - available.sum()
+    available &= ~absent
+    n_available = available.sum(axis=1)   # shifts per worker that pass availability and absence
+    skilled = skill_match_matrix(workers, workplaces) if match_skills \
+        else np.ones((len(workers), len(workplaces)), dtype=bool)
+    near = proximity_matrix(workers, workplaces, k_nearest, max_distance, cache_dir)
+    keep = skilled & near
+
+    total = len(workers) * len(workplaces) * len(shifts)
+    report = {
+        "Total": total,
+        "Availability": int(n_unavailable * len(workplaces)),
+        "Absence": int(absent.sum() * len(workplaces)),
+        "Skills": int((~skilled * n_available[:, None]).sum()),
+        "Distance": int(((skilled & ~near) * n_available[:, None]).sum()),
+    }
+
+    pair_worker, pair_workplace = np.nonzero(keep)
+    pair_index, shift_index = np.nonzero(available[pair_worker])
+    candidates = pd.DataFrame({
+        "worker": pair_worker[pair_index].astype(np.int32),
+        "workplace": pair_workplace[pair_index].astype(np.int32),
+        "shift": shift_index.astype(np.int32),
+    })
+    report["Kept"] = len(candidates)
+    return candidates, report
+
+
+def all_candidates(n_workers, n_workplaces, n_shifts):
+    """Every (worker, workplace, shift) triple, i.e. no pruning."""
+    wi, wpi, si = np.meshgrid(np.arange(n_workers), np.arange(n_workplaces), np.arange(n_shifts), indexing="ij")
+    return pd.DataFrame({
+        "worker": wi.ravel().astype(np.int32),
+        "workplace": wpi.ravel().astype(np.int32),
+        "shift": si.ravel().astype(np.int32),
+    })
+
+
+def print_report(report):
+    print(f"\n--- Candidate pruning ({report['Total']} combinations) ---")
+    for rule in ("Availability", "Absence", "Skills", "Distance"):
+        print(f"Pruned by {rule.lower():<12}: {report[rule]:>10} ({report[rule] / report['Total']:.1%})")
+    print(f"Candidates kept       : {report['Kept']:>10} ({report['Kept'] / report['Total']:.1%})")
@@ -0,0 +1,47 @@
+# ml/distances.py
+
+import numpy as np
+
+from npy_cache import CACHE_DIR, cached
+
+# PARAMETERS
+EARTH_RADIUS_KM = 6371.0088
+CHUNK_ROWS = 4096   # rows per broadcast block, bounds the float64 temporaries
+
+
+def coordinates(df):
+    """(n x 2) float64 array of Latitude/Longitude in degrees."""
+    return df[["Latitude", "Longitude"]].to_numpy(dtype=np.float64)
+
+
+def unit_vectors(points):
+    """Lat/lon degrees → points on the unit sphere, so a block of distances is one matrix product."""
+    lat, lon = np.radians(points[:, 0]), np.radians(points[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def _chord_sq(a, b):
+    """Squared chord length between unit vectors, monotonic in great-circle distance."""
+    return np.maximum(2.0 - 2.0 * (a @ b.T), 0.0)
+
+
+def chord_sq_to_km(chord_sq):
+    # Haversine: d = 2R·asin(sqrt(h)), and h = chord² / 4 on the unit sphere
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(np.sqrt(chord_sq) / 2, 1.0))
+
+
+def haversine_matrix(a, b):
+    """Dense (len(a) x len(b)) great-circle distances in km."""
+    a, b = unit_vectors(a), unit_vectors(b)
+    out = np.empty((len(a), len(b)), dtype=np.float32)
+    for start in range(0, len(a), CHUNK_ROWS):
+        out[start:start + CHUNK_ROWS] = chord_sq_to_km(_chord_sq(a[start:start + CHUNK_ROWS], b))
+    return out
+
+
+# ========== PROJECT MATRICES ==========
+def worker_workplace_distances(workers, workplaces, cache_dir=CACHE_DIR):
+    """Dense worker → workplace distance matrix in km (workers x workplaces)."""
+    return cached("worker_workplace", haversine_matrix, coordinates(workers), coordinates(workplaces),
+                  cache_dir=cache_dir)
+
@@ -1,58 +1,177 @@
 # ml/eda.py
 
+import argparse
+import json
+from collections import Counter
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from sklearn.cluster import KMeans
+from sklearn.cluster import KMeans, MiniBatchKMeans
 import os
 
+from storage import AVAILABILITY, CHUNK_ROWS, SCHEMAS, iter_chunks, load
+
 OUTPUT_DIR = "data/plots"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# 1. Load datasets
-workers = pd.read_csv("data/workers.csv")
-assignments = pd.read_csv("data/assignments.csv")
-
-print("✅ Workers loaded:", workers.shape)
-print("✅ Assignments loaded:", assignments.shape)
-
-# 2. Basic statistics
-print("\n--- Gender distribution ---")
-print(workers["Gender"].value_counts(normalize=True) * 100)
-
-# Count skills (split by comma)
-all_skills = []
-for skills in workers["Skills"]:
-    all_skills.extend(skills.split(","))
-skills_series = pd.Series(all_skills)
-
-print("\n--- Top Skills ---")
-print(skills_series.value_counts())
-
-# Availability summary
-availability_cols = [col for col in workers.columns if "Available_" in col]
-availability_summary = workers[availability_cols].mean() * 100
-print("\n--- Availability by day (%) ---")
-print(availability_summary)
-
-# 3. Clustering by location
-coords = workers[["Latitude", "Longitude"]]
-kmeans = KMeans(n_clusters=4, random_state=42, n_init=10)
-workers["Cluster"] = kmeans.fit_predict(coords)
-
-# Save workers with cluster assignment
-workers.to_csv("data/workers_clustered.csv", index=False)
-print("✅ workers_clustered.csv saved")
-
-# 4. Plot clusters
-plt.figure(figsize=(8, 6))
-for cluster_id in workers["Cluster"].unique():
-    cluster_data = workers[workers["Cluster"] == cluster_id]
-    plt.scatter(cluster_data["Longitude"], cluster_data["Latitude"], label=f"Cluster {cluster_id}", alpha=0.6)
-
-plt.xlabel("Longitude")
-plt.ylabel("Latitude")
-plt.title("Workers Clusters (KMeans)")
-plt.legend()
-plt.grid(True)
-plt.savefig(f"{OUTPUT_DIR}/workers_clusters.png")
-print(f"✅ Cluster plot saved at {OUTPUT_DIR}/workers_clusters.png")
+CLUSTERED_FILE = "data/workers_clustered.csv"
+SUMMARY_FILE = "data/workers_summary.json"
+
+# PARAMETERS
+N_CLUSTERS = 4
+PLOT_POINTS = 50_000   # workers drawn in the cluster plot (chunked mode samples down to this)
+
+
+# ========== SUMMARY STATISTICS (MERGEABLE) ==========
+def worker_summary(workers):
+    """Partial counts of a batch of workers; merge_summaries() adds up summaries of any batches."""
+    # Split each distinct skill combination once, weighted by how many workers have it
+    combos = workers["Skills"].astype(str).value_counts()
+    skills = combos.index.to_series().str.get_dummies(sep=",").mul(combos, axis=0).sum()
+    return {
+        "Rows": int(len(workers)),
+        "Gender": {str(k): int(v) for k, v in workers["Gender"].astype(str).value_counts().items()},
+        "Skills": {str(k): int(v) for k, v in skills.items()},
+        "Available": {col: int(workers[col].sum()) for col in AVAILABILITY},
+    }
+
+
+def merge_summaries(summaries):
+    merged = {"Rows": 0, "Gender": Counter(), "Skills": Counter(), "Available": Counter()}
+    for summary in summaries:
+        merged["Rows"] += summary["Rows"]
+        for key in ("Gender", "Skills", "Available"):
+            merged[key].update(summary[key])
+    return {"Rows": merged["Rows"], **{key: dict(merged[key]) for key in ("Gender", "Skills", "Available")}}
+
+
+def print_summary(summary):
+    print("\n--- Gender distribution ---")
+    print(pd.Series(summary["Gender"], dtype=float).sort_values(ascending=False) / summary["Rows"] * 100)
+
+    print("\n--- Top Skills ---")
+    print(pd.Series(summary["Skills"], dtype=int).sort_values(ascending=False))
+
+    print("\n--- Availability by day (%) ---")
+    print(pd.Series(summary["Available"], dtype=float) / summary["Rows"] * 100)
+
+
+def save_summary(summary, path=SUMMARY_FILE):
+    with open(path, "w") as f:
+        json.dump(summary, f, indent=2)
+    print(f"✅ Summary saved to {path}")
+
+
+def plot_clusters(workers, path=f"{OUTPUT_DIR}/workers_clusters.png"):
+    """One scatter call for all clusters, colored by label."""
+    plt.figure(figsize=(8, 6))
+    points = plt.scatter(workers["Longitude"], workers["Latitude"], c=workers["Cluster"], cmap="tab10",
+                         vmin=0, vmax=9, s=10, alpha=0.6)
+    handles, _ = points.legend_elements()
+    labels = sorted(workers["Cluster"].unique())
+    plt.legend(handles, [f"Cluster {c}" for c in labels], loc="upper right")
+    plt.xlabel("Longitude")
+    plt.ylabel("Latitude")
+    plt.title("Workers Clusters (KMeans)")
+    plt.grid(True)
+    plt.savefig(path)
+    print(f"✅ Cluster plot saved at {path}")
+
+
+# ========== FULL (IN-MEMORY) ==========
+def eda_full():
+    # 1. Load datasets
+    workers = load("workers", columns=list(SCHEMAS["workers"]))
+    assignments = load("assignments", columns=["AssignmentID"])
+
+    print("✅ Workers loaded:", workers.shape)
+    print("✅ Assignments loaded:", assignments.shape)
+
+    # 2. Basic statistics
+    summary = worker_summary(workers)
+    print_summary(summary)
+    save_summary(summary)
+
+    # 3. Clustering by location
+    coords = workers[["Latitude", "Longitude"]]
+    kmeans = KMeans(n_clusters=N_CLUSTERS, random_state=42, n_init=10)
+    workers["Cluster"] = kmeans.fit_predict(coords)
+
+    # Save workers with cluster assignment
+    workers.to_csv(CLUSTERED_FILE, index=False)
+    print("✅ workers_clustered.csv saved")
+
+    # 4. Plot clusters
+    plot_clusters(workers)
+
+
+# ========== CHUNKED (STREAMING) ==========
+def eda_chunked(chunk_rows=CHUNK_ROWS, seed=42):
+    """Two passes over workers in chunks, never holding the whole table.
+
+    Pass 1 accumulates the summary and fits MiniBatchKMeans; pass 2 labels each
+    chunk, appends it to workers_clustered.csv and keeps a sample to plot.
+    """
+    columns = list(SCHEMAS["workers"])
+    kmeans = MiniBatchKMeans(n_clusters=N_CLUSTERS, random_state=seed, n_init=3, batch_size=4096)
+    summaries = []
+    pending = []   # partial_fit needs at least N_CLUSTERS rows in its first batch
+    for chunk in iter_chunks("workers", columns, chunk_rows):
+        summaries.append(worker_summary(chunk))
+        pending.append(chunk[["Latitude", "Longitude"]].to_numpy())
+        if sum(len(p) for p in pending) >= N_CLUSTERS:
+            kmeans.partial_fit(np.vstack(pending))
+            pending = []
+    if pending and hasattr(kmeans, "cluster_centers_"):
+        kmeans.partial_fit(np.vstack(pending))
+    summary = merge_summaries(summaries)
+    n_assignments = sum(len(chunk) for chunk in iter_chunks("assignments", ["AssignmentID"], chunk_rows))
+
+    print("✅ Workers streamed:", (summary["Rows"], len(columns)))
+    print("✅ Assignments streamed:", (n_assignments, 1))
+    print_summary(summary)
+    save_summary(summary)
+
+    rng = np.random.default_rng(seed)
+    keep = min(1.0, PLOT_POINTS / max(summary["Rows"], 1))
+    sample = []
+    if os.path.exists(CLUSTERED_FILE):
+        os.remove(CLUSTERED_FILE)
+    for chunk in iter_chunks("workers", columns, chunk_rows):
+        chunk["Cluster"] = kmeans.predict(chunk[["Latitude", "Longitude"]].to_numpy()).astype(np.int16)
+        chunk.to_csv(CLUSTERED_FILE, mode="a", header=not os.path.exists(CLUSTERED_FILE), index=False)
+        sample.append(chunk.loc[rng.random(len(chunk)) < keep, ["Latitude", "Longitude", "Cluster"]])
+    print("✅ workers_clustered.csv saved")
+
+    plot_clusters(pd.concat(sample, ignore_index=True))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Exploratory analysis and location clustering of workers.")
+    parser.add_argument("--chunked", action="store_true",
+                        help="Stream workers in chunks with MiniBatchKMeans instead of loading them at once")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Workers per chunk (chunked mode)")
+    parser.add_argument("--merge-summaries", nargs="+", metavar="JSON",
+                        help="Only combine saved summaries (e.g. of shards) and print the result")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    if args.merge_summaries:
+        summaries = []
+        for path in args.merge_summaries:
+            with open(path) as f:
+                summaries.append(json.load(f))
+        summary = merge_summaries(summaries)
+        print(f"✅ {len(summaries)} summaries merged: {summary['Rows']} workers")
+        print_summary(summary)
+        save_summary(summary)
+    elif args.chunked:
+        eda_chunked(args.chunk_rows)
+    else:
+        eda_full()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,14 @@
 # ml/generate_all.py
 
+import argparse
+import multiprocessing
 import os
+import shutil
 import pandas as pd
 import numpy as np
 from faker import Faker
-import random
+
+from storage import AVAILABILITY, DAYS, SKILL_POOL, ZONES, load
 
 fake = Faker()
 
@@ -16,84 +20,103 @@ NUM_WEEKS = 2
 WORKERS_PER_SHIFT = (5, 15)
 ABSENCE_RATE = 0.1
 
-# Amsterdam clusters
-CITY_CENTERS = [
-    (52.3728, 4.8936),  # Centrum
-    (52.3400, 4.8885),  # Zuid
-    (52.4000, 4.9166),  # Noord
-    (52.3870, 4.8357),  # Sloterdijk
-]
+# Amsterdam clusters: the zone centers in storage.ZONES
+CITY_CENTERS = list(ZONES.values())
 
-SKILL_POOL = ["Welding", "Assembly", "Packaging", "Logistics", "Admin", "QA", "Forklift"]
 WORKPLACE_TYPES = ["Factory", "Office", "Warehouse", "Construction"]
 SHIFTS = {
     "Morning": ("06:00", "14:00"),
     "Evening": ("14:00", "22:00"),
     "Night": ("22:00", "06:00")
 }
-DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
 
 OUTPUT_DIR = "data"
 
 
+# ========== NAME POOLS ==========
+NAME_POOL_SIZE = 2000   # names are drawn from a pool instead of one Faker call per row
+
+
+def name_pools(seed=None, size=NAME_POOL_SIZE):
+    fake.seed_instance(seed)
+    return {
+        "Male": np.array([fake.name_male() for _ in range(size)], dtype=object),
+        "Female": np.array([fake.name_female() for _ in range(size)], dtype=object),
+        "Any": np.array([fake.name() for _ in range(size)], dtype=object),
+        "Company": np.array([fake.company() for _ in range(size)], dtype=object),
+    }
+
+
+def make_ids(prefix, index, width):
+    return np.array([f"{prefix}{i:0{width}d}" for i in index], dtype=object)
+
+
+def around_city_centers(rng, n):
+    """n (lat, lon) points, each scattered around a random city center."""
+    centers = np.array(CITY_CENTERS)[rng.integers(len(CITY_CENTERS), size=n)]
+    return np.round(centers + rng.normal(0, 0.01, size=(n, 2)), 6)
+
+
+# Every ordered choice of 2-3 distinct skills, encoded as a*64 + b*8 + c (c == 7 when only two)
+SKILL_STRINGS = np.array([
+    ",".join(SKILL_POOL[i] for i in (a, b, c) if i < len(SKILL_POOL)) if len({a, b, c}) == 3 else ""
+    for a in range(8) for b in range(8) for c in range(8)
+], dtype=object)
+
+
+def random_skills(rng, n):
+    order = np.argsort(rng.random((n, len(SKILL_POOL))), axis=1)[:, :3]
+    third = np.where(rng.integers(2, 4, size=n) == 3, order[:, 2], len(SKILL_POOL))
+    return SKILL_STRINGS[order[:, 0] * 64 + order[:, 1] * 8 + third]
+
+
 # ========== WORKERS ==========
-def generate_workers(n=NUM_WORKERS):
-    def gen_worker(i):
-        gender = random.choice(["Male", "Female"])
-        name = fake.name_male() if gender == "Male" else fake.name_female()
-        base_lat, base_lon = random.choice(CITY_CENTERS)
-        lat = base_lat + np.random.normal(0, 0.01)
-        lon = base_lon + np.random.normal(0, 0.01)
-        skills = random.sample(SKILL_POOL, k=random.randint(2, 3))
-        availability = [random.choice([0, 1]) for _ in range(7)]
-        return {
-            "WorkerID": f"W{i:04d}",
-            "Name": name,
-            "Gender": gender,
-            "Latitude": round(lat, 6),
-            "Longitude": round(lon, 6),
-            "Skills": ",".join(skills),
-            "Available_Mon": availability[0],
-            "Available_Tue": availability[1],
-            "Available_Wed": availability[2],
-            "Available_Thu": availability[3],
-            "Available_Fri": availability[4],
-            "Available_Sat": availability[5],
-            "Available_Sun": availability[6],
-        }
-
-    return pd.DataFrame([gen_worker(i) for i in range(n)])
+def generate_workers(n=NUM_WORKERS, rng=None, names=None, start=0):
+    rng = rng if rng is not None else np.random.default_rng()
+    names = names if names is not None else name_pools()
+    male = rng.integers(2, size=n) == 0
+    name_index = rng.integers(NAME_POOL_SIZE, size=n)
+    coords = around_city_centers(rng, n)
+    availability = rng.integers(2, size=(n, len(DAYS)), dtype=np.int8)
 
+    workers = pd.DataFrame({
+        "WorkerID": make_ids("W", range(start, start + n), 4),
+        "Name": np.where(male, names["Male"][name_index], names["Female"][name_index]),
+        "Gender": np.where(male, "Male", "Female"),
+        "Latitude": coords[:, 0],
+        "Longitude": coords[:, 1],
+        "Skills": random_skills(rng, n),
+    })
+    for i, day in enumerate(DAYS):
+        workers[f"Available_{day}"] = availability[:, i]
+    return workers
 
-# ========== DRIVERS ==========
-def generate_drivers(n=NUM_DRIVERS):
-    def gen_driver(i):
-        return {
-            "DriverID": f"D{i:03d}",
-            "Name": fake.name(),
-            "VehicleCapacity": random.randint(4, 15),
-            "MaxHoursPerDay": random.randint(6, 10),
-            "PreferredZone": random.choice(["Centrum", "Zuid", "Noord", "Sloterdijk"])
-        }
 
-    return pd.DataFrame([gen_driver(i) for i in range(n)])
+# ========== DRIVERS ==========
+def generate_drivers(n=NUM_DRIVERS, rng=None, names=None, start=0):
+    rng = rng if rng is not None else np.random.default_rng()
+    names = names if names is not None else name_pools()
+    return pd.DataFrame({
+        "DriverID": make_ids("D", range(start, start + n), 3),
+        "Name": names["Any"][rng.integers(NAME_POOL_SIZE, size=n)],
+        "VehicleCapacity": rng.integers(4, 16, size=n),
+        "MaxHoursPerDay": rng.integers(6, 11, size=n),
+        "PreferredZone": np.array(list(ZONES))[rng.integers(len(ZONES), size=n)],
+    })
 
 
 # ========== WORKPLACES ==========
-def generate_workplaces(n=NUM_WORKPLACES):
-    def gen_workplace(i):
-        base_lat, base_lon = random.choice(CITY_CENTERS)
-        lat = base_lat + np.random.normal(0, 0.01)
-        lon = base_lon + np.random.normal(0, 0.01)
-        return {
-            "WorkplaceID": f"WP{i:03d}",
-            "Name": fake.company(),
-            "Type": random.choice(WORKPLACE_TYPES),
-            "Latitude": round(lat, 6),
-            "Longitude": round(lon, 6)
-        }
-
-    return pd.DataFrame([gen_workplace(i) for i in range(n)])
+def generate_workplaces(n=NUM_WORKPLACES, rng=None, names=None, start=0):
+    rng = rng if rng is not None else np.random.default_rng()
+    names = names if names is not None else name_pools()
+    coords = around_city_centers(rng, n)
+    return pd.DataFrame({
+        "WorkplaceID": make_ids("WP", range(start, start + n), 3),
+        "Name": names["Company"][rng.integers(NAME_POOL_SIZE, size=n)],
+        "Type": np.array(WORKPLACE_TYPES)[rng.integers(len(WORKPLACE_TYPES), size=n)],
+        "Latitude": coords[:, 0],
+        "Longitude": coords[:, 1],
+    })
 
 
 # ========== SHIFTS ==========
@@ -116,55 +139,222 @@ def generate_shifts(num_weeks=NUM_WEEKS):
 
 
 # ========== ASSIGNMENTS ==========
-def generate_assignments(workers, drivers, workplaces, shifts):
-    rows = []
-    assignment_id = 1
-
-    for _, shift in shifts.iterrows():
-        workplace = workplaces.sample(1).iloc[0]
-        n_workers = random.randint(*WORKERS_PER_SHIFT)
-        selected_workers = workers.sample(n_workers)
-        driver = drivers.sample(1).iloc[0]
-
-        for _, worker in selected_workers.iterrows():
-            status = "Assigned"
-            if random.random() < ABSENCE_RATE:
-                status = "Absent"
-            rows.append({
-                "AssignmentID": f"A{assignment_id:05d}",
-                "WorkerID": worker["WorkerID"],
-                "DriverID": driver["DriverID"],
-                "WorkplaceID": workplace["WorkplaceID"],
-                "ShiftID": shift["ShiftID"],
-                "Status": status
-            })
-            assignment_id += 1
+def distinct_picks(rng, pool_sizes, counts):
+    """For every group g, counts[g] distinct ints in [0, pool_sizes[g]), drawn for all groups at once.
 
-    return pd.DataFrame(rows)
+    Draws with replacement and redraws only the duplicates until none are left,
+    so the cost stays linear in the number of picks. Requires counts <= pool_sizes.
+    """
+    group = np.repeat(np.arange(len(counts)), counts)
+    picks = np.floor(rng.random(len(group)) * pool_sizes[group]).astype(np.int64)
+    stride = int(np.max(pool_sizes, initial=0)) + 1
+    while len(group):
+        keys = group * stride + picks
+        order = np.argsort(keys, kind="stable")
+        dup = np.zeros(len(group), dtype=bool)
+        dup[order[1:]] = keys[order[1:]] == keys[order[:-1]]
+        if not dup.any():
+            break
+        picks[dup] = np.floor(rng.random(dup.sum()) * pool_sizes[group[dup]]).astype(np.int64)
+    return group, picks
+
+
+def draw_assignments(rng, available, capacities, n_workplaces, shift_days,
+                     workers_per_shift=WORKERS_PER_SHIFT, absence_rate=ABSENCE_RATE):
+    """Assignments for every shift in bulk, as index arrays.
+
+    available: (workers x 7) availability flags, capacities: VehicleCapacity per
+    driver, shift_days: day index (0 = Mon) per shift. Each shift gets one
+    workplace and a set of distinct workers available on its day, split over as
+    many distinct drivers as their capacities require.
+    Returns (shift, worker, driver, workplace, absent) arrays, one entry per row.
+    """
+    available = np.asarray(available, dtype=bool)
+    capacities = np.asarray(capacities)
+    n_shifts = len(shift_days)
+
+    # Workers: one pool of available workers per day, concatenated
+    pools = [np.flatnonzero(available[:, day]) for day in range(len(DAYS))]
+    pool_offsets = np.concatenate([[0], np.cumsum([len(pool) for pool in pools])[:-1]])
+    pool_sizes = np.array([len(pool) for pool in pools])[shift_days]
+
+    # Drivers: enough distinct drivers per shift to carry the largest possible group
+    n_vehicles = min(len(capacities), -(-workers_per_shift[1] // max(int(capacities.min()), 1)))
+    _, vehicles = distinct_picks(rng, np.full(n_shifts, len(capacities)), np.full(n_shifts, n_vehicles))
+    vehicles = vehicles.reshape(n_shifts, n_vehicles)
+    seats = np.cumsum(capacities[vehicles], axis=1)   # seats filled after each extra vehicle
+
+    sizes = rng.integers(workers_per_shift[0], workers_per_shift[1] + 1, size=n_shifts)
+    sizes = np.minimum(sizes, np.minimum(pool_sizes, seats[:, -1]))
+    shift, picks = distinct_picks(rng, pool_sizes, sizes)
+    worker = np.concatenate(pools)[pool_offsets[shift_days[shift]] + picks]
+
+    # i-th worker of a shift rides in the first vehicle whose cumulative seats exceed i;
+    # offsetting every shift's row makes this one searchsorted over all shifts
+    position = np.arange(len(shift)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    stride = int(seats[:, -1].max()) + 1
+    row_offset = np.arange(n_shifts)[:, None] * stride
+    slot = np.searchsorted((seats + row_offset).ravel(), position + shift * stride, side="right") - shift * n_vehicles
+    driver = vehicles[shift, slot]
+
+    workplace = rng.integers(n_workplaces, size=n_shifts)[shift]
+    absent = rng.random(len(shift)) < absence_rate
+    return shift, worker, driver, workplace, absent
+
+
+def shift_day_index(shifts):
+    return pd.Index(DAYS).get_indexer(shifts["Day"])
+
+
+def generate_assignments(workers, drivers, workplaces, shifts, rng=None, first_id=1, **params):
+    rng = rng if rng is not None else np.random.default_rng()
+    availability = workers[[f"Available_{day}" for day in DAYS]].to_numpy()
+    shift, worker, driver, workplace, absent = draw_assignments(
+        rng, availability, drivers["VehicleCapacity"].to_numpy(), len(workplaces), shift_day_index(shifts), **params)
+    return pd.DataFrame({
+        "AssignmentID": make_ids("A", range(first_id, first_id + len(shift)), 5),
+        "WorkerID": workers["WorkerID"].to_numpy()[worker],
+        "DriverID": drivers["DriverID"].to_numpy()[driver],
+        "WorkplaceID": workplaces["WorkplaceID"].to_numpy()[workplace],
+        "ShiftID": shifts["ShiftID"].to_numpy()[shift],
+        "Status": np.where(absent, "Absent", "Assigned"),
+    })
+
+
+# ========== SHARDED GENERATION ==========
+# Shards have a fixed size and each one draws from its own stream derived from the
+# master seed, so the output does not depend on how many processes produce it.
+SHARD_SIZE = 100_000
+SHARD_DIR = f"{OUTPUT_DIR}/.shards"
+AVAILABILITY_FILE = f"{SHARD_DIR}/availability.npy"   # (workers x 7) bool, filled by the worker shards
+TABLES = {
+    "workers": (generate_workers, 0),
+    "drivers": (generate_drivers, 1),
+    "workplaces": (generate_workplaces, 2),
+}
+ASSIGNMENTS_STREAM = 3
+
+
+def shard_rng(entropy, stream, shard):
+    return np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(stream, shard)))
+
+
+def write_table_shard(task):
+    name, entropy, shard, start, n, names = task
+    generate, stream = TABLES[name]
+    path = f"{SHARD_DIR}/{name}.{shard:06d}.csv"
+    table = generate(n, shard_rng(entropy, stream, shard), names, start=start)
+    table.to_csv(path, index=False, header=shard == 0)
+    if name == "workers":
+        # The week tasks map this file instead of re-reading workers.csv or being sent a copy
+        availability = np.load(AVAILABILITY_FILE, mmap_mode="r+")
+        availability[start:start + n] = table[list(AVAILABILITY)].to_numpy(dtype=bool)
+        availability.flush()
+    return path
+
+
+def generate_assignment_week(task):
+    """One week of assignments; IDs are rebuilt from indices so the entity tables are not needed."""
+    entropy, week, week_shifts, availability_file, capacities, n_workplaces = task
+    rng = shard_rng(entropy, ASSIGNMENTS_STREAM, week)
+    shift, worker, driver, workplace, absent = draw_assignments(
+        rng, np.load(availability_file, mmap_mode="r"), capacities, n_workplaces, shift_day_index(week_shifts))
+    return pd.DataFrame({
+        "WorkerID": make_ids("W", worker, 4),
+        "DriverID": make_ids("D", driver, 3),
+        "WorkplaceID": make_ids("WP", workplace, 3),
+        "ShiftID": week_shifts["ShiftID"].to_numpy()[shift],
+        "Status": np.where(absent, "Absent", "Assigned"),
+    })
+
+
+def generate_sharded(args):
+    """Generate every dataset across a process pool, streaming shards to disk as they finish."""
+    entropy = args.seed if args.seed is not None else np.random.SeedSequence().entropy
+    names = name_pools(args.seed)
+    os.makedirs(SHARD_DIR, exist_ok=True)
+    sizes = {"workers": args.workers, "drivers": args.drivers, "workplaces": args.workplaces}
+    np.lib.format.open_memmap(AVAILABILITY_FILE, mode="w+", dtype=bool, shape=(args.workers, len(DAYS))).flush()
+
+    with multiprocessing.Pool(args.processes) as pool:
+        for name, n in sizes.items():
+            tasks = [(name, entropy, shard, start, min(args.shard_size, n - start), names)
+                     for shard, start in enumerate(range(0, n, args.shard_size))]
+            with open(f"{OUTPUT_DIR}/{name}.csv", "wb") as out:
+                for path in pool.imap(write_table_shard, tasks):
+                    with open(path, "rb") as f:
+                        shutil.copyfileobj(f, out)
+                    os.remove(path)
+            print(f"✅ {name}.csv generated ({len(tasks)} shards)")
+
+        shifts = generate_shifts(args.weeks)
+        shifts.to_csv(f"{OUTPUT_DIR}/shifts.csv", index=False)
+        print("✅ shifts.csv generated")
+
+        capacities = load("drivers", columns=["VehicleCapacity"])["VehicleCapacity"].to_numpy()
+        tasks = [(entropy, week, group, AVAILABILITY_FILE, capacities, args.workplaces)
+                 for week, group in shifts.groupby("Week")]
+        next_id = 1
+        with open(f"{OUTPUT_DIR}/assignments.csv", "w", newline="") as out:
+            for week in pool.imap(generate_assignment_week, tasks):
+                # IDs are numbered here, in week order, so they stay sequential
+                week.insert(0, "AssignmentID", make_ids("A", range(next_id, next_id + len(week)), 5))
+                week.to_csv(out, index=False, header=next_id == 1)
+                next_id += len(week)
+        print(f"✅ assignments.csv generated ({len(tasks)} weekly shards)")
+
+    shutil.rmtree(SHARD_DIR, ignore_errors=True)
 
 
 # ========== MAIN ==========
-if __name__ == "__main__":
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate every synthetic dataset in one run.")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for a reproducible dataset")
+    parser.add_argument("--workers", type=int, default=NUM_WORKERS)
+    parser.add_argument("--drivers", type=int, default=NUM_DRIVERS)
+    parser.add_argument("--workplaces", type=int, default=NUM_WORKPLACES)
+    parser.add_argument("--weeks", type=int, default=NUM_WEEKS)
+    parser.add_argument("--sharded", action="store_true",
+                        help="Generate in fixed-size shards across a process pool, streaming them to disk")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Pool size for --sharded")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Rows per shard for --sharded")
+    return parser.parse_args(argv)
+
 
-    workers = generate_workers()
+def generate_in_memory(args):
+    rng = np.random.default_rng(args.seed)
+    names = name_pools(args.seed)
+
+    workers = generate_workers(args.workers, rng, names)
     workers.to_csv(f"{OUTPUT_DIR}/workers.csv", index=False)
     print("✅ workers.csv generated")
 
-    drivers = generate_drivers()
+    drivers = generate_drivers(args.drivers, rng, names)
     drivers.to_csv(f"{OUTPUT_DIR}/drivers.csv", index=False)
     print("✅ drivers.csv generated")
 
-    workplaces = generate_workplaces()
+    workplaces = generate_workplaces(args.workplaces, rng, names)
     workplaces.to_csv(f"{OUTPUT_DIR}/workplaces.csv", index=False)
     print("✅ workplaces.csv generated")
 
-    shifts = generate_shifts()
+    shifts = generate_shifts(args.weeks)
     shifts.to_csv(f"{OUTPUT_DIR}/shifts.csv", index=False)
     print("✅ shifts.csv generated")
 
-    assignments = generate_assignments(workers, drivers, workplaces, shifts)
+    assignments = generate_assignments(workers, drivers, workplaces, shifts, rng)
     assignments.to_csv(f"{OUTPUT_DIR}/assignments.csv", index=False)
     print("✅ assignments.csv generated")
 
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    if args.sharded:
+        generate_sharded(args)
+    else:
+        generate_in_memory(args)
     print("🎉 All datasets generated in ./data/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+# ml/npy_cache.py
+
+import hashlib
+import os
+
+import numpy as np
+
+# PARAMETERS
+CACHE_DIR = "data/cache"
+
+
+def cache_key(*arrays, **params):
+    """Hash of the input arrays (and parameters) identifying a result on disk."""
+    digest = hashlib.sha1()
+    for arr in arrays:
+        digest.update(np.ascontiguousarray(arr, dtype=np.float64).tobytes())
+        digest.update(b"|")
+    digest.update(repr(sorted(params.items())).encode())
+    return digest.hexdigest()[:16]
+
+
+def cached(name, compute, *arrays, outputs=1, cache_dir=CACHE_DIR, **params):
+    """Return compute(*arrays, **params), reusing a memory-mapped copy from disk when available.
+
+    `compute` returns `outputs` arrays; each is stored as its own .npy file so
+    it can be reloaded with mmap_mode="r" instead of read into memory.
+    """
+    prefix = os.path.join(cache_dir, f"{name}-{cache_key(*arrays, **params)}")
+    paths = [f"{prefix}.{i}.npy" for i in range(outputs)]
+    if not all(os.path.exists(path) for path in paths):
+        os.makedirs(cache_dir, exist_ok=True)
+        result = compute(*arrays, **params)
+        for path, arr in zip(paths, result if outputs > 1 else (result,)):
+            tmp = f"{path}.tmp.npy"
+            np.save(tmp, arr)
+            os.replace(tmp, path)   # never leave a half-written file under the final name
+    loaded = tuple(np.load(path, mmap_mode="r") for path in paths)
+    return loaded if outputs > 1 else loaded[0]
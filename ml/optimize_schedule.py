@@ -1,115 +1,1077 @@
 # ml/optimize_schedule.py
 
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
 import pandas as pd
 import numpy as np
-import os
+from ortools.graph.python import min_cost_flow
 from ortools.sat.python import cp_model
 
+from storage import AVAILABILITY, DAYS, load
+from npy_cache import CACHE_DIR
+from distances import worker_workplace_distances
+from candidates import K_NEAREST, MAX_DISTANCE, all_candidates, build_candidates, print_report
+from spatial import drivers_by_zone, zone_codes
+
 OUTPUT_DIR = "data"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+RESULT_FILE = f"{OUTPUT_DIR}/optimized_assignments.csv"
+STATE_FILE = f"{OUTPUT_DIR}/optimized_assignments_state.json"   # per-shift input fingerprints of that result
+TIMINGS_FILE = f"{OUTPUT_DIR}/optimize_timings.json"   # seconds per phase of the last run, and the model size
+
+# PARAMETERS
+TIME_LIMIT_SECONDS = 15
+DISTANCE_SCALE = 1000   # km → m, CP-SAT only accepts integer coefficients
+COMPARE_SAMPLE = (50, 10, 5, 5)   # workers, drivers, workplaces, shifts
+
+# Work rules (--work-rules)
+MIN_REST_HOURS = 11            # between the end of a worker's shift and the start of their next one
+MAX_CONSECUTIVE_DAYS = 6       # worked days in a row per worker
+DRIVER_HOURS_PER_SHIFT = 3     # one pickup run, counted against MaxHoursPerDay
+MAX_DRIVER_HOURS_PER_WEEK = 40
+MAX_RULE_ROUNDS = 50           # flow re-solves dropping rule-breaking assignments before giving up
+CPSAT_RULES_MAX_PAIRS = 10_000  # worker x driver pairs up to which auto solves the rules exactly with CP-SAT
+
 
 # 1. Load datasets
-workers = pd.read_csv("data/workers.csv")
-drivers = pd.read_csv("data/drivers.csv")
-workplaces = pd.read_csv("data/workplaces.csv")
-shifts = pd.read_csv("data/shifts.csv")
-
-print("✅ Data loaded")
-
-# Small sample for prototype (to keep solver light)
-workers = workers.sample(50, random_state=42).reset_index(drop=True)
-drivers = drivers.sample(10, random_state=42).reset_index(drop=True)
-workplaces = workplaces.sample(5, random_state=42).reset_index(drop=True)
-shifts = shifts.sample(5, random_state=42).reset_index(drop=True)
-
-
-print(f"Using {len(workers)} workers, {len(drivers)} drivers, {len(workplaces)} workplaces, {len(shifts)} shifts")
-
-# 2. Distance function (approximate)
-def distance(lat1, lon1, lat2, lon2):
-    return np.sqrt((lat1 - lat2) ** 2 + (lon1 - lon2) ** 2)
-
-# Precompute distances worker → workplace
-dist_matrix = {}
-for i, w in workers.iterrows():
-    for j, wp in workplaces.iterrows():
-        dist_matrix[(i, j)] = distance(w["Latitude"], w["Longitude"], wp["Latitude"], wp["Longitude"])
-
-# 3. Optimization model
-model = cp_model.CpModel()
-
-# Variables: assign worker i to workplace j in shift s with driver d
-assign = {}
-for wi in range(len(workers)):
-    for di in range(len(drivers)):
-        for wpi in range(len(workplaces)):
-            for si in range(len(shifts)):
-                assign[(wi, di, wpi, si)] = model.NewBoolVar(f"assign_w{wi}_d{di}_wp{wpi}_s{si}")
-
-# 4. Constraints
-
-# Each worker can only be assigned once per shift
-for wi in range(len(workers)):
-    for si in range(len(shifts)):
-        model.Add(sum(assign[(wi, di, wpi, si)] for di in range(len(drivers)) for wpi in range(len(workplaces))) <= 1)
-
-# Driver capacity respected per shift
-for di, driver in drivers.iterrows():
-    for si in range(len(shifts)):
-        model.Add(sum(assign[(wi, di, wpi, si)] for wi in range(len(workers)) for wpi in range(len(workplaces)))
-                  <= driver["VehicleCapacity"])
-
-# Cada shift debe tener al menos un worker asignado
-for si in range(len(shifts)):
-    model.Add(sum(assign[(wi, di, wpi, si)] 
-                  for wi in range(len(workers)) 
-                  for di in range(len(drivers)) 
-                  for wpi in range(len(workplaces))) >= 1)
-
-# Cada driver debe llevar al menos un trabajador en total (para que no queden todos vacíos)
-for di in range(len(drivers)):
-    model.Add(sum(assign[(wi, di, wpi, si)] 
-                  for wi in range(len(workers)) 
-                  for wpi in range(len(workplaces)) 
-                  for si in range(len(shifts))) >= 1)
-    
-# 5. Objective: minimize total distance
-objective_terms = []
-for wi, worker in workers.iterrows():
-    for di in range(len(drivers)):
-        for wpi, wp in workplaces.iterrows():
-            for si in range(len(shifts)):
-                objective_terms.append(assign[(wi, di, wpi, si)] * int(dist_matrix[(wi, wpi)] * 1000))
-
-model.Minimize(sum(objective_terms))
-
-# 6. Solve
-solver = cp_model.CpSolver()
-solver.parameters.max_time_in_seconds = 15
-status = solver.Solve(model)
-
-# 7. Collect results
-rows = []
-if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
-    for wi, worker in workers.iterrows():
-        for di, driver in drivers.iterrows():
-            for wpi, wp in workplaces.iterrows():
-                for si, shift in shifts.iterrows():
-                    if solver.Value(assign[(wi, di, wpi, si)]) == 1:
-                        rows.append({
-                            "WorkerID": worker["WorkerID"],
-                            "DriverID": driver["DriverID"],
-                            "WorkplaceID": wp["WorkplaceID"],
-                            "ShiftID": shift["ShiftID"],
-                            "Distance": round(dist_matrix[(wi, wpi)], 4)
-                        })
-
-    if rows:
-        df_result = pd.DataFrame(rows)
-        df_result.to_csv(f"{OUTPUT_DIR}/optimized_assignments.csv", index=False)
-        print(f"✅ Optimized assignments saved to {OUTPUT_DIR}/optimized_assignments.csv with {len(df_result)} rows")
+def load_data():
+    workers = load("workers", columns=["WorkerID", "Latitude", "Longitude", "SkillMask", *AVAILABILITY])
+    drivers = load("drivers", columns=["DriverID", "VehicleCapacity", "MaxHoursPerDay", "PreferredZone"])
+    workplaces = load("workplaces", columns=["WorkplaceID", "Type", "Latitude", "Longitude"])
+    shifts = load("shifts", columns=["ShiftID", "Week", "Day", "ShiftType", "StartTime", "EndTime"])
+    print("✅ Data loaded")
+    return workers, drivers, workplaces, shifts
+
+
+def load_absences():
+    """(WorkerID, ShiftID) pairs marked Absent in assignments.csv, if it exists."""
+    if not os.path.exists("data/assignments.csv"):
+        return None
+    assignments = load("assignments", columns=["WorkerID", "ShiftID", "Status"])
+    return assignments.loc[assignments["Status"] == "Absent", ["WorkerID", "ShiftID"]]
+
+
+def load_previous():
+    """Last optimized assignments and the per-shift fingerprints they were computed from."""
+    if not os.path.exists(RESULT_FILE):
+        print("⚠️ No previous optimized assignments, solving from scratch.")
+        return None, {}
+    previous = load("optimized_assignments")
+    state = {}
+    if os.path.exists(STATE_FILE):
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+    return previous, state
+
+
+def sample_instance(workers, drivers, workplaces, shifts, sizes=COMPARE_SAMPLE, seed=42):
+    """Same random subset for every formulation, so their numbers are comparable."""
+    n_workers, n_drivers, n_workplaces, n_shifts = sizes
+    return (
+        workers.sample(min(n_workers, len(workers)), random_state=seed).reset_index(drop=True),
+        drivers.sample(min(n_drivers, len(drivers)), random_state=seed).reset_index(drop=True),
+        workplaces.sample(min(n_workplaces, len(workplaces)), random_state=seed).reset_index(drop=True),
+        shifts.sample(min(n_shifts, len(shifts)), random_state=seed).reset_index(drop=True),
+    )
+
+
+# 2. Candidates
+def select_candidates(workers, workplaces, shifts, prune=True, k_nearest=K_NEAREST, max_distance=MAX_DISTANCE,
+                      absences=None, verbose=True, cache_dir=CACHE_DIR):
+    if not prune:
+        return all_candidates(len(workers), len(workplaces), len(shifts))
+    candidates, report = build_candidates(workers, workplaces, shifts, k_nearest, max_distance,
+                                          absences=absences, cache_dir=cache_dir)
+    if verbose:
+        print_report(report)
+    empty_shifts = sorted(set(range(len(shifts))) - set(candidates["shift"].unique()))
+    if empty_shifts:
+        print(f"⚠️ No candidate worker for shifts {shifts.loc[empty_shifts, 'ShiftID'].tolist()}")
+    return candidates
+
+
+def zone_drivers(workers, drivers):
+    """Per worker, the drivers whose PreferredZone is the worker's zone (all drivers if that zone has none)."""
+    by_zone = [zone.tolist() or list(range(len(drivers))) for zone in drivers_by_zone(drivers)]
+    return [by_zone[z] for z in zone_codes(workers)]
+
+
+def shift_fingerprints(workers, drivers, workplaces, shifts, dist, candidates, match_zones=False):
+    """Hash of everything the model sees for each shift: its candidates, their distances and the fleet.
+
+    A shift whose fingerprint matches the previous run is the same subproblem
+    and does not need to be solved again.
+    """
+    wi, wpi, si = (candidates[c].to_numpy() for c in ("worker", "workplace", "shift"))
+    row_hashes = pd.util.hash_pandas_object(pd.DataFrame({
+        "WorkerID": workers["WorkerID"].to_numpy()[wi],
+        "WorkplaceID": workplaces["WorkplaceID"].to_numpy()[wpi],
+        "Distance": np.rint(dist[wi, wpi] * DISTANCE_SCALE).astype(np.int64),
+    }), index=False).to_numpy()
+    fleet_columns = ["DriverID", "VehicleCapacity"] + (["PreferredZone"] if match_zones else [])
+    fleet = pd.util.hash_pandas_object(drivers[fleet_columns], index=False).to_numpy()
+
+    order = np.lexsort((row_hashes, si))
+    bounds = np.searchsorted(si[order], np.arange(len(shifts) + 1))
+    fingerprints = {}
+    for i, shift in enumerate(shifts[["ShiftID", "Day", "ShiftType"]].itertuples(index=False)):
+        digest = hashlib.sha1(fleet.tobytes())
+        digest.update(repr(tuple(shift)).encode())
+        digest.update(row_hashes[order[bounds[i]:bounds[i + 1]]].tobytes())
+        fingerprints[shift.ShiftID] = digest.hexdigest()
+    return fingerprints
+
+
+# 3. CP-SAT models are written straight into the model proto from index arrays: one
+# block of boolean variables per kind, and one linear constraint per group of
+# variables (per shift, per driver...), so the build never loops over single terms.
+def new_bool_block(model, n):
+    """Append n boolean variables to the model; returns their proto indices."""
+    first = len(model.proto.variables)
+    model.proto.merge_text_format("variables { domain: [0, 1] }\n" * n)
+    return np.arange(first, first + n, dtype=np.int64)
+
+
+def add_group_sums(model, keys, variables, groups, lower, upper=None, coeffs=None):
+    """For each key in `groups`: lower <= sum(coeffs * variables with that key) <= upper.
+
+    lower/upper are scalars or one value per group (upper defaults to the
+    number of terms). A group without variables still gets its constraint, so
+    "at least one" on an empty group makes the model infeasible, as it should.
+    """
+    order = np.argsort(keys, kind="stable")
+    starts = np.searchsorted(keys[order], groups, side="left").tolist()
+    ends = np.searchsorted(keys[order], groups, side="right").tolist()
+    terms = variables[order].tolist()
+    factors = (np.ones(len(keys), dtype=np.int64) if coeffs is None else coeffs[order]).tolist()
+    lower = np.broadcast_to(lower, len(groups)).tolist()
+    upper = np.broadcast_to(len(keys) if upper is None else upper, len(groups)).tolist()
+    for a, b, lo, hi in zip(starts, ends, lower, upper):
+        linear = model.proto.constraints.add().linear
+        linear.vars.extend(terms[a:b])
+        linear.coeffs.extend(factors[a:b])
+        linear.domain.extend([lo, max(hi, lo)])
+
+
+def minimize_sum(model, variables, costs):
+    model.proto.objective.vars.extend(variables.tolist())
+    model.proto.objective.coeffs.extend(costs.tolist())
+
+
+def add_hints(model, variables):
+    model.proto.solution_hint.vars.extend(variables.tolist())
+    model.proto.solution_hint.values.extend([1] * len(variables))
+
+
+def true_literals(solver, variables):
+    """Positions in `variables` of the literals set to 1 in the solution."""
+    solution = np.asarray(solver.response_proto.solution, dtype=np.int64)
+    return np.flatnonzero(solution[variables])
+
+
+def expand_rows(keys, options):
+    """One row per (row, option in options[keys[row]]); returns (row index, option) arrays."""
+    counts = np.array([len(choices) for choices in options], dtype=np.int64)
+    offsets = np.cumsum(counts) - counts
+    flat = np.concatenate([np.asarray(choices, dtype=np.int64) for choices in options] + [np.empty(0, np.int64)])
+    row_counts = counts[keys]
+    row = np.repeat(np.arange(len(keys)), row_counts)
+    position = np.arange(len(row)) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts)
+    return row, flat[offsets[keys][row] + position]
+
+
+def driver_options(rows_worker, drivers_of, n_drivers):
+    """Expand rows to one per (row, allowed driver); returns (row index, driver index) arrays."""
+    if drivers_of is None:
+        return np.repeat(np.arange(len(rows_worker)), n_drivers), np.tile(np.arange(n_drivers), len(rows_worker))
+    return expand_rows(rows_worker, drivers_of)
+
+
+def hint_positions(keys, hint_keys):
+    """Positions of hint_keys in keys, skipping keys that are not there."""
+    found = pd.Index(keys).get_indexer(hint_keys)
+    return found[found >= 0]
+
+
+# 3. Work rules: side constraints across shifts. The CP-SAT models state them exactly;
+# the flow is re-solved without the assignments that break them (rule_violations).
+# Shift times are absolute hours from the Monday 00:00 of week 1.
+def shift_clock(shifts):
+    """(day number, start hour, end hour) of each shift; shifts ending past midnight end the next day."""
+    day = (shifts["Week"].to_numpy(dtype=np.int64) - 1) * len(DAYS) + pd.Index(DAYS).get_indexer(shifts["Day"])
+    start = pd.to_timedelta(shifts["StartTime"].astype(str) + ":00").dt.total_seconds().to_numpy() / 3600
+    end = pd.to_timedelta(shifts["EndTime"].astype(str) + ":00").dt.total_seconds().to_numpy() / 3600
+    start = day * 24 + start
+    return day, start, day * 24 + np.where(end <= start % 24, end + 24, end)
+
+
+def work_rules(shifts, drivers, state=None):
+    """Everything the rule constraints need for these shifts, given the carried rolling `state`."""
+    day, start, end = shift_clock(shifts)
+    weeks = shifts["Week"].to_numpy(dtype=np.int64)
+    hours_used = np.array([[state["driver_hours"].get((di, week), 0) if state else 0 for week in np.unique(weeks)]
+                           for di in range(len(drivers))]).reshape(len(drivers), -1)
+    return {
+        "day": day, "start": start, "end": end,
+        "week": np.unique(weeks, return_inverse=True)[1],
+        "streak": state["streak"] if state else None,
+        "day_runs": drivers["MaxHoursPerDay"].to_numpy(dtype=np.int64) // DRIVER_HOURS_PER_SHIFT,
+        "week_runs": np.maximum(MAX_DRIVER_HOURS_PER_WEEK - hours_used, 0).astype(np.int64) // DRIVER_HOURS_PER_SHIFT,
+    }
+
+
+def rule_violations(solution, rules):
+    """Assignments of a solution that break the work rules.
+
+    Returns ((worker, shift) pairs to drop from the candidates, (driver, shift)
+    runs to close), as two-column int arrays. Only the later shift of each
+    conflict is dropped, so a few rounds may be needed to settle.
+    """
+    sol = pd.DataFrame(np.array(solution, dtype=np.int64).reshape(-1, 4), columns=["worker", "driver", "workplace", "shift"])
+    sol["start"], sol["day"] = rules["start"][sol["shift"]], rules["day"][sol["shift"]]
+    work = sol.drop_duplicates(["worker", "shift"]).sort_values(["worker", "start"])
+
+    # Rest: a shift starting less than MIN_REST_HOURS after the worker's previous one ends
+    previous_end = pd.Series(rules["end"][work["shift"]], index=work.index).groupby(work["worker"]).shift()
+    too_soon = work[work["start"] < previous_end + MIN_REST_HOURS]
+
+    # Consecutive days: the days past MAX_CONSECUTIVE_DAYS of each run, counting the carried streak
+    days = work[["worker", "day"]].drop_duplicates()
+    run = (days["day"] != days.groupby("worker")["day"].shift() + 1).cumsum()
+    length = days.groupby(run).cumcount().to_numpy() + 1
+    if rules["streak"] is not None:
+        opens_window = (days.groupby(run)["day"].transform("first") == rules["day"].min()).to_numpy()
+        length += np.where(opens_window, rules["streak"][days["worker"]], 0)
+    too_long = work.merge(days[length > MAX_CONSECUTIVE_DAYS], on=["worker", "day"])
+
+    # Driver hours: the runs past each driver's daily and weekly allowance
+    runs = sol.drop_duplicates(["driver", "shift"]).sort_values("start")
+    runs["week"] = rules["week"][runs["shift"]]
+    over_day = runs.groupby(["driver", "day"]).cumcount().to_numpy() >= rules["day_runs"][runs["driver"]]
+    over_week = (runs.groupby(["driver", "week"]).cumcount().to_numpy()
+                 >= rules["week_runs"][runs["driver"], runs["week"]])
+
+    drop = pd.concat([too_soon, too_long])[["worker", "shift"]].drop_duplicates().to_numpy()
+    return drop, runs.loc[over_day | over_week, ["driver", "shift"]].to_numpy()
+
+
+def add_worker_rules(model, wi, si, literals, rules):
+    """Rest time and consecutive days for the literals placing worker wi in shift si."""
+    day, start, end = rules["day"], rules["start"], rules["end"]
+    S = len(start)
+
+    # Rest: at most one shift per worker among those starting before an anchor shift's end + rest
+    anchor, follower = np.nonzero((start[None, :] >= start[:, None]) & (start[None, :] < end[:, None] + MIN_REST_HOURS))
+    order = np.argsort(follower, kind="stable")
+    anchors_of = np.split(anchor[order], np.cumsum(np.bincount(follower, minlength=S))[:-1])
+    row, a = expand_rows(si, anchors_of)
+    keys = wi[row] * S + a
+    groups = np.unique(keys)
+    n_shifts = np.bincount(np.searchsorted(groups, np.unique(keys * S + si[row]) // S), minlength=len(groups))
+    add_group_sums(model, keys, literals[row], groups[n_shifts > 1], 0, 1)
+
+    # Consecutive days: any MAX_CONSECUTIVE_DAYS + 1 day block holds at most MAX_CONSECUTIVE_DAYS worked
+    # days, counting the streak carried into the first day
+    first = day.min()
+    span = day.max() - first + MAX_CONSECUTIVE_DAYS + 1
+    row = np.repeat(np.arange(len(wi)), MAX_CONSECUTIVE_DAYS + 1)
+    block = day[si[row]] - np.tile(np.arange(MAX_CONSECUTIVE_DAYS + 1), len(wi))   # first day of the block
+    keys = wi[row] * span + block - first + MAX_CONSECUTIVE_DAYS
+    streak = np.zeros(wi.max() + 1 if len(wi) else 0, dtype=np.int64) if rules["streak"] is None else rules["streak"]
+    groups = np.unique(keys)
+    carried = np.minimum(streak[groups // span], np.maximum(MAX_CONSECUTIVE_DAYS - groups % span, 0))
+    # Skip blocks that cannot exceed the limit
+    worked_days = np.bincount(np.searchsorted(groups, np.unique(keys * span + day[si[row]] - first) // span),
+                              minlength=len(groups))
+    limit = MAX_CONSECUTIVE_DAYS - carried
+    binding = worked_days > limit
+    add_group_sums(model, keys, literals[row], groups[binding], 0, limit[binding])
+
+
+def add_driver_rules(model, di, si, literals, drivers, rules):
+    """Capacity, daily hours and weekly hours for the literals placing a worker with driver di in shift si.
+
+    Replaces the plain capacity constraint: a (driver, shift) with riders is
+    one pickup run of DRIVER_HOURS_PER_SHIFT hours.
+    """
+    S = len(rules["day"])
+    driver_shift = di * S + si
+    groups = np.unique(driver_shift)
+    runs = new_bool_block(model, len(groups))
+    run_driver, run_shift = groups // S, groups % S
+    capacity = drivers["VehicleCapacity"].to_numpy(dtype=np.int64)[run_driver]
+    add_group_sums(model, np.concatenate([driver_shift, groups]), np.concatenate([literals, runs]), groups,
+                   -capacity, 0, coeffs=np.concatenate([np.ones(len(literals), dtype=np.int64), -capacity]))
+
+    days = rules["day"] - rules["day"].min()
+    driver_day = run_driver * (days.max() + 1) + days[run_shift]
+    groups = np.unique(driver_day)
+    add_group_sums(model, driver_day, runs, groups, 0, rules["day_runs"][groups // (days.max() + 1)])
+
+    n_weeks = rules["week_runs"].shape[1]
+    driver_week = run_driver * n_weeks + rules["week"][run_shift]
+    groups = np.unique(driver_week)
+    add_group_sums(model, driver_week, runs, groups, 0, rules["week_runs"][groups // n_weeks, groups % n_weeks])
+
+
+# 3a. Original formulation: one variable per (worker, driver, workplace, shift)
+def build_tensor_model(workers, drivers, workplaces, shifts, dist, candidates, hints=(), covered_drivers=(),
+                       drivers_of=None, rules=None):
+    model = cp_model.CpModel()
+    D, S = len(drivers), len(shifts)
+    cw, cwp, cs = (candidates[c].to_numpy(dtype=np.int64) for c in ("worker", "workplace", "shift"))
+
+    row, di = driver_options(cw, drivers_of, D)
+    wi, wpi, si = cw[row], cwp[row], cs[row]
+    assign = new_bool_block(model, len(row))
+
+    # Each worker can only be assigned once per shift
+    worker_shift = wi * S + si
+    add_group_sums(model, worker_shift, assign, np.unique(worker_shift), 0, 1)
+
+    # Driver capacity respected per shift
+    if rules is None:
+        driver_shift = di * S + si
+        groups = np.unique(driver_shift)
+        add_group_sums(model, driver_shift, assign, groups, 0, drivers["VehicleCapacity"].to_numpy()[groups // S])
+    else:
+        add_driver_rules(model, di, si, assign, drivers, rules)
+        add_worker_rules(model, wi, si, assign, rules)
+
+    # Each shift must have at least one worker assigned
+    add_group_sums(model, si, assign, np.arange(S), 1)
+
+    # Each driver must carry at least one worker in total (so not all of them stay empty)
+    add_group_sums(model, di, assign, np.setdiff1d(np.arange(D), covered_drivers), 1)
+
+    # Objective: minimize total distance
+    minimize_sum(model, assign, (dist[wi, wpi] * DISTANCE_SCALE).astype(np.int64))
+
+    # Warm start from a previous solution
+    if len(hints):
+        key = ((wi * D + di) * len(workplaces) + wpi) * S + si
+        hw, hd, hwp, hs = np.array(hints, dtype=np.int64).T
+        add_hints(model, assign[hint_positions(key, ((hw * D + hd) * len(workplaces) + hwp) * S + hs)])
+
+    def extract(solver):
+        chosen = true_literals(solver, assign)
+        return list(zip(wi[chosen].tolist(), di[chosen].tolist(), wpi[chosen].tolist(), si[chosen].tolist()))
+
+    return model, extract
+
+
+# 3b. Factorized formulation: "goes to workplace" and "rides with driver" are separate
+# variables, linked per (worker, shift) by a channeling constraint. W·(P+D)·S variables.
+def build_factorized_model(workers, drivers, workplaces, shifts, dist, candidates, hints=(), covered_drivers=(),
+                           drivers_of=None, rules=None):
+    model = cp_model.CpModel()
+    D, S = len(drivers), len(shifts)
+    wi, wpi, si = (candidates[c].to_numpy(dtype=np.int64) for c in ("worker", "workplace", "shift"))
+
+    # goes: worker wi works at workplace wpi in shift si, one per candidate
+    goes = new_bool_block(model, len(wi))
+    pair_keys, goes_pair = np.unique(wi * S + si, return_inverse=True)
+    pair_worker, pair_shift = pair_keys // S, pair_keys % S
+
+    # rides: worker of a (worker, shift) pair is picked up by driver di
+    ride_pair, ride_driver = driver_options(pair_worker, drivers_of, D)
+    ride_shift = pair_shift[ride_pair]
+    rides = new_bool_block(model, len(ride_pair))
+
+    # Channeling: a worker rides with exactly one driver iff they go to exactly one workplace,
+    # and at most once per shift
+    pairs = np.arange(len(pair_keys))
+    add_group_sums(model, np.concatenate([goes_pair, ride_pair]), np.concatenate([goes, rides]), pairs, 0, 0,
+                   coeffs=np.concatenate([np.ones(len(goes), dtype=np.int64), -np.ones(len(rides), dtype=np.int64)]))
+    add_group_sums(model, goes_pair, goes, pairs, 0, 1)
+
+    # Driver capacity respected per shift
+    if rules is None:
+        driver_shift = ride_driver * S + ride_shift
+        groups = np.unique(driver_shift)
+        add_group_sums(model, driver_shift, rides, groups, 0, drivers["VehicleCapacity"].to_numpy()[groups // S])
+    else:
+        add_driver_rules(model, ride_driver, ride_shift, rides, drivers, rules)
+        add_worker_rules(model, wi, si, goes, rules)
+
+    # Each shift must have at least one worker assigned
+    add_group_sums(model, si, goes, np.arange(S), 1)
+
+    # Each driver must carry at least one worker in total
+    add_group_sums(model, ride_driver, rides, np.setdiff1d(np.arange(D), covered_drivers), 1)
+
+    # Objective: minimize total distance
+    minimize_sum(model, goes, (dist[wi, wpi] * DISTANCE_SCALE).astype(np.int64))
+
+    # Warm start from a previous solution
+    if len(hints):
+        hw, hd, hwp, hs = np.array(hints, dtype=np.int64).T
+        goes_at = pd.Index((wi * len(workplaces) + wpi) * S + si).get_indexer((hw * len(workplaces) + hwp) * S + hs)
+        rides_at = pd.Index(pair_worker[ride_pair] * D * S + ride_driver * S + ride_shift).get_indexer(
+            hw * D * S + hd * S + hs)
+        both = (goes_at >= 0) & (rides_at >= 0)
+        add_hints(model, np.concatenate([goes[goes_at[both]], rides[rides_at[both]]]))
+
+    def extract(solver):
+        workplace_of = np.empty(len(pair_keys), dtype=np.int64)
+        chosen = true_literals(solver, goes)
+        workplace_of[goes_pair[chosen]] = wpi[chosen]
+        chosen = true_literals(solver, rides)
+        return list(zip(pair_worker[ride_pair[chosen]].tolist(), ride_driver[chosen].tolist(),
+                        workplace_of[ride_pair[chosen]].tolist(), ride_shift[chosen].tolist()))
+
+    return model, extract
+
+
+FORMULATIONS = {
+    "tensor": build_tensor_model,
+    "factorized": build_factorized_model,
+}
+BACKENDS = ["auto", "flow", "cpsat"]
+
+
+# 3c. Min-cost flow: the same problem as a transportation network, solved exactly.
+# One unit of flow is one worker picked up in a shift:
+#   source → driver → (driver, shift) → hub → (worker, shift) → shift → sink
+# with VehicleCapacity on driver → (driver, shift) and 1 on each (worker, shift).
+# Drivers do not change the cost, so instead of an arc per (driver, worker) the
+# drivers a worker may ride with meet the worker in one hub per (driver set, shift).
+# "Each shift / each driver at least once" are supplies of -1 / +1 on those nodes;
+# a free source → sink arc absorbs the units that are not needed.
+def nearest_candidates(candidates, dist):
+    """Per (worker, shift) pair: its closest candidate workplace and the distance cost."""
+    wi, wpi, si = (candidates[c].to_numpy() for c in ("worker", "workplace", "shift"))
+    cost = (dist[wi, wpi] * DISTANCE_SCALE).astype(np.int64)   # truncated like the CP-SAT objective
+    order = np.lexsort((cost, si, wi))
+    first = order[np.flatnonzero(np.diff(np.stack([wi[order], si[order]]), prepend=-1, axis=1).any(axis=0))]
+    return wi[first], si[first], wpi[first], cost[first]
+
+
+def solve_flow(workers, drivers, workplaces, shifts, dist, candidates, covered_drivers=(), drivers_of=None,
+               closed_runs=None):
+    """Exact min-cost-flow solution; returns ((wi, di, wpi, si) tuples or None, network stats).
+
+    closed_runs, a (drivers x shifts) bool array, removes the seats of those drivers in those shifts.
+    """
+    start = time.perf_counter()
+    D, S = len(drivers), len(shifts)
+    pair_worker, pair_shift, pair_workplace, pair_cost = nearest_candidates(candidates, dist)
+    P = len(pair_worker)
+
+    # Workers allowed the same drivers share a driver set
+    driver_sets, worker_set = [tuple(range(D))], np.zeros(len(workers), dtype=np.int64)
+    if drivers_of is not None:
+        keys = {}
+        worker_set = np.array([keys.setdefault(tuple(options), len(keys)) for options in drivers_of], dtype=np.int64)
+        driver_sets = list(keys)
+    set_driver = np.concatenate([np.asarray(ds, dtype=np.int64) for ds in driver_sets])
+    set_of = np.repeat(np.arange(len(driver_sets)), [len(ds) for ds in driver_sets])
+    G = len(driver_sets)
+
+    # Node ids: source, sink, drivers, (driver, shift), hubs (driver set, shift), (worker, shift) pairs, shifts
+    source, sink = 0, 1
+    driver_node = 2 + np.arange(D)
+    driver_shift_node = 2 + D + np.arange(D * S).reshape(D, S)
+    hub_node = 2 + D + D * S + np.arange(G * S).reshape(G, S)
+    pair_node = 2 + D + D * S + G * S + np.arange(P)
+    shift_node = 2 + D + D * S + G * S + P + np.arange(S)
+    big = int(drivers["VehicleCapacity"].sum()) + S
+
+    # Arcs (driver, shift) → hub for every driver of every set, in every shift
+    join_member = np.repeat(np.arange(len(set_driver)), S)
+    join_shift = np.tile(np.arange(S), len(set_driver))
+    join_driver, join_set = set_driver[join_member], set_of[join_member]
+    pair_hub = hub_node[worker_set[pair_worker], pair_shift]
+
+    tails = np.concatenate([np.full(D, source), np.repeat(driver_node, S), driver_shift_node[join_driver, join_shift],
+                            pair_hub, pair_node, shift_node, [source]])
+    heads = np.concatenate([driver_node, driver_shift_node.ravel(), hub_node[join_set, join_shift],
+                            pair_node, shift_node[pair_shift], np.full(S, sink), [sink]])
+    seats = np.repeat(drivers["VehicleCapacity"].to_numpy(dtype=np.int64), S)
+    if closed_runs is not None:
+        seats[closed_runs.ravel()] = 0
+    capacities = np.concatenate([np.full(D, big), seats, np.full(len(join_member), big), np.ones(2 * P, dtype=np.int64), np.full(S + 1, big)])
+    costs = np.concatenate([np.zeros(D + D * S + len(join_member) + P, dtype=np.int64), pair_cost,
+                            np.zeros(S + 1, dtype=np.int64)])
+    join_arcs = D + D * S + np.arange(len(join_member))
+    pair_arcs = D + D * S + len(join_member) + np.arange(P)
+
+    needs_driver = np.ones(D, dtype=bool)
+    needs_driver[np.asarray(covered_drivers, dtype=np.int64)] = False
+    supplies = np.zeros(2 + D + D * S + G * S + P + S, dtype=np.int64)
+    supplies[driver_node] = needs_driver
+    supplies[shift_node] = -1
+    supplies[source] = S
+    supplies[sink] = -needs_driver.sum()
+
+    flow = min_cost_flow.SimpleMinCostFlow()
+    flow.add_arcs_with_capacity_and_unit_cost(tails, heads, capacities, costs)
+    flow.set_nodes_supplies(np.arange(len(supplies)), supplies)
+    built = time.perf_counter()
+    status = flow.solve()
+    solved = time.perf_counter()
+    stats = {"Nodes": len(supplies), "Arcs": len(tails), "BuildSeconds": round(built - start, 3),
+             "SolveSeconds": round(solved - built, 3),
+             "Status": "OPTIMAL" if status == flow.OPTIMAL else "INFEASIBLE",
+             "Objective": flow.optimal_cost() if status == flow.OPTIMAL else None}
+    if status != flow.OPTIMAL:
+        return None, stats
+
+    # In each hub, hand the picked workers to its drivers, as many as each driver's flow
+    join_flow = flow.flows(join_arcs)
+    picked = np.flatnonzero(flow.flows(pair_arcs) > 0)
+    seats = np.repeat(np.arange(len(join_member)), join_flow)
+    seat_order = seats[np.argsort(hub_node[join_set[seats], join_shift[seats]], kind="stable")]
+    pair_order = picked[np.argsort(pair_hub[picked], kind="stable")]
+    pair_drivers = join_driver[seat_order]
+    solution = list(zip(pair_worker[pair_order].tolist(), pair_drivers.tolist(), pair_workplace[pair_order].tolist(),
+                    pair_shift[pair_order].tolist()))
+    stats["ExtractSeconds"] = round(time.perf_counter() - solved, 3)
+    return solution, stats
+
+
+# 4. Solve
+def choose_backend(backend, side_constraints=False, pairs=0):
+    """'auto' picks the flow solver, or CP-SAT for side constraints on instances small enough for it.
+
+    CP-SAT models the side constraints exactly but finds no solution within the
+    time limit once there are more than CPSAT_RULES_MAX_PAIRS worker x driver
+    pairs. The flow enforces them by re-solving without the assignments that
+    break them (solve_flow_with_rules): much faster, but not optimal.
+    """
+    if backend == "auto":
+        backend = "cpsat" if side_constraints and pairs <= CPSAT_RULES_MAX_PAIRS else "flow"
+    if backend == "flow" and side_constraints:
+        print("⚠️ Work rules with the flow backend: re-solving without rule-breaking assignments, "
+              "feasible but not optimal.")
+    return backend
+
+
+def solve(model, time_limit=TIME_LIMIT_SECONDS, num_workers=0):
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = time_limit
+    if num_workers:
+        solver.parameters.num_workers = num_workers
+    status = solver.Solve(model)
+    return solver, status
+
+
+@contextmanager
+def timed(timings, phase):
+    """Add the seconds spent in the block to timings[phase] (if timings is a dict)."""
+    start = time.perf_counter()
+    yield
+    if timings is not None:
+        timings[phase] = round(timings.get(phase, 0) + time.perf_counter() - start, 3)
+
+
+def model_size(model):
+    proto = model.Proto()
+    return len(proto.variables), len(proto.constraints)
+
+
+# 5. Collect results
+def to_rows(solution, workers, drivers, workplaces, shifts, dist):
+    """Result frame for (worker, driver, workplace, shift) index tuples."""
+    wi, di, wpi, si = np.array(solution, dtype=np.int64).reshape(-1, 4).T
+    return pd.DataFrame({
+        "WorkerID": workers["WorkerID"].to_numpy()[wi],
+        "DriverID": drivers["DriverID"].to_numpy()[di],
+        "WorkplaceID": workplaces["WorkplaceID"].to_numpy()[wpi],
+        "ShiftID": shifts["ShiftID"].to_numpy()[si],
+        "Distance": np.round(dist[wi, wpi].astype(np.float64), 3),
+    })
+
+
+def solution_indices(rows, workers, drivers, workplaces, shifts):
+    """Map result rows (IDs) back to (worker, driver, workplace, shift) index tuples, dropping unknown IDs."""
+    index = np.column_stack([
+        pd.Index(workers["WorkerID"]).get_indexer(rows["WorkerID"]),
+        pd.Index(drivers["DriverID"]).get_indexer(rows["DriverID"]),
+        pd.Index(workplaces["WorkplaceID"]).get_indexer(rows["WorkplaceID"]),
+        pd.Index(shifts["ShiftID"]).get_indexer(rows["ShiftID"]),
+    ])
+    return [tuple(row) for row in index[(index >= 0).all(axis=1)].tolist()]
+
+
+def shift_subset(candidates, shifts, keep):
+    """Candidates and shifts restricted to the shift indices `keep`, renumbered 0..n-1."""
+    new_index = np.full(len(shifts), -1)
+    new_index[keep] = np.arange(len(keep))
+    candidates = candidates[new_index[candidates["shift"].to_numpy()] >= 0].copy()
+    candidates["shift"] = new_index[candidates["shift"].to_numpy()].astype(np.int32)
+    return candidates, shifts.iloc[keep].reset_index(drop=True)
+
+
+def solve_subproblem(workers, drivers, workplaces, shifts, dist, candidates, backend="flow", formulation="factorized",
+                     time_limit=TIME_LIMIT_SECONDS, hints=(), covered_drivers=(), drivers_of=None, num_workers=0,
+                     rules=None):
+    """Solve one model over `shifts`; returns ((wi, di, wpi, si) tuples or None, model stats).
+
+    `rules` (from work_rules) adds the work rule constraints.
+    """
+    if backend == "flow" and rules is not None:
+        return solve_flow_with_rules(workers, drivers, workplaces, shifts, dist, candidates, rules,
+                                     covered_drivers=covered_drivers, drivers_of=drivers_of)
+    if backend == "flow":
+        solution, stats = solve_flow(workers, drivers, workplaces, shifts, dist, candidates,
+                                     covered_drivers=covered_drivers, drivers_of=drivers_of)
+        return solution, {"Model": "flow", **stats}
+
+    start = time.perf_counter()
+    model, extract = FORMULATIONS[formulation](workers, drivers, workplaces, shifts, dist, candidates, hints=hints,
+                                               covered_drivers=covered_drivers, drivers_of=drivers_of, rules=rules)
+    n_vars, n_constraints = model_size(model)
+    built = time.perf_counter()
+    solver, status = solve(model, time_limit, num_workers)
+    solved = time.perf_counter()
+    found = status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    solution = extract(solver) if found else None
+    return solution, {"Model": formulation, "Variables": n_vars, "Constraints": n_constraints,
+                      "BuildSeconds": round(built - start, 3), "SolveSeconds": round(solved - built, 3),
+                      "ExtractSeconds": round(time.perf_counter() - solved, 3), "Status": solver.StatusName(status),
+                      "Objective": solver.ObjectiveValue() if found else None}
+
+
+def solve_flow_with_rules(workers, drivers, workplaces, shifts, dist, candidates, rules, covered_drivers=(),
+                          drivers_of=None):
+    """Flow solution that keeps the work rules: re-solve without the assignments that break them.
+
+    Not optimal like the CP-SAT rule models, but each round is one flow solve;
+    the phase seconds are summed over the rounds.
+    """
+    S = len(shifts)
+    closed_runs = np.zeros((len(drivers), S), dtype=bool)
+    phases = dict.fromkeys(["BuildSeconds", "SolveSeconds", "ExtractSeconds"], 0.0)
+    for rounds in range(1, MAX_RULE_ROUNDS + 1):
+        solution, stats = solve_flow(workers, drivers, workplaces, shifts, dist, candidates,
+                                     covered_drivers=covered_drivers, drivers_of=drivers_of, closed_runs=closed_runs)
+        for phase in phases:
+            phases[phase] += stats.get(phase, 0)
+        if solution is None:
+            break
+        drop, close = rule_violations(solution, rules)
+        if not len(drop) and not len(close):
+            break
+        keys = candidates["worker"].to_numpy(dtype=np.int64) * S + candidates["shift"].to_numpy()
+        candidates = candidates[~np.isin(keys, drop[:, 0] * S + drop[:, 1])]
+        closed_runs[close[:, 0], close[:, 1]] = True
+    else:
+        solution, stats = None, {**stats, "Status": "RULES_UNSETTLED", "Objective": None}
+    return solution, {"Model": "flow", **stats, **{k: round(v, 3) for k, v in phases.items()}, "RuleRounds": rounds}
+
+
+def model_columns(stats):
+    """Model size, phase seconds, status and objective of solve_subproblem stats.
+
+    The flow network's arcs and nodes play the part of variables and constraints.
+    """
+    if stats["Model"] == "flow":
+        stats = {**stats, "Variables": stats["Arcs"], "Constraints": stats["Nodes"]}
+    return {k: stats[k] for k in ("Variables", "Constraints", "BuildSeconds", "SolveSeconds", "ExtractSeconds",
+                                  "Status", "Objective")}
+
+
+def describe(stats):
+    """One-line summary of solve_subproblem stats."""
+    if stats["Model"] == "flow":
+        size = f"{stats['Nodes']} nodes, {stats['Arcs']} arcs"
+    else:
+        size = f"{stats['Variables']} variables, {stats['Constraints']} constraints"
+    rounds = f" over {stats['RuleRounds']} rule rounds" if "RuleRounds" in stats else ""
+    return (f"Model ({stats['Model']}): {size}, built in {stats['BuildSeconds']}s, "
+            f"{stats['Status']} in {stats['SolveSeconds']}s{rounds}, extracted in {stats['ExtractSeconds']}s")
+
+
+# 5b. Decomposition: shifts only interact through "each driver carries at least one
+# worker in total", so a coordination step decides in which subproblem each driver
+# must carry someone; the subproblems are then independent.
+def shift_groups(shifts, decompose):
+    """Shift indices of each subproblem: one per shift, or one per (Week, Day)."""
+    if decompose == "shift":
+        return [np.array([i]) for i in range(len(shifts))]
+    keys = shifts[["Week", "Day"]].astype(str).agg("-".join, axis=1) if "Week" in shifts else shifts["Day"].astype(str)
+    return [np.flatnonzero((keys == key).to_numpy()) for key in pd.unique(keys)]
+
+
+def assign_required_drivers(groups, candidates, n_workers, n_drivers, covered_drivers=(), drivers_of=None):
+    """Coordination step: the subproblem in which each not-yet-covered driver must carry a worker (-1: none can).
+
+    Drivers with the fewest options go first, each to the eligible subproblem
+    with the fewest required drivers so far (ties: the most pairs it could carry),
+    so required pickups spread out instead of adding to the shift minimums.
+    """
+    group_of_shift = np.empty(sum(len(g) for g in groups), dtype=np.int64)
+    for g, shift_index in enumerate(groups):
+        group_of_shift[shift_index] = g
+    pairs = candidates[["worker", "shift"]].drop_duplicates()
+    pair_group = group_of_shift[pairs["shift"].to_numpy()]
+    if drivers_of is None:
+        eligible = np.repeat(np.bincount(pair_group, minlength=len(groups))[:, None], n_drivers, axis=1)
+    else:
+        # Pairs per (group, worker), spread over the drivers each worker may ride with
+        per_worker = np.zeros((len(groups), n_workers), dtype=np.int64)
+        np.add.at(per_worker, (pair_group, pairs["worker"].to_numpy()), 1)
+        eligible = np.zeros((len(groups), n_drivers), dtype=np.int64)
+        for wi in np.flatnonzero(per_worker.any(axis=0)):
+            eligible[:, drivers_of[wi]] += per_worker[:, wi:wi + 1]
+
+    required = np.full(n_drivers, -1)
+    load = np.zeros(len(groups), dtype=np.int64)
+    pending = np.setdiff1d(np.arange(n_drivers), np.asarray(covered_drivers, dtype=np.int64))
+    for di in pending[np.argsort((eligible[:, pending] > 0).sum(axis=0), kind="stable")]:
+        options = np.flatnonzero(eligible[:, di] > load)
+        if not len(options):
+            continue
+        required[di] = options[np.lexsort((-eligible[options, di], load[options]))[0]]
+        load[required[di]] += 1
+    return required
+
+
+# Set in each pool process by init_subproblem_worker, so tasks only carry their own shifts
+_problem = None
+
+
+def init_subproblem_worker(problem):
+    global _problem
+    _problem = problem
+
+
+def solve_group(task):
+    """Pool task: one subproblem; returns (index, solution, stats)."""
+    g, shifts, candidates, hints, covered, settings = task
+    workers, drivers, workplaces, dist, drivers_of = _problem
+    solution, stats = solve_subproblem(workers, drivers, workplaces, shifts, dist, candidates, hints=hints,
+                                       covered_drivers=covered, drivers_of=drivers_of, **settings)
+    return g, solution, stats
+
+
+def solve_decomposed(workers, drivers, workplaces, shifts, dist, candidates, decompose="shift", processes=None,
+                     hints=(), covered_drivers=(), drivers_of=None, **settings):
+    """Solve each shift or day as its own subproblem in a process pool and merge the solutions.
+
+    Returns ((wi, di, wpi, si) tuples or None, stats); the model sizes, the
+    objective and the build, solve and extract seconds are summed over the
+    subproblems.
+    """
+    groups = shift_groups(shifts, decompose)
+    required = assign_required_drivers(groups, candidates, len(workers), len(drivers), covered_drivers, drivers_of)
+    stranded = np.flatnonzero(required < 0)
+    stranded = stranded[~np.isin(stranded, covered_drivers)]
+    if len(stranded):
+        print(f"⚠️ Drivers {drivers['DriverID'].to_numpy()[stranded].tolist()} cannot carry any candidate worker")
+
+    # Split the cores between the pool processes instead of each CP-SAT using all of them
+    processes = min(processes or os.cpu_count(), len(groups))
+    settings["num_workers"] = max(1, os.cpu_count() // processes)
+    hints_by_shift = defaultdict(list)
+    for wi, di, wpi, si in hints:
+        hints_by_shift[si].append((wi, di, wpi, si))
+    tasks = []
+    for g, shift_index in enumerate(groups):
+        sub_candidates, sub_shifts = shift_subset(candidates, shifts, shift_index)
+        local = {si: i for i, si in enumerate(shift_index.tolist())}
+        sub_hints = [(wi, di, wpi, local[si]) for si in local for wi, di, wpi, _ in hints_by_shift[si]]
+        tasks.append((g, sub_shifts, sub_candidates, sub_hints, np.flatnonzero(required != g), settings))
+
+    start = time.perf_counter()
+    solution = []
+    phases = dict.fromkeys(["BuildSeconds", "SolveSeconds", "ExtractSeconds"], 0.0)
+    totals = dict.fromkeys(["Variables", "Constraints", "Objective"], 0)
+    problem = (workers, drivers, workplaces, dist, drivers_of)
+    with multiprocessing.Pool(processes, initializer=init_subproblem_worker, initargs=(problem,)) as pool:
+        for g, sub_solution, sub_stats in pool.imap_unordered(solve_group, tasks):
+            for phase in phases:
+                phases[phase] += sub_stats[phase]
+            if sub_solution is None:
+                print(f"❌ Subproblem {', '.join(shifts['ShiftID'].iloc[groups[g]].astype(str))}: "
+                      f"{describe(sub_stats)}")
+                solution = None
+                break
+            columns = model_columns(sub_stats)
+            for key in totals:
+                totals[key] += columns[key]
+            solution.extend((wi, di, wpi, int(groups[g][si])) for wi, di, wpi, si in sub_solution)
+    busy = sum(phases.values())
+    stats = {"Model": f"{settings['backend']} by {decompose}", "Subproblems": len(groups),
+             "WallSeconds": round(time.perf_counter() - start, 3), "SolverSeconds": round(busy, 3),
+             **{phase: round(seconds, 3) for phase, seconds in phases.items()}}
+    if solution is not None:
+        stats.update(totals)
+        print(f"✅ {len(groups)} subproblems ({decompose}) solved in {stats['WallSeconds']:.2f}s "
+              f"({busy:.2f}s of solver time)")
+    return solution, stats
+
+
+def optimize(workers, drivers, workplaces, shifts, formulation="factorized", time_limit=TIME_LIMIT_SECONDS,
+             previous=None, state=None, match_zones=False, backend="auto", decompose=None, processes=None,
+             enforce_rules=False, timings=None, **pruning):
+    """Solve the schedule; returns (assignments or None, per-shift fingerprints).
+
+    With a `previous` result, shifts whose fingerprint matches `state` keep their
+    previous rows and only the other shifts are solved, warm-started from it.
+    With match_zones, workers only ride with drivers of their zone. With
+    decompose ("shift" or "day"), each shift or day is solved on its own in a
+    process pool. enforce_rules adds the work rules (rest, consecutive days,
+    driver hours). A `timings` dict receives the seconds
+    per phase and the model stats under "Model".
+    """
+    print(f"Using {len(workers)} workers, {len(drivers)} drivers, {len(workplaces)} workplaces, {len(shifts)} shifts")
+    with timed(timings, "distances"):
+        dist = worker_workplace_distances(workers, workplaces)
+    with timed(timings, "candidates"):
+        candidates = select_candidates(workers, workplaces, shifts, **pruning)
+        fingerprints = shift_fingerprints(workers, drivers, workplaces, shifts, dist, candidates, match_zones)
+        drivers_of = zone_drivers(workers, drivers) if match_zones else None
+
+    kept = pd.DataFrame(columns=["WorkerID", "DriverID", "WorkplaceID", "ShiftID", "Distance"])
+    hints, covered_drivers = [], []
+    if previous is not None:
+        unchanged = [sid for sid, fp in fingerprints.items() if (state or {}).get(sid) == fp]
+        kept = previous[previous["ShiftID"].isin(unchanged)]
+        changed = ~shifts["ShiftID"].isin(kept["ShiftID"]).to_numpy()
+        print(f"♻️ Reusing {len(shifts) - changed.sum()} unchanged shifts, re-solving {changed.sum()}")
+
+        candidates, shifts = shift_subset(candidates, shifts, np.flatnonzero(changed))
+        hints = solution_indices(previous, workers, drivers, workplaces, shifts)
+        covered_drivers = pd.Index(drivers["DriverID"]).get_indexer(kept["DriverID"].unique())
+        if shifts.empty:
+            return kept.reset_index(drop=True), fingerprints
+
+    settings = {"backend": choose_backend(backend, enforce_rules, len(workers) * len(drivers)),
+                "formulation": formulation,
+                "time_limit": time_limit}
+    if enforce_rules:
+        settings["rules"] = work_rules(shifts, drivers)
+    if decompose:
+        solution, stats = solve_decomposed(workers, drivers, workplaces, shifts, dist, candidates, decompose,
+                                           processes, hints=hints, covered_drivers=covered_drivers,
+                                           drivers_of=drivers_of, **settings)
     else:
-        print("⚠️ Solver found a solution but no assignments were made.")
-else:
-    print("❌ No feasible solution found.")
+        solution, stats = solve_subproblem(workers, drivers, workplaces, shifts, dist, candidates, hints=hints,
+                                           covered_drivers=covered_drivers, drivers_of=drivers_of, **settings)
+        print(describe(stats))
+    if timings is not None:
+        timings.update(build=stats["BuildSeconds"], solve=stats["SolveSeconds"], extract=stats["ExtractSeconds"],
+                       Model=stats)
+    if solution is None:
+        print("❌ No feasible solution found.")
+        return None, fingerprints
+    with timed(timings, "extract"):
+        solved = to_rows(solution, workers, drivers, workplaces, shifts, dist)
+    return pd.concat([kept, solved], ignore_index=True), fingerprints
+
+
+# 5c. Rolling horizon: solve a window of days, commit its first days, slide forward.
+# What links the windows is carried in a small state: each worker's last shift end
+# (rest time) and worked-day streak, hours per driver and week, and the drivers
+# that already carry someone.
+def initial_state(n_workers):
+    return {"last_end": np.full(n_workers, -np.inf), "streak": np.zeros(n_workers, dtype=np.int64),
+            "driver_hours": defaultdict(int), "covered": set()}
+
+
+def advance_state(state, solution, days, shift_day, shift_end, shift_week):
+    """Carry the committed (wi, di, wpi, si) tuples of the day numbers `days` into the state."""
+    wi, di, _, si = np.array(solution, dtype=np.int64).reshape(-1, 4).T
+    np.maximum.at(state["last_end"], wi, shift_end[si])
+    for day in days:
+        worked = np.zeros(len(state["streak"]), dtype=bool)
+        worked[wi[shift_day[si] == day]] = True
+        state["streak"] = np.where(worked, state["streak"] + 1, 0)
+    for driver, shift in set(zip(di.tolist(), si.tolist())):
+        state["driver_hours"][(driver, int(shift_week[shift]))] += DRIVER_HOURS_PER_SHIFT
+    state["covered"].update(di.tolist())
+
+
+def optimize_rolling(workers, drivers, workplaces, shifts, window_days, overlap_days=0, formulation="factorized",
+                     time_limit=TIME_LIMIT_SECONDS, match_zones=False, backend="auto", enforce_rules=False,
+                     timings=None, **pruning):
+    """Solve the horizon in windows of window_days, committing all but the last overlap_days of each.
+
+    Only one window's candidates and model exist at a time, so memory does not
+    grow with the horizon and time grows linearly with it. The uncommitted
+    overlap warm-starts the next window. Returns the assignments or None.
+    """
+    if not 0 <= overlap_days < window_days:
+        raise ValueError("overlap_days must be at least 0 and less than window_days")
+    print(f"Using {len(workers)} workers, {len(drivers)} drivers, {len(workplaces)} workplaces, {len(shifts)} shifts")
+    with timed(timings, "distances"):
+        dist = worker_workplace_distances(workers, workplaces)
+    drivers_of = zone_drivers(workers, drivers) if match_zones else None
+    backend = choose_backend(backend, enforce_rules, len(workers) * len(drivers))
+    shift_day, shift_start, shift_end = shift_clock(shifts)
+    shift_week = shifts["Week"].to_numpy(dtype=np.int64)
+
+    state = initial_state(len(workers))
+    committed, hints, stats = [], [], {}
+    phases = dict.fromkeys(["BuildSeconds", "SolveSeconds", "ExtractSeconds"], 0.0)
+    first, last = shift_day.min(), shift_day.max()
+    while first <= last:
+        window = np.flatnonzero((shift_day >= first) & (shift_day < first + window_days))
+        window = window[np.argsort(shift_start[window], kind="stable")]
+        commit_end = first + window_days - overlap_days if first + window_days <= last else last + 1
+        if not len(window):   # a gap in the days: nothing to solve, only the streaks end
+            advance_state(state, [], range(first, commit_end), shift_day, shift_end, shift_week)
+            first = commit_end
+            continue
+        window_shifts = shifts.iloc[window].reset_index(drop=True)
+        with timed(timings, "candidates"):
+            candidates = select_candidates(workers, workplaces, window_shifts, verbose=False, **pruning)
+            if enforce_rules:
+                # Rest time after each worker's last committed shift
+                starts = shift_start[window][candidates["shift"].to_numpy()]
+                candidates = candidates[starts >= state["last_end"][candidates["worker"].to_numpy()] + MIN_REST_HOURS]
+        local = {si: i for i, si in enumerate(window.tolist())}
+        solution, stats = solve_subproblem(
+            workers, drivers, workplaces, window_shifts, dist, candidates, backend, formulation, time_limit,
+            hints=[(wi, di, wpi, local[si]) for wi, di, wpi, si in hints if si in local],
+            covered_drivers=sorted(state["covered"]), drivers_of=drivers_of,
+            rules=work_rules(window_shifts, drivers, state) if enforce_rules else None)
+        for phase in phases:
+            phases[phase] += stats[phase]
+        label = f"{window_shifts['ShiftID'].iloc[0]}-{window_shifts['ShiftID'].iloc[-1]}"
+        if solution is None:
+            print(f"❌ No feasible solution for window {label}: {describe(stats)}")
+            return None
+
+        solution = [(wi, di, wpi, int(window[si])) for wi, di, wpi, si in solution]
+        done = [t for t in solution if shift_day[t[3]] < commit_end]
+        hints = [t for t in solution if shift_day[t[3]] >= commit_end]
+        advance_state(state, done, range(first, commit_end), shift_day, shift_end, shift_week)
+        committed.extend(done)
+        print(f"🗓️ Window {label}: committed {len(done)} assignments of {commit_end - first} days "
+              f"({describe(stats)})")
+        first = commit_end
+
+    if timings is not None:
+        timings.update(build=round(phases["BuildSeconds"], 3), solve=round(phases["SolveSeconds"], 3),
+                       extract=round(phases["ExtractSeconds"], 3), Model=stats)
+    with timed(timings, "extract"):
+        return to_rows(committed, workers, drivers, workplaces, shifts, dist)
+
+
+def compare_formulations(workers, drivers, workplaces, shifts, time_limit=TIME_LIMIT_SECONDS, match_zones=False,
+                         **pruning):
+    """Build and solve every formulation on the same instance and report their cost."""
+    dist = worker_workplace_distances(workers, workplaces)
+    candidates = select_candidates(workers, workplaces, shifts, **pruning)
+    drivers_of = zone_drivers(workers, drivers) if match_zones else None
+    results = []
+    for backend, name in [("cpsat", name) for name in FORMULATIONS] + [("flow", "flow")]:
+        _, stats = solve_subproblem(workers, drivers, workplaces, shifts, dist, candidates, backend, name,
+                                    time_limit, drivers_of=drivers_of)
+        results.append({"Formulation": name, **model_columns(stats)})
+    return pd.DataFrame(results)
+
+
+def print_timings(timings, path=TIMINGS_FILE):
+    """Print the seconds per phase and save them, with the model stats, as JSON."""
+    phases = {k: v for k, v in timings.items() if k != "Model"}
+    print("\n--- Timings (s) ---")
+    print(pd.Series(phases, dtype=float).to_string())
+    with open(path, "w") as f:
+        json.dump({"Phases": phases, "TotalSeconds": round(sum(phases.values()), 3),
+                   "Model": timings.get("Model")}, f, indent=2, default=str)
+    print(f"✅ Timings saved to {path}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Assign workers to drivers and workplaces per shift.")
+    parser.add_argument("--backend", choices=BACKENDS, default="auto",
+                        help="Min-cost flow or CP-SAT; auto uses the flow, or CP-SAT for --work-rules "
+                             "on small instances")
+    parser.add_argument("--formulation", choices=sorted(FORMULATIONS), default="factorized",
+                        help="CP-SAT model to build (cpsat backend)")
+    parser.add_argument("--time-limit", type=float, default=TIME_LIMIT_SECONDS,
+                        help="Solver time limit in seconds")
+    parser.add_argument("--compare", action="store_true",
+                        help="Build and solve both formulations on the same sampled instance")
+    parser.add_argument("--sample", type=int, nargs=4, metavar=("WORKERS", "DRIVERS", "WORKPLACES", "SHIFTS"),
+                        help="Optimize a random subset instead of the full dataset "
+                             f"(--compare defaults to {' '.join(map(str, COMPARE_SAMPLE))})")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Reuse shifts unchanged since the last run and warm-start the rest from it")
+    parser.add_argument("--no-prune", dest="prune", action="store_false",
+                        help="Create variables for every combination instead of the candidate list")
+    parser.add_argument("--k-nearest", type=int, default=K_NEAREST,
+                        help="Candidate workplaces per worker (0 keeps all)")
+    parser.add_argument("--max-distance", type=float, default=MAX_DISTANCE,
+                        help="Drop workplaces further than this many km from the worker")
+    parser.add_argument("--decompose", choices=["shift", "day"],
+                        help="Solve each shift or day as its own subproblem in a process pool")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Pool size for --decompose")
+    parser.add_argument("--match-zones", action="store_true",
+                        help="Only let workers ride with drivers whose PreferredZone is the worker's zone")
+    parser.add_argument("--work-rules", action="store_true",
+                        help=f"Enforce {MIN_REST_HOURS}h rest, at most {MAX_CONSECUTIVE_DAYS} days in a row and "
+                             "driver hours per day and week; exact with CP-SAT (auto on small instances), otherwise "
+                             "by re-solving the flow without violations (faster, not optimal)")
+    parser.add_argument("--rolling", type=int, metavar="DAYS",
+                        help="Solve the horizon in windows of this many days, sliding forward")
+    parser.add_argument("--overlap", type=int, default=0, metavar="DAYS",
+                        help="Days at the end of each rolling window that are re-planned by the next one")
+    args = parser.parse_args(argv)
+    if args.rolling and (args.incremental or args.decompose or args.compare):
+        parser.error("--rolling cannot be combined with --incremental, --decompose or --compare")
+    if args.rolling is not None and not 0 <= args.overlap < args.rolling:
+        parser.error("--overlap must be at least 0 and less than --rolling")
+    if args.work_rules and (args.incremental or args.decompose):
+        parser.error("--work-rules links shifts across days: use it on its own or with --rolling")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    timings = {}
+    with timed(timings, "load"):
+        workers, drivers, workplaces, shifts = load_data()
+    pruning = {"prune": args.prune, "k_nearest": args.k_nearest, "max_distance": args.max_distance,
+               "absences": load_absences()}
+
+    if args.compare or args.sample:
+        workers, drivers, workplaces, shifts = sample_instance(
+            workers, drivers, workplaces, shifts, sizes=args.sample or COMPARE_SAMPLE)
+
+    if args.compare:
+        report = compare_formulations(workers, drivers, workplaces, shifts, args.time_limit, args.match_zones,
+                                      **pruning)
+        print(report.to_string(index=False))
+    else:
+        if args.rolling:
+            # Windows are not fingerprinted: an incremental run after this one solves from scratch
+            fingerprints = {}
+            df_result = optimize_rolling(workers, drivers, workplaces, shifts, args.rolling, args.overlap,
+                                         args.formulation, args.time_limit, match_zones=args.match_zones,
+                                         backend=args.backend, enforce_rules=args.work_rules, timings=timings,
+                                         **pruning)
+        else:
+            previous, state = load_previous() if args.incremental else (None, {})
+            df_result, fingerprints = optimize(workers, drivers, workplaces, shifts, args.formulation,
+                                               args.time_limit, previous=previous, state=state,
+                                               match_zones=args.match_zones, backend=args.backend,
+                                               decompose=args.decompose, processes=args.processes,
+                                               enforce_rules=args.work_rules, timings=timings, **pruning)
+        if df_result is not None and len(df_result):
+            with timed(timings, "write"):
+                df_result.to_csv(RESULT_FILE, index=False)
+                with open(STATE_FILE, "w") as f:
+                    json.dump(fingerprints, f, indent=2)
+            print(f"✅ Optimized assignments saved to {RESULT_FILE} with {len(df_result)} rows")
+        elif df_result is not None:
+            print("⚠️ Solver found a solution but no assignments were made.")
+        print_timings(timings)
+        if df_result is None:
+            # Exit non-zero, so callers do not go on with the previous result still in RESULT_FILE
+            raise SystemExit(f"❌ No schedule written, {RESULT_FILE} is unchanged")
+
 
+if __name__ == "__main__":
+    main()
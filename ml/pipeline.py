@@ -0,0 +1,272 @@
+# ml/pipeline.py
+
+import argparse
+import ast
+import hashlib
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import redirect_stderr, redirect_stdout
+
+import pandas as pd
+
+from storage import csv_path, parquet_path, source_path
+
+OUTPUT_DIR = "data"
+STATE_FILE = f"{OUTPUT_DIR}/.pipeline_state.json"   # input/code key and output hashes of each stage's last run
+REPORT_FILE = f"{OUTPUT_DIR}/pipeline_report.json"
+LOG_DIR = f"{OUTPUT_DIR}/logs"                       # <stage>.log: output of the stage's last run
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+GENERATED = ["workers", "drivers", "workplaces", "shifts", "assignments"]
+
+# Stages in dependency order. A stage reads `tables` (through storage.load(), so the
+# Parquet copy when it is up to date) and `files`, and writes `outputs`; a stage
+# depends on every stage whose outputs it reads.
+STAGES = {
+    "generate": {"script": "generate_all.py", "tables": [], "files": [],
+                 "outputs": [csv_path(name) for name in GENERATED]},
+    # load() only reads a Parquet copy that is newer than its CSV, so a touched CSV means a re-run
+    "convert": {"script": "storage.py", "args": GENERATED, "tables": [], "files": [csv_path(n) for n in GENERATED],
+                "outputs": [parquet_path(name) for name in GENERATED], "newer_than_inputs": True},
+    "eda": {"script": "eda.py", "tables": ["workers", "assignments"], "files": [],
+            "outputs": ["data/workers_clustered.csv", "data/workers_summary.json", "data/plots/workers_clusters.png"]},
+    "predict_absences": {"script": "predict_absences.py", "tables": ["workers", "assignments"], "files": [],
+                         "outputs": ["data/absence_model_logreg.pkl", "data/absence_model_rf.pkl",
+                                     "data/absence_model_rf_compact.npz", "data/absence_metrics.txt"]},
+    "optimize": {"script": "optimize_schedule.py", "tables": ["workers", "drivers", "workplaces", "shifts", "assignments"],
+                 "files": [], "outputs": ["data/optimized_assignments.csv", "data/optimized_assignments_state.json"]},
+    "visualize": {"script": "visualize_schedule.py", "tables": ["workers", "drivers", "workplaces"],
+                  "files": ["data/optimized_assignments.csv"], "outputs": ["data/plots/optimized_routes.png"]},
+}
+
+
+# 1. Hashing. File hashes are memoized by (size, mtime): an untouched file is not read again.
+def file_hash(path, memo):
+    stat = os.stat(path)
+    known = memo.get(path)
+    if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+        return known[2]
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    memo[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+    return memo[path][2]
+
+
+def local_modules(script, seen=None):
+    """The script and every module of this directory it imports, directly or not."""
+    seen = set() if seen is None else seen
+    path = os.path.join(CODE_DIR, script)
+    if script in seen or not os.path.exists(path):
+        return seen
+    seen.add(script)
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    for node in ast.walk(tree):
+        names = [a.name for a in node.names] if isinstance(node, ast.Import) else \
+            [node.module] if isinstance(node, ast.ImportFrom) and node.module and not node.level else []
+        for name in names:
+            local_modules(f"{name.split('.')[0]}.py", seen)
+    return seen
+
+
+def stage_inputs(stage):
+    """name → current path of every input: the file load() would read for tables, then the plain files."""
+    return {**{name: source_path(name) for name in stage["tables"]}, **{path: path for path in stage["files"]}}
+
+
+def stage_key(stage, memo):
+    """Hash of the stage's command, code and inputs, and the per-file hashes it was built from."""
+    parts = {"command": [stage["script"], *stage.get("args", [])]}
+    for module in sorted(local_modules(stage["script"])):
+        parts[f"code:{module}"] = file_hash(os.path.join(CODE_DIR, module), memo)
+    for name, path in stage_inputs(stage).items():
+        parts[f"input:{name}"] = f"{path}:{file_hash(path, memo)}" if os.path.exists(path) else "missing"
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest(), parts
+
+
+def outputs_intact(stage, record, memo):
+    """Every output exists and is unchanged since the stage last wrote it (and is newer than the inputs, if required)."""
+    if not all(os.path.exists(path) and file_hash(path, memo) == record["outputs"].get(path)
+               for path in stage["outputs"]):
+        return False
+    if stage.get("newer_than_inputs"):
+        newest = max((os.path.getmtime(path) for path in stage["files"] if os.path.exists(path)), default=0)
+        return all(os.path.getmtime(path) >= newest for path in stage["outputs"])
+    return True
+
+
+def changed_parts(parts, before):
+    """Short reason for a re-run: which code or inputs differ from the last run."""
+    if before is None:
+        return "first run"
+    changed = [name.split(":", 1)[1] for name, value in parts.items() if before.get(name) != value]
+    return "changed: " + ", ".join(changed) if changed else "outputs missing, modified or out of date"
+
+
+# 2. DAG
+def dependencies(stages):
+    """Stage → stages producing one of its inputs (a table's CSV or Parquet copy, or a file)."""
+    producer = {path: name for name, stage in stages.items() for path in stage["outputs"]}
+    deps = {}
+    for name, stage in stages.items():
+        paths = [p for table in stage["tables"] for p in (csv_path(table), parquet_path(table))] + stage["files"]
+        deps[name] = sorted({producer[p] for p in paths if p in producer and producer[p] != name}, key=list(stages).index)
+    return deps
+
+
+def upstream(targets, deps):
+    """The targets and everything they depend on."""
+    selected, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in selected:
+            selected.add(name)
+            todo.extend(deps[name])
+    return selected
+
+
+def run_stage(name, stage, log_dir=LOG_DIR, in_process=False):
+    """Run one stage's script (its output goes to a log file); returns (exit code, seconds).
+
+    In a subprocess by default. In process, the script's main() is called in this
+    interpreter, which saves the startup and the imports modules share.
+    """
+    os.makedirs(log_dir, exist_ok=True)
+    start = time.perf_counter()
+    with open(os.path.join(log_dir, f"{name}.log"), "w") as log:
+        if in_process:
+            code = 0
+            with redirect_stdout(log), redirect_stderr(log):
+                try:
+                    importlib.import_module(stage["script"][:-3]).main(stage.get("args", []))
+                except SystemExit as error:   # sys.exit(): None, an exit code or a message
+                    if isinstance(error.code, str):
+                        print(error.code, file=log)
+                    code = error.code if isinstance(error.code, int) else int(error.code is not None)
+                except Exception:
+                    traceback.print_exc()
+                    code = 1
+        else:
+            code = subprocess.run([sys.executable, os.path.join(CODE_DIR, stage["script"]), *stage.get("args", [])],
+                                  stdout=log, stderr=subprocess.STDOUT).returncode
+    return code, time.perf_counter() - start
+
+
+def run_pipeline(targets=None, jobs=2, force=(), dry_run=False, in_process=False, stages=STAGES,
+                 state_path=STATE_FILE):
+    """Run the targets (default: every stage) and their upstream stages; returns the report frame.
+
+    A stage is skipped when its code, command and input hashes match its last
+    successful run and its outputs are intact. Stages whose dependencies are
+    done run concurrently, up to `jobs` at a time; in process they run one at a
+    time, since their output is redirected for the whole process.
+    """
+    deps = dependencies(stages)
+    selected = upstream(targets or list(stages), deps)
+    order = [name for name in stages if name in selected]
+    state = {"stages": {}, "files": {}}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    memo = state["files"]
+
+    report, done, running = {}, set(), {}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(1 if in_process else max(1, jobs)) as pool:
+        while len(done) < len(order):
+            for name in order:
+                if in_process and running:   # the running stage owns stdout until it finishes
+                    break
+                if name in done or name in running.values() or not all(d in done for d in deps[name] if d in selected):
+                    continue
+                blocked = [d for d in deps[name] if d in selected and report[d]["Status"] in ("failed", "blocked")]
+                if blocked:
+                    report[name] = {"Stage": name, "Status": "blocked", "Seconds": 0.0, "Reason": f"{blocked[0]} failed"}
+                    done.add(name)
+                    continue
+                stage, record = stages[name], state["stages"].get(name)
+                key, parts = stage_key(stage, memo)
+                upstream_runs = [d for d in deps[name] if d in selected and report[d]["Status"] == "would run"]
+                if name not in force and not upstream_runs and record and record["key"] == key \
+                        and outputs_intact(stage, record, memo):
+                    report[name] = {"Stage": name, "Status": "cached", "Seconds": 0.0, "Reason": "unchanged"}
+                    done.add(name)
+                elif dry_run:
+                    reason = "forced" if name in force else f"{upstream_runs[0]} runs first" if upstream_runs \
+                        else changed_parts(parts, record and record["parts"])
+                    report[name] = {"Stage": name, "Status": "would run", "Seconds": 0.0, "Reason": reason}
+                    done.add(name)
+                else:
+                    reason = "forced" if name in force else changed_parts(parts, record and record["parts"])
+                    report[name] = {"Stage": name, "Status": "running", "Seconds": 0.0, "Reason": reason}
+                    print(f"▶️ {name} ({reason})", flush=True)
+                    running[pool.submit(run_stage, name, stage, LOG_DIR, in_process)] = name
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                name = running.pop(future)
+                code, seconds = future.result()
+                report[name].update(Status="ran" if code == 0 else "failed", Seconds=round(seconds, 2))
+                if code == 0:
+                    # Key again: a stage that reads its own earlier outputs is keyed on what it read
+                    key, parts = stage_key(stages[name], memo)
+                    state["stages"][name] = {"key": key, "parts": parts,
+                                             "outputs": {p: file_hash(p, memo) for p in stages[name]["outputs"]
+                                                         if os.path.exists(p)}}
+                    print(f"✅ {name} done in {seconds:.2f}s", flush=True)
+                else:
+                    state["stages"].pop(name, None)
+                    print(f"❌ {name} failed with exit code {code}, see {LOG_DIR}/{name}.log", flush=True)
+                done.add(name)
+                # Save after every stage, so an interrupted run keeps what finished
+                with open(state_path, "w") as f:
+                    json.dump(state, f, indent=1)
+
+    report = pd.DataFrame([report[name] for name in order])
+    report.attrs["WallSeconds"] = round(time.perf_counter() - start, 2)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the pipeline stages whose code or input data changed.")
+    parser.add_argument("targets", nargs="*", metavar="STAGE",
+                        help=f"Stages to bring up to date, with their upstream stages: {', '.join(STAGES)} (default: all)")
+    parser.add_argument("--jobs", type=int, default=min(2, os.cpu_count()), help="Stages run at the same time")
+    parser.add_argument("--force", nargs="+", choices=list(STAGES), default=[], help="Run these stages regardless")
+    parser.add_argument("--dry-run", action="store_true", help="Only report which stages would run and why")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Call each stage's main() in this process instead of a subprocess (one at a time)")
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.targets) - set(STAGES))
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    report = run_pipeline(args.targets, args.jobs, set(args.force), args.dry_run, args.in_process)
+    print("\n--- Pipeline ---")
+    print(report.to_string(index=False))
+    busy = report["Seconds"].sum()
+    print(f"Wall time {report.attrs['WallSeconds']:.2f}s for {busy:.2f}s of stages, "
+          f"{(report['Status'] == 'cached').sum()} of {len(report)} cached")
+    with open(REPORT_FILE, "w") as f:
+        json.dump({"WallSeconds": report.attrs["WallSeconds"], "Stages": report.to_dict(orient="records")}, f, indent=2)
+    if (report["Status"].isin(["failed", "blocked"])).any():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
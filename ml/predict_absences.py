@@ -1,86 +1,393 @@
 # ml/predict_absences.py
 
+import argparse
+import datetime
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import time
 import pandas as pd
-from sklearn.model_selection import train_test_split
-from sklearn.preprocessing import OneHotEncoder
-from sklearn.linear_model import LogisticRegression
+import numpy as np
+from sklearn.model_selection import StratifiedKFold, train_test_split
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.metrics import classification_report
+from sklearn.metrics import classification_report, log_loss, roc_auc_score, precision_score, recall_score
 import joblib
 import os
 
+from storage import AVAILABILITY, SKILL_POOL, load, source_path
+from absence_scoring import AbsenceFeatures, AbsenceScorer
+from npy_cache import cached
+
 OUTPUT_DIR = "data"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
-
-# 1. Load datasets
-workers = pd.read_csv("data/workers.csv")
-assignments = pd.read_csv("data/assignments.csv")
-
-print("✅ Workers loaded:", workers.shape)
-print("✅ Assignments loaded:", assignments.shape)
-
-# 2. Merge on WorkerID
-data = assignments.merge(workers, on="WorkerID", how="left")
-
-# 3. Prepare target variable
-data["AbsentFlag"] = (data["Status"] == "Absent").astype(int)
-
-# 4. Feature engineering
-features = pd.DataFrame()
-
-# Gender
-features["Gender"] = data["Gender"]
-
-# Availability
-availability_cols = [c for c in data.columns if "Available_" in c]
-features[availability_cols] = data[availability_cols]
-
-# Skills (expand to one-hot)
-skills_expanded = data["Skills"].str.get_dummies(sep=",")
-features = pd.concat([features, skills_expanded], axis=1)
-
-# One-hot encode Gender
-encoder = OneHotEncoder(handle_unknown="ignore", sparse_output=False)
-gender_encoded = encoder.fit_transform(features[["Gender"]])
-gender_df = pd.DataFrame(gender_encoded, columns=encoder.get_feature_names_out(["Gender"]))
-features = pd.concat([features.drop(columns=["Gender"]).reset_index(drop=True),
-                      gender_df], axis=1)
-
-# Train/test split
-X = features
-y = data["AbsentFlag"]
-
-X_train, X_test, y_train, y_test = train_test_split(
-    X, y, test_size=0.2, random_state=42, stratify=y
-)
-
-results = []
-
-# 5. Logistic Regression (balanced)
-logreg = LogisticRegression(max_iter=1000, class_weight="balanced")
-logreg.fit(X_train, y_train)
-y_pred_log = logreg.predict(X_test)
-report_log = classification_report(y_test, y_pred_log, output_dict=True)
-results.append(("Logistic Regression", report_log))
-joblib.dump(logreg, f"{OUTPUT_DIR}/absence_model_logreg.pkl")
-
-# 6. Random Forest
-rf = RandomForestClassifier(n_estimators=100, class_weight="balanced", random_state=42)
-rf.fit(X_train, y_train)
-y_pred_rf = rf.predict(X_test)
-report_rf = classification_report(y_test, y_pred_rf, output_dict=True)
-results.append(("Random Forest", report_rf))
-joblib.dump(rf, f"{OUTPUT_DIR}/absence_model_rf.pkl")
-
-# 7. Print & Save metrics
-metrics_file = os.path.join(OUTPUT_DIR, "absence_metrics.txt")
-with open(metrics_file, "w") as f:
-    for name, report in results:
-        print(f"\n--- {name} ---")
-        print(classification_report(y_test, logreg.predict(X_test) if name=="Logistic Regression" else rf.predict(X_test)))
-        f.write(f"--- {name} ---\n")
-        f.write(classification_report(y_test, logreg.predict(X_test) if name=="Logistic Regression" else rf.predict(X_test)))
-        f.write("\n\n")
-
-print(f"✅ Metrics saved to {metrics_file}")
-print("✅ Models saved: absence_model_logreg.pkl, absence_model_rf.pkl")
+
+# PARAMETERS (incremental mode)
+CHUNK_ROWS = 200_000          # assignments read per chunk
+HOLDOUT_FRACTION = 0.2        # newest rows kept out of training for evaluation...
+HOLDOUT_MAX_ROWS = 100_000    # ...up to this many
+GENDERS = ["Female", "Male"]
+INCREMENTAL_STATE = f"{OUTPUT_DIR}/absence_model_sgd.pkl"
+INCREMENTAL_METRICS = f"{OUTPUT_DIR}/absence_metrics_incremental.json"
+
+
+def load_training_data():
+    # 1. Load datasets
+    workers = load("workers", columns=["WorkerID", "Gender", "Skills", *AVAILABILITY])
+    assignments = load("assignments", columns=["WorkerID", "Status"])
+
+    print("✅ Workers loaded:", workers.shape)
+    print("✅ Assignments loaded:", assignments.shape)
+
+    # 2. Merge on WorkerID
+    data = assignments.merge(workers, on="WorkerID", how="left")
+
+    # 3. Prepare target variable
+    data["AbsentFlag"] = (data["Status"] == "Absent").astype(int)
+    return data
+
+
+def train_batch():
+    data = load_training_data()
+
+    # 4. Feature engineering: availability, skills (one-hot) and Gender (one-hot),
+    # fitted once and saved with each model so scoring builds the same columns
+    features = AbsenceFeatures().fit(data)
+
+    # Train/test split
+    X = features.transform(data)
+    y = data["AbsentFlag"]
+
+    X_train, X_test, y_train, y_test = train_test_split(
+        X, y, test_size=0.2, random_state=42, stratify=y
+    )
+
+    results = []
+
+    # 5. Logistic Regression (balanced)
+    logreg = LogisticRegression(max_iter=1000, class_weight="balanced")
+    timing = fit_and_predict(logreg, X_train, y_train, X_test)
+    results.append(("Logistic Regression", classification_report(y_test, timing.pop("Predictions")), timing))
+    AbsenceScorer(features, logreg).save(f"{OUTPUT_DIR}/absence_model_logreg.pkl")
+
+    # 6. Random Forest
+    rf = RandomForestClassifier(n_estimators=100, class_weight="balanced", random_state=42)
+    timing = fit_and_predict(rf, X_train, y_train, X_test)
+    results.append(("Random Forest", classification_report(y_test, timing.pop("Predictions")), timing))
+    AbsenceScorer(features, rf).save(f"{OUTPUT_DIR}/absence_model_rf.pkl")
+    AbsenceScorer(features, rf).save_compact(f"{OUTPUT_DIR}/absence_model_rf_compact.npz")
+
+    # 7. Print & Save metrics
+    metrics_file = os.path.join(OUTPUT_DIR, "absence_metrics.txt")
+    with open(metrics_file, "w") as f:
+        for name, report, timing in results:
+            times = f"Fit: {timing['FitSeconds']:.3f}s, predict: {timing['PredictSeconds']:.3f}s"
+            print(f"\n--- {name} ---")
+            print(report)
+            print(times)
+            f.write(f"--- {name} ---\n")
+            f.write(report)
+            f.write(f"{times}\n\n")
+
+    print(f"✅ Metrics saved to {metrics_file}")
+    print("✅ Models saved: absence_model_logreg.pkl, absence_model_rf.pkl, absence_model_rf_compact.npz")
+
+
+def fit_and_predict(model, X_train, y_train, X_test):
+    """Fit, predict once, and time both steps."""
+    start = time.perf_counter()
+    model.fit(X_train, y_train)
+    fitted = time.perf_counter()
+    predictions = model.predict(X_test)
+    return {"Predictions": predictions, "FitSeconds": fitted - start,
+            "PredictSeconds": time.perf_counter() - fitted}
+
+
+# ========== INCREMENTAL (OUT-OF-CORE) TRAINING ==========
+def worker_feature_table(workers):
+    """One fixed-width feature row per worker: availability, skills, gender.
+
+    The columns do not depend on the data seen, so chunks can be featurized
+    independently and fed to the same model.
+    """
+    skills = workers["Skills"].astype(str).str.get_dummies(sep=",").reindex(columns=SKILL_POOL, fill_value=0)
+    gender = pd.get_dummies(workers["Gender"].astype(str)).reindex(columns=GENDERS, fill_value=0)
+    table = np.hstack([workers[list(AVAILABILITY)].to_numpy(), skills.to_numpy(), gender.to_numpy()])
+    columns = list(AVAILABILITY) + SKILL_POOL + [f"Gender_{g}" for g in GENDERS]
+    return pd.Index(workers["WorkerID"]), table.astype(np.float32), columns
+
+
+def featurize_chunk(chunk, worker_index, worker_table):
+    """Features and target of an assignments chunk; rows with unknown workers are dropped."""
+    rows = worker_index.get_indexer(chunk["WorkerID"])
+    known = rows >= 0
+    return worker_table[rows[known]], (chunk["Status"].to_numpy()[known] == "Absent").astype(np.int8)
+
+
+def csv_header(path):
+    """Column names and byte length of a CSV's header line."""
+    with open(path, "rb") as f:
+        line = f.readline()
+    return line.decode().rstrip("\r\n").split(","), len(line)
+
+
+def count_rows(path, offset, block=1 << 24):
+    """Complete rows from byte `offset` (a row start) to the end, counted by newlines without parsing."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return sum(chunk.count(b"\n") for chunk in iter(lambda: f.read(block), b""))
+
+
+def file_prefix_hash(path, n_bytes):
+    """Hash of the first bytes of a file: unchanged if the file was only appended to."""
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read(n_bytes)).hexdigest()
+
+
+def iter_rows(path, offset, n_rows, names, chunk_rows=CHUNK_ROWS):
+    """Stream up to n_rows complete rows of a CSV from byte `offset` (all of them if None).
+
+    Yields (chunk, byte offset after the chunk): only the rows read are held in memory.
+    """
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while n_rows is None or n_rows > 0:
+            lines = list(itertools.islice(f, chunk_rows if n_rows is None else min(chunk_rows, n_rows)))
+            if lines and not lines[-1].endswith(b"\n"):   # a row still being appended
+                lines.pop()
+            if not lines:
+                return
+            offset += sum(map(len, lines))
+            n_rows = None if n_rows is None else n_rows - len(lines)
+            yield pd.read_csv(io.BytesIO(b"".join(lines)), header=None, names=names,
+                              usecols=["WorkerID", "Status"]), offset
+
+
+def new_incremental_state():
+    return {
+        "model": SGDClassifier(loss="log_loss", alpha=1e-4, random_state=42),
+        "rows_trained": 0,
+        "offset": None,        # byte offset of the first row not trained on
+        "class_counts": np.zeros(2, dtype=np.int64),
+        "prefix_bytes": 0,
+        "prefix_hash": None,
+        "history": [],
+    }
+
+
+def load_incremental_state(path, assignments_path):
+    if not os.path.exists(path):
+        return new_incremental_state()
+    state = joblib.load(path)
+    if "offset" not in state:
+        print("⚠️ Incremental state has no byte offset (older version), training from scratch.")
+        return new_incremental_state()
+    if state["prefix_bytes"] and file_prefix_hash(assignments_path, state["prefix_bytes"]) != state["prefix_hash"]:
+        print("⚠️ assignments.csv was rewritten since the last run, training from scratch.")
+        return new_incremental_state()
+    return state
+
+
+def evaluate(model, X, y):
+    return probability_metrics(y, model.predict_proba(X)[:, 1])
+
+
+def probability_metrics(y, proba):
+    pred = (proba >= 0.5).astype(int)
+    return {
+        "Rows": int(len(y)),
+        "AbsenceRate": float(y.mean()) if len(y) else None,
+        "LogLoss": float(log_loss(y, proba, labels=[0, 1])) if len(y) else None,
+        "ROC_AUC": float(roc_auc_score(y, proba)) if len(np.unique(y)) == 2 else None,
+        "Precision_Absent": float(precision_score(y, pred, zero_division=0)),
+        "Recall_Absent": float(recall_score(y, pred, zero_division=0)),
+    }
+
+
+def train_incremental(chunk_rows=CHUNK_ROWS, reset=False):
+    """Update the online model with assignment rows not trained on yet.
+
+    The newest rows of assignments.csv form a rolling held-out window: they are
+    only evaluated on, and get trained on in a later run once newer rows push
+    them out of the window.
+    """
+    assignments_path = f"{OUTPUT_DIR}/assignments.csv"
+    state = new_incremental_state() if reset else load_incremental_state(INCREMENTAL_STATE, assignments_path)
+    worker_index, worker_table, _ = worker_feature_table(
+        load("workers", columns=["WorkerID", "Gender", "Skills", *AVAILABILITY]))
+
+    # Only the rows after the stored offset are read, so a run costs what was appended since the last one
+    names, header_bytes = csv_header(assignments_path)
+    start = state["offset"] or header_bytes
+    total = state["rows_trained"] + count_rows(assignments_path, start)
+    holdout = min(HOLDOUT_MAX_ROWS, int(total * HOLDOUT_FRACTION))
+    to_train = max(total - holdout - state["rows_trained"], 0)
+    print(f"✅ {total} assignments: training on rows {state['rows_trained']}..{state['rows_trained'] + to_train}, "
+          f"holding out the newest {total - state['rows_trained'] - to_train}")
+    if not to_train:   # a rerun on the same rows would only repeat the last history entry
+        print(f"♻️ No new rows to train on, {INCREMENTAL_STATE} is unchanged.")
+        return state
+
+    model = state["model"]
+    offset = start
+    for chunk, offset in iter_rows(assignments_path, start, to_train, names, chunk_rows):
+        X, y = featurize_chunk(chunk, worker_index, worker_table)
+        state["class_counts"] += np.bincount(y, minlength=2)
+        # 'balanced' class weights from everything seen so far
+        weights = state["class_counts"].sum() / (2 * np.maximum(state["class_counts"], 1))
+        model.partial_fit(X, y, classes=[0, 1], sample_weight=weights[y])
+    state["rows_trained"] += to_train
+    state["offset"] = offset
+
+    if not hasattr(model, "coef_"):
+        print("⚠️ No rows to train on yet.")
+        return state
+
+    held_out = [featurize_chunk(chunk, worker_index, worker_table)
+                for chunk, _ in iter_rows(assignments_path, state["offset"], None, names, chunk_rows)]
+    if held_out:
+        metrics = evaluate(model, np.vstack([X for X, _ in held_out]), np.concatenate([y for _, y in held_out]))
+        metrics.update({"Timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+                        "RowsTrained": int(state["rows_trained"])})
+        state["history"].append(metrics)
+        print("\n--- SGD (incremental) on held-out window ---")
+        print(json.dumps(metrics, indent=2))
+
+    state["prefix_bytes"] = min(os.path.getsize(assignments_path), 1 << 16)
+    state["prefix_hash"] = file_prefix_hash(assignments_path, state["prefix_bytes"])
+    joblib.dump(state, INCREMENTAL_STATE)
+    with open(INCREMENTAL_METRICS, "w") as f:
+        json.dump(state["history"], f, indent=2)
+    print(f"✅ Model state saved to {INCREMENTAL_STATE}, metrics history to {INCREMENTAL_METRICS}")
+    return state
+
+
+# ========== MODEL SELECTION (CROSS-VALIDATED GRID) ==========
+FOLDS = 5
+SELECTION_RESULTS = f"{OUTPUT_DIR}/absence_model_selection.json"
+MODEL_FAMILIES = {
+    "logreg": lambda **params: LogisticRegression(max_iter=1000, class_weight="balanced", **params),
+    # One core per fit: the pool already runs one fit per core
+    "rf": lambda **params: RandomForestClassifier(class_weight="balanced", random_state=42, n_jobs=1, **params),
+}
+PARAM_GRID = {
+    "logreg": [{"C": c} for c in (0.01, 0.1, 1.0, 10.0)],
+    "rf": [{"n_estimators": n, "max_depth": depth, "min_samples_leaf": leaf}
+           for n in (100, 300) for depth in (None, 10) for leaf in (1, 5)],
+}
+
+
+def input_hash(*names):
+    """Hash of the files the tables are loaded from, identifying a feature matrix on disk."""
+    digest = hashlib.sha1()
+    for name in names:
+        with open(source_path(name), "rb") as f:
+            for block in iter(lambda: f.read(1 << 24), b""):
+                digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def build_feature_matrix():
+    data = load_training_data()
+    X = AbsenceFeatures().fit(data).transform(data)
+    return X, data["AbsentFlag"].to_numpy(dtype=np.int8)
+
+
+def feature_matrix():
+    """(X, y) for all assignments, memory-mapped from data/cache/ when the inputs are unchanged."""
+    return cached("absence_features", lambda inputs: build_feature_matrix(), outputs=2,
+                  inputs=input_hash("workers", "assignments"))
+
+
+# Set in each pool process by init_fold_worker, so tasks only carry a few ids
+_X = _y = _folds = None
+
+
+def init_fold_worker(X, y, n_folds):
+    global _X, _y, _folds
+    _X, _y = X, y
+    _folds = list(StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=42).split(X, y))
+
+
+def fit_fold(task):
+    """Fit one (configuration, fold) pair; returns its out-of-fold probabilities and timings."""
+    config, family, params, fold = task
+    train, test = _folds[fold]
+    model = MODEL_FAMILIES[family](**params)
+    start = time.perf_counter()
+    model.fit(_X[train], _y[train])
+    fitted = time.perf_counter()
+    proba = model.predict_proba(_X[test])[:, 1]
+    return config, test, proba, fitted - start, time.perf_counter() - fitted
+
+
+def select_models(n_folds=FOLDS, processes=None):
+    """Stratified k-fold CV of every PARAM_GRID configuration, one (config, fold) fit per pool task.
+
+    Each configuration is scored once on its pooled out-of-fold probabilities.
+    """
+    start = time.perf_counter()
+    X, y = feature_matrix()
+    print(f"✅ Feature matrix {X.shape} ready in {time.perf_counter() - start:.2f}s")
+
+    configs = [(family, params) for family, grid in PARAM_GRID.items() for params in grid]
+    tasks = [(i, family, params, fold) for i, (family, params) in enumerate(configs) for fold in range(n_folds)]
+    out_of_fold = np.zeros((len(configs), len(y)), dtype=np.float64)
+    fit_seconds = np.zeros(len(configs))
+    predict_seconds = np.zeros(len(configs))
+
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes, initializer=init_fold_worker, initargs=(X, y, n_folds)) as pool:
+        for config, test, proba, fit_time, predict_time in pool.imap_unordered(fit_fold, tasks):
+            out_of_fold[config, test] = proba
+            fit_seconds[config] += fit_time
+            predict_seconds[config] += predict_time
+    print(f"✅ {len(tasks)} fits ({len(configs)} configurations x {n_folds} folds) "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    results = []
+    for i, (family, params) in enumerate(configs):
+        results.append({"Model": family, "Params": params, **probability_metrics(y, out_of_fold[i]),
+                        "FitSeconds": round(fit_seconds[i], 3), "PredictSeconds": round(predict_seconds[i], 3)})
+    results.sort(key=lambda r: (r["Model"], -(r["ROC_AUC"] or 0)))
+
+    with open(SELECTION_RESULTS, "w") as f:
+        json.dump({"Folds": n_folds, "Rows": int(len(y)), "Results": results}, f, indent=2)
+    table = pd.DataFrame(results)
+    table["Params"] = table["Params"].map(lambda p: ", ".join(f"{k}={v}" for k, v in p.items()))
+    print("\n--- Model selection (out-of-fold) ---")
+    print(table.drop(columns=["Rows", "AbsenceRate"]).to_string(index=False, float_format="%.3f"))
+    for family in PARAM_GRID:
+        best = next(r for r in results if r["Model"] == family)
+        print(f"Best {family}: {best['Params']} (ROC AUC {best['ROC_AUC'] or float('nan'):.3f})")
+    print(f"✅ Results saved to {SELECTION_RESULTS}")
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Train absence prediction models.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Stream only new assignments into an online model instead of retraining")
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS, help="Assignments per chunk (incremental)")
+    parser.add_argument("--reset", action="store_true", help="Discard the incremental state and start over")
+    parser.add_argument("--select", action="store_true",
+                        help="Cross-validate the PARAM_GRID configurations instead of training the default models")
+    parser.add_argument("--folds", type=int, default=FOLDS, help="Stratified folds for --select")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Pool size for --select")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    if args.incremental:
+        train_incremental(args.chunk_rows, args.reset)
+    elif args.select:
+        select_models(args.folds, args.processes)
+    else:
+        train_batch()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+# ml/repair_service.py
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+import pandas as pd
+
+from storage import ZONES, csv_path, load
+from candidates import workplace_skill_masks
+from distances import worker_workplace_distances
+from optimize_schedule import (MAX_CONSECUTIVE_DAYS, MIN_REST_HOURS, OUTPUT_DIR, RESULT_FILE, load_data, shift_clock,
+                               solution_indices)
+from spatial import zone_codes
+
+ASSIGNMENTS_FILE = csv_path("assignments")   # absences and replacements are appended here
+LOG_DIR = f"{OUTPUT_DIR}/logs"
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# PARAMETERS
+HOST = "127.0.0.1"
+PORT = 8070
+SCAN_BLOCK = 1024         # closest workers sorted per workplace; a scan that runs out looks 4x further
+MAX_DISTANCE = None       # km; no replacement further than this from the workplace
+REPAIR_PREFIX = "R"       # AssignmentID prefix of the rows this service appends
+REPAIR_ID_WIDTH = 6
+
+# Same-day repair: when a worker calls in absent, their seat in the shift goes to the
+# nearest worker who is available that day, has a skill the workplace uses, is not
+# already in the shift or absent from it (and, with --work-rules, keeps their rest and
+# consecutive-day limits). The replacement rides with a driver already on a run in the
+# shift with a free seat, normally the absent worker's. Everything is read once and
+# indexed in memory; a repair touches a few thousand workers at most.
+
+
+# 1. In-memory schedule
+def load_assignments():
+    """assignments.csv: the optimizer's absences, plus this service's repair rows (IDs starting REPAIR_PREFIX)."""
+    return load("assignments", columns=["AssignmentID", "WorkerID", "DriverID", "WorkplaceID", "ShiftID", "Status"])
+
+
+def repair_rows(assignments):
+    return assignments[assignments["AssignmentID"].str.startswith(REPAIR_PREFIX)]
+
+
+def next_repair_number(repairs):
+    """One past the highest REPAIR_PREFIX number in use, so new IDs never collide with gaps or edits."""
+    numbers = pd.to_numeric(repairs["AssignmentID"].str[len(REPAIR_PREFIX):], errors="coerce")
+    return int(numbers.max()) + 1 if numbers.notna().any() else 1
+
+
+class RepairService:
+    """The current schedule with its indexes by shift, driver and workplace, and the repair heuristic."""
+
+    def __init__(self, match_zones=False, work_rules=False, max_distance=MAX_DISTANCE):
+        self.match_zones, self.work_rules, self.max_distance = match_zones, work_rules, max_distance
+        start = time.perf_counter()
+        self.workers, self.drivers, self.workplaces, self.shifts = load_data()
+        # Workplace-major copy: a workplace's distances to all workers are contiguous
+        self.dist = np.ascontiguousarray(worker_workplace_distances(self.workers, self.workplaces).T)
+        self.worker_index = pd.Index(self.workers["WorkerID"].astype(str))
+        self.shift_index = pd.Index(self.shifts["ShiftID"].astype(str))
+        self.driver_index = pd.Index(self.drivers["DriverID"].astype(str))
+        self.workplace_index = pd.Index(self.workplaces["WorkplaceID"].astype(str))
+        W, S = len(self.workers), len(self.shifts)
+
+        # Per worker: available on each shift's day, skills, zone; per workplace: skills it uses
+        self.available = np.array(self.workers[[f"Available_{day}" for day in self.shifts["Day"]]], dtype=bool).T
+        self.skill_masks = self.workers["SkillMask"].to_numpy()
+        self.needed = workplace_skill_masks(self.workplaces)
+        self.worker_zone = zone_codes(self.workers)
+        self.driver_zone = pd.Categorical(self.drivers["PreferredZone"], categories=list(ZONES)).codes
+        self.capacity = self.drivers["VehicleCapacity"].to_numpy(dtype=np.int64)
+        self.day, self.start, self.end = shift_clock(self.shifts)
+        self.nearest = {}   # workplace → its closest workers, nearest first; extended when a scan runs out
+
+        absences = load_assignments()
+        self.absent = np.zeros((S, W), dtype=bool)
+        wi = self.worker_index.get_indexer(absences["WorkerID"].astype(str))
+        si = self.shift_index.get_indexer(absences["ShiftID"].astype(str))
+        marked = (absences["Status"] == "Absent").to_numpy() & (wi >= 0) & (si >= 0)
+        self.absent[si[marked], wi[marked]] = True
+        self.repairs = repair_rows(absences)
+        self.next_id = next_repair_number(self.repairs)
+        self.stats = Counter()
+        self.millis = []
+        self.load_schedule()
+        for wpi in range(len(self.workplaces)):
+            self.nearest_workers(wpi, SCAN_BLOCK)
+        print(f"✅ {W} workers, {len(self.drivers)} drivers, {len(self.workplaces)} workplaces, {S} shifts and "
+              f"{self.scheduled} assignments indexed in {time.perf_counter() - start:.2f}s")
+
+    def load_schedule(self):
+        """(Re)build the indexes from optimized_assignments.csv, then replay the repairs it predates."""
+        W, D, S = len(self.workers), len(self.drivers), len(self.shifts)
+        self.by_shift = [{} for _ in range(S)]                   # shift → {worker: (driver, workplace)}
+        self.in_shift = np.zeros((S, W), dtype=bool)
+        self.seats = np.zeros((D, S), dtype=np.int64)            # workers per (driver, shift)
+        self.trips = defaultdict(Counter)                        # (shift, workplace) → {driver: workers}
+        self.worker_shifts = defaultdict(set)
+        rows = load("optimized_assignments", columns=["WorkerID", "DriverID", "WorkplaceID", "ShiftID"])
+        for wi, di, wpi, si in solution_indices(rows, self.workers, self.drivers, self.workplaces, self.shifts):
+            self.add(wi, di, wpi, si)
+
+        # A repair is already in the schedule when its absent worker is no longer scheduled:
+        # the optimizer excludes absences, so only repairs newer than its run are replayed
+        repairs = self.repairs
+        absent = (repairs["Status"] == "Absent").to_numpy()
+        wi = self.worker_index.get_indexer(repairs["WorkerID"].astype(str))
+        si = self.shift_index.get_indexer(repairs["ShiftID"].astype(str))
+        di = self.driver_index.get_indexer(repairs["DriverID"].astype(str))
+        wpi = self.workplace_index.get_indexer(repairs["WorkplaceID"].astype(str))
+        known = (wi >= 0) & (si >= 0) & (absent | ((di >= 0) & (wpi >= 0)))
+        if (~known).any():
+            print(f"⚠️ {(~known).sum()} repair rows refer to unknown workers, shifts, drivers or workplaces "
+                  f"and are not replayed: {repairs['AssignmentID'][~known].tolist()[:10]}")
+        wi, si, di, wpi = wi.tolist(), si.tolist(), di.tolist(), wpi.tolist()
+        replayed, pending = 0, None
+        for r in range(len(repairs)):
+            if not known[r]:   # nor the replacement of an absence skipped here
+                pending = None
+            elif absent[r]:
+                pending = self.remove(wi[r], si[r]) if self.in_shift[si[r], wi[r]] else None
+                replayed += pending is not None
+            elif pending is not None and not self.in_shift[si[r], wi[r]]:
+                self.add(wi[r], di[r], wpi[r], si[r])
+                pending = None
+        if replayed:
+            print(f"♻️ {replayed} repairs newer than {RESULT_FILE} replayed")
+
+    @property
+    def scheduled(self):
+        return int(self.in_shift.sum())
+
+    def add(self, wi, di, wpi, si):
+        self.by_shift[si][wi] = (di, wpi)
+        self.in_shift[si, wi] = True
+        self.seats[di, si] += 1
+        self.trips[si, wpi][di] += 1
+        self.worker_shifts[wi].add(si)
+
+    def remove(self, wi, si):
+        """Take a worker out of a shift; returns their (driver, workplace)."""
+        di, wpi = self.by_shift[si].pop(wi)
+        self.in_shift[si, wi] = False
+        self.seats[di, si] -= 1
+        self.trips[si, wpi][di] -= 1
+        if not self.trips[si, wpi][di]:
+            del self.trips[si, wpi][di]
+        self.worker_shifts[wi].discard(si)
+        return di, wpi
+
+    # 2. Repair
+    def nearest_workers(self, wpi, count):
+        """The `count` workers closest to a workplace, nearest first."""
+        count = min(count, self.dist.shape[1])
+        if len(self.nearest.get(wpi, ())) < count:
+            column = self.dist[wpi]
+            closest = np.argpartition(column, count - 1)[:count] if count < len(column) else np.arange(count)
+            self.nearest[wpi] = closest[np.argsort(column[closest], kind="stable")].astype(np.int32)
+        return self.nearest[wpi][:count]
+
+    def keeps_rules(self, wi, si):
+        """The worker keeps MIN_REST_HOURS around the shift and at most MAX_CONSECUTIVE_DAYS in a row."""
+        shifts = self.worker_shifts[wi]
+        if any(self.start[si] < self.end[t] + MIN_REST_HOURS and self.start[t] < self.end[si] + MIN_REST_HOURS
+               for t in shifts):
+            return False
+        days = {self.day[t] for t in shifts}
+        before = next(n for n in range(len(days) + 1) if self.day[si] - n - 1 not in days)
+        after = next(n for n in range(len(days) + 1) if self.day[si] + n + 1 not in days)
+        return before + 1 + after <= MAX_CONSECUTIVE_DAYS
+
+    def replacement(self, si, wpi):
+        """Nearest eligible worker for a seat at workplace wpi in shift si, or None."""
+        column, first, count = self.dist[wpi], 0, SCAN_BLOCK
+        while first < len(column):
+            block = self.nearest_workers(wpi, count)[first:]
+            first, count = count, count * 4
+            if self.max_distance is not None and column[block[0]] > self.max_distance:
+                return None
+            eligible = block[self.available[si, block] & ((self.skill_masks[block] & self.needed[wpi]) != 0)
+                             & ~self.in_shift[si, block] & ~self.absent[si, block]]
+            for wi in eligible:
+                if self.max_distance is not None and column[wi] > self.max_distance:
+                    return None
+                if not self.work_rules or self.keeps_rules(wi, si):
+                    return int(wi)
+        return None
+
+    def driver_for(self, wi, si, wpi, freed):
+        """A driver already on a run in the shift with a free seat; the absent worker's always has one.
+
+        Preferred, in order: one of the worker's zone (with --match-zones), one already going to
+        the workplace, the absent worker's driver.
+        """
+        options = np.union1d(np.flatnonzero((self.seats[:, si] > 0) & (self.seats[:, si] < self.capacity)), [freed])
+        going = np.isin(options, list(self.trips[si, wpi]))
+        other_zone = self.driver_zone[options] != self.worker_zone[wi] if self.match_zones \
+            else np.zeros(len(options), dtype=bool)
+        return int(options[np.lexsort((options != freed, ~going, other_zone))[0]])
+
+    def absence(self, worker_id, shift_id):
+        """Mark a worker absent from a shift and fill their seat; returns the response payload."""
+        start = time.perf_counter()
+        wi, si = self.worker_index.get_indexer([worker_id])[0], self.shift_index.get_indexer([shift_id])[0]
+        if wi < 0 or si < 0:
+            raise KeyError(f"Unknown {'WorkerID' if wi < 0 else 'ShiftID'}: {worker_id if wi < 0 else shift_id}")
+        result = {"WorkerID": worker_id, "ShiftID": shift_id}
+        if self.absent[si, wi]:
+            self.stats["duplicate"] += 1
+            return {**result, "Status": "already absent"}
+
+        self.absent[si, wi] = True
+        if not self.in_shift[si, wi]:
+            self.append([(worker_id, "", "", shift_id, "Absent")])
+            self.stats["not scheduled"] += 1
+            return {**result, "Status": "not scheduled", "Millis": self.elapsed(start)}
+
+        freed, wpi = self.remove(wi, si)
+        rows = [(worker_id, self.driver_index[freed], self.workplace_index[wpi], shift_id, "Absent")]
+        new = self.replacement(si, wpi)
+        if new is None:
+            status = "unfilled"
+            result["ShiftWorkers"] = len(self.by_shift[si])
+        else:
+            di = self.driver_for(new, si, wpi, freed)
+            self.add(new, di, wpi, si)
+            status = "replaced"
+            rows.append((self.worker_index[new], self.driver_index[di], rows[0][2], shift_id, "Assigned"))
+            result["Replacement"] = {"WorkerID": rows[1][0], "DriverID": rows[1][1], "WorkplaceID": rows[1][2],
+                                     "Distance": round(float(self.dist[wpi, new]), 3)}
+        self.append(rows)
+        self.stats[status] += 1
+        return {**result, "Status": status, "Millis": self.elapsed(start)}
+
+    def elapsed(self, start):
+        self.millis.append((time.perf_counter() - start) * 1000)
+        return round(self.millis[-1], 3)
+
+    def append(self, rows):
+        """Append rows to assignments.csv, where the optimizer reads absences from."""
+        records = []
+        for row in rows:
+            records.append([f"{REPAIR_PREFIX}{self.next_id:0{REPAIR_ID_WIDTH}d}", *row])
+            self.next_id += 1
+        with open(ASSIGNMENTS_FILE, "a", newline="") as f:
+            csv.writer(f, lineterminator="\n").writerows(records)
+
+    def roster(self, shift_id):
+        si = self.shift_index.get_indexer([shift_id])[0]
+        if si < 0:
+            raise KeyError(f"Unknown ShiftID: {shift_id}")
+        return {"ShiftID": shift_id, "Assignments": [
+            {"WorkerID": self.worker_index[wi], "DriverID": self.driver_index[di],
+             "WorkplaceID": self.workplace_index[wpi], "Distance": round(float(self.dist[wpi, wi]), 3)}
+            for wi, (di, wpi) in sorted(self.by_shift[si].items())]}
+
+    def status(self):
+        millis = np.array(self.millis or [0.0])
+        return {"Scheduled": self.scheduled, "Events": dict(self.stats),
+                "MedianMillis": round(float(np.median(millis)), 3), "MaxMillis": round(float(millis.max()), 3),
+                "EmptyShifts": self.shift_index[self.in_shift.sum(axis=1) == 0].tolist()}
+
+
+# 3. Background re-optimization: the service keeps answering; the result replaces the
+# schedule when the run ends, and repairs made meanwhile are replayed onto it
+async def reoptimize(service, args):
+    """Run the optimizer and load its result; returns the outcome reported by /status."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    start = time.perf_counter()
+    written = os.path.getmtime(RESULT_FILE)
+    with open(f"{LOG_DIR}/reoptimize.log", "w") as log:
+        process = await asyncio.create_subprocess_exec(sys.executable, os.path.join(CODE_DIR, "optimize_schedule.py"),
+                                                       *args, stdout=log, stderr=asyncio.subprocess.STDOUT)
+        code = await process.wait()
+    seconds = round(time.perf_counter() - start, 1)
+    # A run that writes nothing leaves the old result in place: only a newer file is a new schedule
+    if code != 0 or os.path.getmtime(RESULT_FILE) <= written:
+        error = f"exit code {code}" if code != 0 else f"{RESULT_FILE} was not rewritten"
+        print(f"❌ Re-optimization failed ({error}), see {LOG_DIR}/reoptimize.log", flush=True)
+        return {"Status": "failed", "Error": error, "Seconds": seconds, "Log": f"{LOG_DIR}/reoptimize.log"}
+    service.repairs = repair_rows(load_assignments())
+    service.load_schedule()
+    print(f"✅ Re-optimized schedule loaded after {seconds}s: {service.scheduled} assignments", flush=True)
+    return {"Status": "loaded", "Seconds": seconds, "Scheduled": service.scheduled}
+
+
+# 4. HTTP: POST /absence {"WorkerID", "ShiftID"}, GET /shift/<ShiftID>, GET /status, POST /reoptimize
+REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 409: "Conflict"}
+
+
+async def read_request(reader):
+    """(method, path, headers, body) of the next request on a connection, or None when it closed."""
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    method, path, _ = line.decode("latin-1").split(" ", 2)
+    headers = {}
+    while (header := await reader.readline()).strip():
+        name, _, value = header.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return method, path, headers, body
+
+
+class Server:
+    def __init__(self, service, reoptimize_args):
+        self.service, self.reoptimize_args = service, reoptimize_args
+        self.task = None
+
+    def route(self, method, path, body):
+        if method == "POST" and path == "/absence":
+            try:
+                event = json.loads(body)
+            except ValueError:
+                return 400, {"Error": "Body is not JSON"}
+            if not isinstance(event, dict) or not {"WorkerID", "ShiftID"} <= event.keys():
+                return 400, {"Error": "Expected {\"WorkerID\": ..., \"ShiftID\": ...}"}
+            try:
+                return 200, self.service.absence(str(event["WorkerID"]), str(event["ShiftID"]))
+            except KeyError as error:
+                return 404, {"Error": error.args[0]}
+        if method == "GET" and path.startswith("/shift/"):
+            try:
+                return 200, self.service.roster(path[len("/shift/"):])
+            except KeyError as error:
+                return 404, {"Error": error.args[0]}
+        if method == "GET" and path == "/status":
+            return 200, {**self.service.status(), "Reoptimizing": self.task is not None and not self.task.done(),
+                         "LastReoptimize": self.last_reoptimize()}
+        if method == "POST" and path == "/reoptimize":
+            if self.task is not None and not self.task.done():
+                return 409, {"Error": "A re-optimization is already running"}
+            self.task = asyncio.create_task(reoptimize(self.service, self.reoptimize_args))
+            return 202, {"Status": "started", "Log": f"{LOG_DIR}/reoptimize.log"}
+        return 404, {"Error": f"No route for {method} {path}"}
+
+    def last_reoptimize(self):
+        """Outcome of the last finished re-optimization, or None."""
+        if self.task is None or not self.task.done():
+            return None
+        if self.task.exception() is not None:
+            return {"Status": "failed", "Error": repr(self.task.exception())}
+        return self.task.result()
+
+    async def handle(self, reader, writer):
+        try:
+            while request := await read_request(reader):
+                method, path, headers, body = request
+                status, payload = self.route(method, path, body)
+                if payload.get("Status") in ("replaced", "unfilled"):
+                    replacement = payload.get("Replacement", {}).get("WorkerID", "nobody")
+                    print(f"♻️ {payload['WorkerID']} absent from {payload['ShiftID']} → {replacement} "
+                          f"in {payload['Millis']:.2f} ms", flush=True)
+                data = json.dumps(payload).encode()
+                writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Type: application/json\r\n"
+                             f"Content-Length: {len(data)}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(server, host, port):
+    listener = await asyncio.start_server(server.handle, host, port)
+    print(f"✅ Absence repair service listening on http://{host}:{port}", flush=True)
+    async with listener:
+        await listener.serve_forever()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve same-day repairs of the optimized schedule over HTTP.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--match-zones", action="store_true",
+                        help="Prefer drivers whose PreferredZone is the replacement's zone")
+    parser.add_argument("--work-rules", action="store_true",
+                        help=f"Only pick replacements that keep {MIN_REST_HOURS}h rest and at most "
+                             f"{MAX_CONSECUTIVE_DAYS} days in a row")
+    parser.add_argument("--max-distance", type=float, default=MAX_DISTANCE,
+                        help="Leave the seat empty rather than pick a worker further than this many km")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.exists(RESULT_FILE):
+        raise SystemExit(f"❌ No schedule to repair: run optimize_schedule.py to write {RESULT_FILE}")
+    service = RepairService(args.match_zones, args.work_rules, args.max_distance)
+    reoptimize_args = [flag for flag, on in (("--match-zones", args.match_zones), ("--work-rules", args.work_rules))
+                       if on]
+    try:
+        asyncio.run(serve(Server(service, reoptimize_args), args.host, args.port))
+    except KeyboardInterrupt:
+        print(f"\n✅ Stopped: {service.status()['Events']}")
+
+
+if __name__ == "__main__":
+    main()
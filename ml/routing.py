@@ -0,0 +1,373 @@
+# ml/routing.py
+
+import argparse
+import multiprocessing
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from ortools.constraint_solver import pywrapcp, routing_enums_pb2
+
+from storage import ZONES, csv_path, load
+from distances import chord_sq_to_km, coordinates, haversine_matrix, unit_vectors
+from spatial import pickup_neighbors
+
+OUTPUT_DIR = "data"
+ROUTES_FILE = f"{OUTPUT_DIR}/driver_routes.csv"
+
+# PARAMETERS
+SPEED_KMH = 30            # average urban driving speed
+STOP_MINUTES = 2          # per pickup
+ROUTE_TIME_LIMIT = 0.0    # seconds of guided local search per load; 0 stops at the first local optimum
+DISTANCE_SCALE = 1000     # km → m, the routing solver only accepts integer costs
+PICKUP_NEIGHBORS = 16     # nearest other workers cached per worker, the pickup-to-pickup distances
+
+
+# 1. Load datasets
+def load_inputs(source="optimized_assignments"):
+    """Assignments to route (Absent rows dropped) and the tables they refer to."""
+    columns = ["WorkerID", "DriverID", "WorkplaceID", "ShiftID"]
+    assignments = load(source, columns=columns + (["Status"] if source == "assignments" else []))
+    if "Status" in assignments:
+        assignments = assignments[assignments["Status"] != "Absent"]
+    workers = load("workers", columns=["WorkerID", "Latitude", "Longitude"])
+    drivers = load("drivers", columns=["DriverID", "VehicleCapacity", "MaxHoursPerDay", "PreferredZone"])
+    workplaces = load("workplaces", columns=["WorkplaceID", "Latitude", "Longitude"])
+    shifts = load("shifts", columns=["ShiftID", "Week", "Day"])
+    print(f"✅ {len(assignments)} assignments to route with {len(drivers)} drivers")
+    return assignments, workers, drivers, workplaces, shifts
+
+
+def driver_depots(drivers):
+    """Where each driver starts: the center of their PreferredZone (positions are not tracked)."""
+    fallback = np.mean(list(ZONES.values()), axis=0)
+    return np.array([ZONES.get(zone, fallback) for zone in drivers["PreferredZone"].astype(str)], dtype=np.float64)
+
+
+def assignment_indices(assignments, workers, drivers, workplaces, shifts):
+    """Assignments as int index columns; rows with an unknown worker, workplace or shift are dropped."""
+    rows = pd.DataFrame({
+        "worker": pd.Index(workers["WorkerID"]).get_indexer(assignments["WorkerID"]),
+        "driver": pd.Index(drivers["DriverID"]).get_indexer(assignments["DriverID"]),   # -1: no preference
+        "workplace": pd.Index(workplaces["WorkplaceID"]).get_indexer(assignments["WorkplaceID"]),
+        "shift": pd.Index(shifts["ShiftID"]).get_indexer(assignments["ShiftID"]),
+    })
+    known = (rows[["worker", "workplace", "shift"]] >= 0).all(axis=1)
+    if (~known).any():
+        print(f"⚠️ {(~known).sum()} assignments refer to unknown workers, workplaces or shifts and are skipped")
+    return rows[known].reset_index(drop=True)
+
+
+# 2. Cluster first: vehicles and loads per (shift, workplace)
+def allocate_vehicles(group, site, depot_km, free, remaining, capacity):
+    """Drivers for one workplace group, until their capacity covers it.
+
+    Drivers the assignment already chose come first, then the others by distance
+    from their depot. A driver makes one trip per shift and needs at least the
+    drive to the site left in their day; the full route is checked against the
+    hours left once it is sequenced (route_day).
+    """
+    usable = free & (remaining > depot_km[:, site] / SPEED_KMH)
+    chosen = group["driver"][group["driver"] >= 0].value_counts().index.to_numpy()
+    chosen = chosen[usable[chosen]]
+    others = np.flatnonzero(usable)
+    others = others[~np.isin(others, chosen)]
+    order = np.concatenate([chosen, others[np.argsort(depot_km[others, site], kind="stable")]]).astype(np.int64)
+    enough = np.searchsorted(np.cumsum(capacity[order]), len(group)) + 1
+    return order[:enough]
+
+
+def sweep_angles(points, center):
+    """Polar angle of each point around `center`, lon scaled to ground distance."""
+    d_lat = points[:, 0] - center[0]
+    d_lon = (points[:, 1] - center[1]) * np.cos(np.radians(center[0]))
+    return np.arctan2(d_lat, d_lon)
+
+
+def sweep_loads(points, center, depots, capacities):
+    """Split points into one load per vehicle: contiguous angular sectors around `center`.
+
+    Load sizes are balanced in proportion to capacity (never above it), and
+    vehicles get the sectors in the angular order of their depots. Returns one
+    index array into `points` per vehicle, plus the indices left over when the
+    capacity is short.
+    """
+    n = len(points)
+    angles = sweep_angles(points, center)
+    order = np.argsort(angles, kind="stable")
+    if n > 1:
+        # Start the sweep after the widest empty gap, so no sector wraps around a hole
+        gaps = np.diff(np.append(angles[order], angles[order[0]] + 2 * np.pi))
+        order = np.roll(order, -(np.argmax(gaps) + 1))
+    served = min(n, int(capacities.sum()))
+    sizes = np.minimum(capacities, np.floor(capacities * served / max(capacities.sum(), 1))).astype(int)
+    for i in np.argsort(capacities - sizes)[::-1][:served - sizes.sum()]:
+        sizes[i] += 1
+    vehicle_order = np.argsort(sweep_angles(depots, center), kind="stable")
+    bounds = np.concatenate([[0], np.cumsum(sizes[vehicle_order])])
+    loads = [None] * len(capacities)
+    for rank, vehicle in enumerate(vehicle_order):
+        loads[vehicle] = order[bounds[rank]:bounds[rank + 1]]
+    return loads, order[served:]
+
+
+# 3. Route second: pickup sequence per load
+def load_km(load, points, neighbors, neighbor_km):
+    """(len(load) x len(load)) km between a load's workers.
+
+    Pairs in the cached nearest-workers table are looked up; only the others
+    are computed from `points`.
+    """
+    km = np.full((len(load), len(load)), np.nan, dtype=np.float32)
+    if neighbors.shape[1]:
+        match = neighbors[load][:, :, None] == load[None, None, :]
+        found = np.take_along_axis(np.asarray(neighbor_km[load]), match.argmax(axis=1), axis=1)
+        km = np.where(match.any(axis=1), found, km)
+    km = np.fmin(km, km.T)   # a pair is often among the neighbors of only one of the two
+    np.fill_diagonal(km, 0)
+    i, j = np.nonzero(np.isnan(km))
+    vectors = unit_vectors(points[load])
+    km[i, j] = chord_sq_to_km(((vectors[i] - vectors[j]) ** 2).sum(axis=1))
+    return km
+
+
+def sequence_pickups(start, pickups, end, time_limit=ROUTE_TIME_LIMIT, pickup_km=None):
+    """Order visiting all `pickups` on a path from `start` to `end` with the least km.
+
+    Cheapest-arc construction followed by local search, run by the OR-Tools
+    routing solver. pickup_km, the km between the pickups (see load_km), saves
+    computing them again. Returns (pickup order, km of each leg).
+    """
+    points = np.vstack([start, pickups, end])
+    if pickup_km is None:
+        km = haversine_matrix(points, points)
+    else:
+        ends = [0, len(points) - 1]
+        km = np.empty((len(points), len(points)), dtype=np.float32)
+        km[ends] = haversine_matrix(points[ends], points)
+        km[:, ends] = km[ends].T
+        km[1:-1, 1:-1] = pickup_km
+    dist = np.rint(km * DISTANCE_SCALE).astype(np.int64)
+    order = np.arange(len(pickups))
+    if len(pickups) > 1:
+        manager = pywrapcp.RoutingIndexManager(len(points), 1, [0], [len(points) - 1])
+        routing = pywrapcp.RoutingModel(manager)
+        routing.SetArcCostEvaluatorOfAllVehicles(routing.RegisterTransitMatrix(dist.tolist()))
+        params = pywrapcp.DefaultRoutingSearchParameters()
+        params.first_solution_strategy = routing_enums_pb2.FirstSolutionStrategy.PATH_CHEAPEST_ARC
+        if time_limit:
+            params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GUIDED_LOCAL_SEARCH
+            params.time_limit.FromMilliseconds(int(time_limit * 1000))
+        else:
+            params.local_search_metaheuristic = routing_enums_pb2.LocalSearchMetaheuristic.GREEDY_DESCENT
+        solution = routing.SolveWithParameters(params)
+        if solution:
+            visits, index = [], solution.Value(routing.NextVar(routing.Start(0)))
+            while not routing.IsEnd(index):
+                visits.append(manager.IndexToNode(index) - 1)
+                index = solution.Value(routing.NextVar(index))
+            order = np.array(visits)
+    path = np.concatenate([[0], order + 1, [len(points) - 1]])
+    return order, dist[path[:-1], path[1:]] / DISTANCE_SCALE
+
+
+# Set in each pool process by init_routing_worker, so day tasks only carry their assignment rows
+_worker_points = _site_points = _depots = _depot_km = _capacity = _max_hours = _neighbors = None
+_time_limit = ROUTE_TIME_LIMIT
+
+
+def init_routing_worker(worker_points, site_points, depots, capacity, max_hours, time_limit, neighbors):
+    global _worker_points, _site_points, _depots, _depot_km, _capacity, _max_hours, _time_limit, _neighbors
+    _worker_points, _site_points, _depots, _neighbors = worker_points, site_points, depots, neighbors
+    _depot_km = haversine_matrix(depots, site_points)
+    _capacity, _max_hours, _time_limit = capacity, max_hours, time_limit
+
+
+def plan_route(di, site, workers):
+    """Pickup order, leg km and hours of driver di collecting `workers` for workplace `site`."""
+    order, legs = sequence_pickups(_depots[di], _worker_points[workers], _site_points[site], _time_limit,
+                                   load_km(workers, _worker_points, *_neighbors))
+    return order, legs, legs.sum() / SPEED_KMH + len(workers) * STOP_MINUTES / 60
+
+
+def route_day(rows):
+    """Routes for every shift of one day, in shift order.
+
+    The day's shifts share each driver's MaxHoursPerDay, so a day is the unit
+    solved by one pool task. Each (driver, workplace) group of the assignments
+    is routed as assigned; only groups their driver cannot take (no known
+    driver, a second trip in the shift, over capacity or over MaxHoursPerDay)
+    are re-allocated to other drivers, cluster first. Returns (routes, unserved
+    (worker, shift) pairs); a route is (driver, shift, workplace, worker
+    indices in pickup order, leg km, hours).
+    """
+    remaining = _max_hours.astype(np.float64)
+    routes, unserved = [], []
+    for si, in_shift in rows.groupby("shift", sort=True):
+        free = np.ones(len(remaining), dtype=bool)
+        spilled = [in_shift[in_shift["driver"] < 0]]
+        assigned = in_shift[in_shift["driver"] >= 0].groupby(["driver", "workplace"])
+        for (di, site), group in sorted(assigned, key=lambda item: -len(item[1])):
+            workers = group["worker"].to_numpy()
+            if free[di] and len(workers) <= _capacity[di]:
+                order, legs, hours = plan_route(di, site, workers)
+                if hours <= remaining[di]:
+                    remaining[di] -= hours
+                    free[di] = False
+                    routes.append((int(di), int(si), int(site), workers[order], legs, hours))
+                    continue
+            spilled.append(group)
+
+        for site, group in sorted(pd.concat(spilled).groupby("workplace"), key=lambda item: -len(item[1])):
+            untried = free.copy()
+            while len(group):
+                vehicles = allocate_vehicles(group, site, _depot_km, untried, remaining, _capacity)
+                workers = group["worker"].to_numpy()
+                loads, left_over = sweep_loads(_worker_points[workers], _site_points[site], _depots[vehicles],
+                                               _capacity[vehicles])
+                unserved.extend((int(wi), int(si)) for wi in workers[left_over])
+                too_long = []
+                for di, load in zip(vehicles, loads):
+                    untried[di] = False
+                    if not len(load):
+                        continue
+                    order, legs, hours = plan_route(di, site, workers[load])
+                    if hours > remaining[di]:   # over MaxHoursPerDay: the load goes to the next vehicles
+                        too_long.append(load)
+                        continue
+                    remaining[di] -= hours
+                    free[di] = False
+                    routes.append((int(di), int(si), int(site), workers[load][order], legs, hours))
+                group = group.iloc[np.concatenate(too_long)] if too_long else group.iloc[:0]
+    return routes, unserved
+
+
+def plan_routes(assignments, workers, drivers, workplaces, shifts, processes=None, time_limit=ROUTE_TIME_LIMIT):
+    """Ordered stop list per driver per shift; returns (routes DataFrame, unserved WorkerID/ShiftID pairs)."""
+    rows = assignment_indices(assignments, workers, drivers, workplaces, shifts)
+    day_of_shift = shifts.groupby(["Week", "Day"], sort=False, observed=True).ngroup().to_numpy()
+    days = [group for _, group in rows.groupby(day_of_shift[rows["shift"].to_numpy()])]
+
+    depots = driver_depots(drivers)
+    init_args = (coordinates(workers), coordinates(workplaces), depots,
+                 drivers["VehicleCapacity"].to_numpy(dtype=np.int64),
+                 drivers["MaxHoursPerDay"].to_numpy(dtype=np.float64), time_limit,
+                 pickup_neighbors(workers, PICKUP_NEIGHBORS))
+    with multiprocessing.Pool(processes, initializer=init_routing_worker, initargs=init_args) as pool:
+        results = pool.map(route_day, days)
+
+    records = [route for routes, _ in results for route in routes]
+    left_over = np.array([pair for _, pairs in results for pair in pairs], dtype=np.int64).reshape(-1, 2)
+    unserved = pd.DataFrame({"WorkerID": workers["WorkerID"].to_numpy()[left_over[:, 0]],
+                             "ShiftID": shifts["ShiftID"].to_numpy()[left_over[:, 1]]})
+    return stop_list(records, workers, drivers, workplaces, shifts, depots), unserved
+
+
+def reassigned(routes, assignments):
+    """Routed pickups whose driver is not the assignment's DriverID (WorkerID, ShiftID, DriverID, RoutedDriverID)."""
+    keys = ["WorkerID", "ShiftID"]
+    pickups = routes.loc[routes["Kind"] == "Pickup", keys + ["DriverID"]].rename(columns={"DriverID": "RoutedDriverID"})
+    rows = assignments[keys + ["DriverID"]].astype(str).merge(pickups.astype(str), on=keys)
+    return rows[rows["DriverID"] != rows["RoutedDriverID"]].reset_index(drop=True)
+
+
+def write_back_drivers(changed, source):
+    """Put the routed drivers into the assignments file, so the notifier and the dashboards see the same pairs."""
+    path = csv_path(source)
+    table = pd.read_csv(path, dtype=str, keep_default_na=False)
+    routed = pd.Series(changed["RoutedDriverID"].to_numpy(), index=changed["WorkerID"] + "|" + changed["ShiftID"])
+    key = table["WorkerID"] + "|" + table["ShiftID"]
+    hit = key.isin(routed.index)
+    table.loc[hit, "DriverID"] = key[hit].map(routed)
+    table.to_csv(path, index=False)
+    return path
+
+
+def stop_list(records, workers, drivers, workplaces, shifts, depots):
+    """One row per stop: the driver's start, each pickup in order, then the workplace."""
+    if not records:
+        return pd.DataFrame(columns=["DriverID", "ShiftID", "Stop", "Kind", "WorkerID", "WorkplaceID",
+                                     "Latitude", "Longitude", "LegKm", "CumulativeKm", "RouteHours"])
+    driver, shift, site = (np.array([r[i] for r in records]) for i in range(3))
+    pickups = [r[3] for r in records]
+    hours = np.array([r[5] for r in records])
+    stops = np.array([len(p) + 2 for p in pickups])
+    route = np.repeat(np.arange(len(records)), stops)
+    first = np.concatenate([[0], np.cumsum(stops)[:-1]])
+    stop = np.arange(stops.sum()) - first[route]
+    is_start, is_end = stop == 0, stop == stops[route] - 1
+    pickup = np.full(len(route), -1)
+    pickup[~is_start & ~is_end] = np.concatenate(pickups)
+
+    points = coordinates(workers)[np.maximum(pickup, 0)]
+    points[is_start] = depots[driver]
+    points[is_end] = coordinates(workplaces)[site]
+    legs = np.zeros(len(route))
+    legs[~is_start] = np.concatenate([r[4] for r in records])
+    return pd.DataFrame({
+        "DriverID": drivers["DriverID"].to_numpy()[driver][route],
+        "ShiftID": shifts["ShiftID"].to_numpy()[shift][route],
+        "Stop": stop,
+        "Kind": np.where(is_start, "Start", np.where(is_end, "Dropoff", "Pickup")),
+        "WorkerID": np.where(pickup >= 0, workers["WorkerID"].to_numpy()[np.maximum(pickup, 0)], None),
+        "WorkplaceID": workplaces["WorkplaceID"].to_numpy()[site][route],
+        "Latitude": points[:, 0],
+        "Longitude": points[:, 1],
+        "LegKm": legs.round(3),
+        "CumulativeKm": (np.cumsum(legs) - np.repeat(np.cumsum(legs)[first] - legs[first], stops)).round(3),
+        "RouteHours": hours[route].round(3),
+    })
+
+
+def print_summary(routes, unserved, drivers, shifts):
+    trips = routes[routes["Kind"] == "Dropoff"]
+    print("\n--- Routes ---")
+    print(f"Driver shifts routed : {len(trips)}")
+    print(f"Workers picked up    : {(routes['Kind'] == 'Pickup').sum()}")
+    print(f"Unserved workers     : {len(unserved)}")
+    print(f"Total km             : {trips['CumulativeKm'].sum():.1f}")
+    if len(trips):
+        print(f"Km per route (mean)  : {trips['CumulativeKm'].mean():.2f}")
+        day_hours = trips.merge(shifts[["ShiftID", "Week", "Day"]], on="ShiftID") \
+            .groupby(["DriverID", "Week", "Day"], observed=True)["RouteHours"].sum().reset_index()
+        day_hours = day_hours.merge(drivers[["DriverID", "MaxHoursPerDay"]], on="DriverID")
+        print(f"Max driving per day  : {day_hours['RouteHours'].max():.2f} h "
+              f"(over MaxHoursPerDay: {(day_hours['RouteHours'] > day_hours['MaxHoursPerDay']).sum()})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Group assigned workers into vehicle loads and order the pickups.")
+    parser.add_argument("--input", choices=["optimized_assignments", "assignments"], default="optimized_assignments",
+                        help="Assignments to route")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Pool size (one task per day)")
+    parser.add_argument("--route-time-limit", type=float, default=ROUTE_TIME_LIMIT,
+                        help="Seconds of guided local search per load (0: greedy descent only)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    assignments, workers, drivers, workplaces, shifts = load_inputs(args.input)
+
+    start = time.perf_counter()
+    routes, unserved = plan_routes(assignments, workers, drivers, workplaces, shifts, args.processes,
+                                   args.route_time_limit)
+    print(f"✅ Routes planned in {time.perf_counter() - start:.2f}s")
+    print_summary(routes, unserved, drivers, shifts)
+
+    routes.to_csv(ROUTES_FILE, index=False)
+    print(f"✅ {routes['DriverID'].nunique()} drivers' stop lists saved to {ROUTES_FILE}")
+    changed = reassigned(routes, assignments)
+    if len(changed) and args.input == "optimized_assignments":
+        path = write_back_drivers(changed, args.input)
+        print(f"♻️ {len(changed)} workers could not ride with their assigned driver, DriverID updated in {path}")
+    elif len(changed):
+        print(f"♻️ {len(changed)} workers ride with another driver than in {args.input}")
+    if len(unserved):
+        print(f"⚠️ Not enough vehicle capacity for {len(unserved)} workers, e.g. {unserved.head(3).values.tolist()}")
+
+
+if __name__ == "__main__":
+    main()
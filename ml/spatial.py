@@ -0,0 +1,142 @@
+# ml/spatial.py
+
+import argparse
+import os
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+from storage import ZONES, load
+from npy_cache import CACHE_DIR, cached
+from distances import EARTH_RADIUS_KM, chord_sq_to_km, coordinates, unit_vectors
+
+OUTPUT_DIR = "data"
+ZONE_FILE = f"{OUTPUT_DIR}/worker_zones.csv"
+
+
+def km_to_chord(km):
+    """Great-circle distance in km → straight-line distance on the unit sphere."""
+    return 2 * np.sin(np.minimum(km / (2 * EARTH_RADIUS_KM), np.pi / 2))
+
+
+class SpatialIndex:
+    """KD-tree over lat/lon points for batched k-nearest and radius queries.
+
+    Points are stored as unit vectors, where straight-line order equals
+    great-circle order, so results match distances.haversine_matrix().
+    """
+
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=np.float64)
+        self.tree = cKDTree(unit_vectors(self.points))
+
+    @classmethod
+    def from_frame(cls, df):
+        return cls(coordinates(df))
+
+    def __len__(self):
+        return len(self.points)
+
+    def nearest(self, points, k=1):
+        """The k closest indexed points to each query point, sorted by distance.
+
+        Returns (indices int32, distances in km float32), both (len(points) x k).
+        """
+        k = min(k, len(self))
+        chord, indices = self.tree.query(unit_vectors(np.asarray(points, dtype=np.float64)), k=k, workers=-1)
+        chord, indices = chord.reshape(len(points), k), indices.reshape(len(points), k)
+        return indices.astype(np.int32), chord_sq_to_km(chord ** 2).astype(np.float32)
+
+    def within(self, points, radius_km):
+        """Every (query, indexed point) pair closer than radius_km, as flat arrays.
+
+        Returns (query indices int64, point indices int32, distances in km float32)
+        sorted by query and then distance.
+        """
+        queries = cKDTree(unit_vectors(np.asarray(points, dtype=np.float64)))
+        pairs = queries.sparse_distance_matrix(self.tree, km_to_chord(radius_km), output_type="ndarray")
+        km = chord_sq_to_km(pairs["v"] ** 2).astype(np.float32)
+        order = np.lexsort((km, pairs["i"]))
+        return pairs["i"][order].astype(np.int64), pairs["j"][order].astype(np.int32), km[order]
+
+
+# ========== PROJECT QUERIES ==========
+def workplace_neighbors(workers, workplaces, k, cache_dir=CACHE_DIR):
+    """Each worker's k nearest workplaces (indices, km), cached on disk and memory-mapped on reload."""
+    return cached("workplace_neighbors", lambda a, b, k: SpatialIndex(b).nearest(a, k),
+                  coordinates(workers), coordinates(workplaces), outputs=2, cache_dir=cache_dir, k=k)
+
+
+def _nearest_others(points, k):
+    k = min(k, len(points) - 1)
+    indices, km = SpatialIndex(points).nearest(points, k + 1)
+    # Drop each point itself; if a duplicate location displaced it, drop the furthest instead
+    is_self = indices == np.arange(len(points))[:, None]
+    drop = np.where(is_self.any(axis=1), is_self.argmax(axis=1), k)
+    keep = np.ones(indices.shape, dtype=bool)
+    keep[np.arange(len(points)), drop] = False
+    return indices[keep].reshape(len(points), k), km[keep].reshape(len(points), k)
+
+
+def pickup_neighbors(workers, k, cache_dir=CACHE_DIR):
+    """Each worker's k nearest other workers (indices, km), the pickup-to-pickup distances of routing."""
+    points = coordinates(workers)
+    return cached("pickup_neighbors", lambda a, b, k: _nearest_others(a, k),
+                  points, points, outputs=2, cache_dir=cache_dir, k=k)
+
+
+# ========== ZONES ==========
+ZONE_INDEX = SpatialIndex(np.array(list(ZONES.values())))
+
+
+def zone_codes(df):
+    """Index into ZONES of the closest zone center for each row of a frame with Latitude/Longitude."""
+    return ZONE_INDEX.nearest(coordinates(df))[0][:, 0]
+
+
+def zones_of(df):
+    """Zone name of each row as a categorical over ZONES."""
+    return pd.Categorical.from_codes(zone_codes(df), categories=list(ZONES))
+
+
+def drivers_by_zone(drivers):
+    """Driver indices grouped by PreferredZone code; drivers with an unknown zone are in no group."""
+    codes = pd.Categorical(drivers["PreferredZone"], categories=list(ZONES)).codes
+    return [np.flatnonzero(codes == z) for z in range(len(ZONES))]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Map workers to zones and their nearest workplaces.")
+    parser.add_argument("--k", type=int, default=1, help="Nearest workplaces kept per worker")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workers = load("workers", columns=["WorkerID", "Latitude", "Longitude"])
+    workplaces = load("workplaces", columns=["WorkplaceID", "Latitude", "Longitude"])
+
+    start = time.perf_counter()
+    index = SpatialIndex.from_frame(workplaces)
+    nearest, km = index.nearest(coordinates(workers), args.k)
+    zones = zones_of(workers)
+    print(f"✅ {len(workers)} workers mapped to zones and {args.k} nearest of {len(workplaces)} workplaces "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    result = pd.DataFrame({
+        "WorkerID": np.repeat(workers["WorkerID"].to_numpy(), nearest.shape[1]),
+        "Zone": np.repeat(zones, nearest.shape[1]),
+        "Rank": np.tile(np.arange(1, nearest.shape[1] + 1), len(workers)),
+        "WorkplaceID": workplaces["WorkplaceID"].to_numpy()[nearest.ravel()],
+        "Distance": km.ravel().round(3),
+    })
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    result.to_csv(ZONE_FILE, index=False)
+    print(pd.Series(zones).value_counts().rename("Workers"))
+    print(f"✅ Saved to {ZONE_FILE}")
+
+
+if __name__ == "__main__":
+    main()
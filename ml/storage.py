@@ -0,0 +1,184 @@
+# ml/storage.py
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+DATA_DIR = "data"
+CHUNK_ROWS = 100_000
+
+SKILL_POOL = ["Welding", "Assembly", "Packaging", "Logistics", "Admin", "QA", "Forklift"]
+DAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+AVAILABILITY = {f"Available_{day}": "int8" for day in DAYS}
+# Driver zones (drivers.PreferredZone) and their centers, the CITY_CENTERS of the generators
+ZONES = {
+    "Centrum": (52.3728, 4.8936),
+    "Zuid": (52.3400, 4.8885),
+    "Noord": (52.4000, 4.9166),
+    "Sloterdijk": (52.3870, 4.8357),
+}
+WORKERS = {
+    "WorkerID": "category",
+    "Name": "category",
+    "Gender": "category",
+    "Latitude": "float64",
+    "Longitude": "float64",
+    "Skills": "category",
+    **AVAILABILITY,
+}
+
+# Typed schema of every table in data/
+SCHEMAS = {
+    "workers": WORKERS,
+    "workers_clustered": {**WORKERS, "Cluster": "int16"},
+    "drivers": {
+        "DriverID": "category",
+        "Name": "category",
+        "VehicleCapacity": "int16",
+        "MaxHoursPerDay": "int8",
+        "PreferredZone": "category",
+    },
+    "workplaces": {
+        "WorkplaceID": "category",
+        "Name": "category",
+        "Type": "category",
+        "Latitude": "float64",
+        "Longitude": "float64",
+    },
+    "shifts": {
+        "ShiftID": "category",
+        "Week": "int16",
+        "Day": "category",
+        "ShiftType": "category",
+        "StartTime": "category",
+        "EndTime": "category",
+    },
+    "assignments": {
+        "AssignmentID": "string",
+        "WorkerID": "category",
+        "DriverID": "category",
+        "WorkplaceID": "category",
+        "ShiftID": "category",
+        "Status": "category",
+    },
+    "optimized_assignments": {
+        "WorkerID": "category",
+        "DriverID": "category",
+        "WorkplaceID": "category",
+        "ShiftID": "category",
+        "Distance": "float32",
+    },
+}
+
+
+def skill_mask(skills):
+    """Comma-separated skills → uint8 bitmask, bit i set for SKILL_POOL[i]."""
+    codes = skills.astype("category")
+    masks = np.array([sum(1 << SKILL_POOL.index(s) for s in str(combo).split(",") if s in SKILL_POOL)
+                      for combo in codes.cat.categories], dtype=np.uint8)
+    return masks[codes.cat.codes.to_numpy()] if len(masks) else np.zeros(len(skills), dtype=np.uint8)
+
+
+# Columns stored next to the CSV ones, computed from them: name → (source column, function)
+DERIVED = {
+    "workers": {"SkillMask": ("Skills", skill_mask)},
+    "workers_clustered": {"SkillMask": ("Skills", skill_mask)},
+}
+
+
+def csv_path(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f"{name}.csv")
+
+
+def parquet_path(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f"{name}.parquet")
+
+
+def apply_schema(df, name):
+    schema = SCHEMAS.get(name, {})
+    df = df.astype({col: dtype for col, dtype in schema.items() if col in df.columns})
+    for col, (source, derive) in DERIVED.get(name, {}).items():
+        if source in df.columns and col not in df.columns:
+            df[col] = derive(df[source])
+    return df
+
+
+def has_fresh_parquet(name, data_dir=DATA_DIR):
+    """A Parquet copy exists and is not older than the CSV it was converted from."""
+    parquet, csv = parquet_path(name, data_dir), csv_path(name, data_dir)
+    return os.path.exists(parquet) and (not os.path.exists(csv) or os.path.getmtime(parquet) >= os.path.getmtime(csv))
+
+
+def source_path(name, data_dir=DATA_DIR):
+    """The file load() reads for a table: its Parquet copy when up to date, else the CSV."""
+    return parquet_path(name, data_dir) if has_fresh_parquet(name, data_dir) else csv_path(name, data_dir)
+
+
+def load(name, columns=None, data_dir=DATA_DIR):
+    """Load a table from data/ with its typed schema, reading only `columns` if given.
+
+    Uses the columnar Parquet copy when it is up to date and falls back to the CSV.
+    """
+    if has_fresh_parquet(name, data_dir):
+        return pd.read_parquet(parquet_path(name, data_dir), columns=columns)
+
+    df = apply_schema(pd.read_csv(csv_path(name, data_dir), **_csv_options(name, columns)), name)
+    return df[columns] if columns is not None else df
+
+
+def iter_chunks(name, columns=None, chunk_rows=CHUNK_ROWS, data_dir=DATA_DIR):
+    """Stream a table as typed DataFrames of at most chunk_rows rows, like load() but bounded in memory.
+
+    Categorical columns are typed per chunk, so their categories can differ between chunks.
+    """
+    if has_fresh_parquet(name, data_dir):
+        for batch in pq.ParquetFile(parquet_path(name, data_dir)).iter_batches(chunk_rows, columns=columns):
+            # Every batch carries the file-wide dictionary of a categorical column (1M
+            # categories for an ID); decode it and type the chunk with only its own values
+            decoded = [col.dictionary_decode() if pa.types.is_dictionary(col.type) else col for col in batch.columns]
+            yield apply_schema(pa.RecordBatch.from_arrays(decoded, names=batch.schema.names).to_pandas(), name)
+        return
+
+    for chunk in pd.read_csv(csv_path(name, data_dir), chunksize=chunk_rows, **_csv_options(name, columns)):
+        chunk = apply_schema(chunk, name)
+        yield chunk[columns] if columns is not None else chunk
+
+
+def _csv_options(name, columns):
+    """read_csv usecols/dtype for `columns`, reading the source column of derived ones."""
+    derived = DERIVED.get(name, {})
+    usecols = None
+    if columns is not None:
+        usecols = {derived[c][0] if c in derived else c for c in columns}
+    schema = {col: dtype for col, dtype in SCHEMAS.get(name, {}).items() if usecols is None or col in usecols}
+    return {"usecols": usecols, "dtype": schema}
+
+
+def convert(name, data_dir=DATA_DIR):
+    """Write the typed Parquet copy of data/<name>.csv."""
+    df = apply_schema(pd.read_csv(csv_path(name, data_dir)), name)
+    df.to_parquet(parquet_path(name, data_dir), index=False)
+    return df
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert the CSV datasets in data/ to typed Parquet.")
+    parser.add_argument("tables", nargs="*", default=sorted(SCHEMAS), help="Tables to convert (default: all)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    for name in args.tables:
+        if not os.path.exists(csv_path(name)):
+            continue
+        df = convert(name)
+        print(f"✅ {name}.parquet written with {len(df)} rows")
+
+
+if __name__ == "__main__":
+    main()
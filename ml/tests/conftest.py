@@ -0,0 +1,17 @@
+# ml/tests/conftest.py
+
+import os
+import sys
+
+import pytest
+
+# The modules import each other by plain name, as when run from ml/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """An empty working directory with a data/ folder, where the modules read and write their files."""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/cache")
+    return tmp_path
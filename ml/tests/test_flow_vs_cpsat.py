@@ -0,0 +1,35 @@
+# ml/tests/test_flow_vs_cpsat.py
+
+import numpy as np
+import pytest
+
+from benchmark_solver import generate_instance
+from distances import worker_workplace_distances
+from optimize_schedule import select_candidates, solve_subproblem, zone_drivers
+
+# A slice of the xs instance small enough for CP-SAT to prove optimality in well under a second
+WORKERS, DRIVERS, SHIFTS = 30, 5, 6
+
+
+def small_instance(seed):
+    workers, drivers, workplaces, shifts = generate_instance("xs", seed)
+    return (workers.head(WORKERS), drivers.head(DRIVERS), workplaces,
+            shifts.head(SHIFTS).reset_index(drop=True))
+
+
+@pytest.mark.parametrize("match_zones", [False, True])
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_flow_matches_cpsat_objective(workdir, seed, match_zones):
+    workers, drivers, workplaces, shifts = small_instance(seed)
+    dist = np.asarray(worker_workplace_distances(workers, workplaces, cache_dir="data/cache"))
+    candidates = select_candidates(workers, workplaces, shifts, verbose=False, cache_dir="data/cache")
+    drivers_of = zone_drivers(workers, drivers) if match_zones else None
+
+    objectives = {}
+    for backend in ["flow", "cpsat"]:
+        solution, stats = solve_subproblem(workers, drivers, workplaces, shifts, dist, candidates, backend,
+                                           "factorized", time_limit=30, drivers_of=drivers_of)
+        assert solution is not None and stats["Status"] == "OPTIMAL", (backend, stats["Status"])
+        objectives[backend] = stats["Objective"]
+
+    assert objectives["flow"] == objectives["cpsat"], objectives
@@ -0,0 +1,96 @@
+# ml/tests/test_repair_service.py
+
+import asyncio
+import csv
+import os
+
+import pytest
+
+import generate_all
+import optimize_schedule
+from repair_service import ASSIGNMENTS_FILE, RepairService, reoptimize
+from storage import load
+
+
+@pytest.fixture
+def schedule(workdir):
+    """A seeded dataset and its optimized schedule in workdir/data."""
+    generate_all.main(["--seed", "7", "--workers", "60", "--drivers", "8", "--workplaces", "4", "--weeks", "1"])
+    optimize_schedule.main([])
+    return workdir
+
+
+def result_rows():
+    return load("optimized_assignments", columns=["WorkerID", "DriverID", "WorkplaceID", "ShiftID"])
+
+
+def rosters(service):
+    return [service.roster(shift_id) for shift_id in service.shift_index]
+
+
+def absent_from_first_shift(service, rows):
+    """Report the first scheduled worker of the first shift absent; returns (WorkerID, ShiftID, response)."""
+    first = rows.sort_values(["ShiftID", "WorkerID"]).iloc[0]
+    response = service.absence(first["WorkerID"], first["ShiftID"])
+    assert response["Status"] == "replaced"
+    return first["WorkerID"], first["ShiftID"], response
+
+
+def on_roster(service, worker_id, shift_id):
+    return worker_id in {row["WorkerID"] for row in service.roster(shift_id)["Assignments"]}
+
+
+def test_restarted_service_replays_repairs(schedule):
+    service = RepairService()
+    worker_id, shift_id, response = absent_from_first_shift(service, result_rows())
+
+    restarted = RepairService()
+    assert not on_roster(restarted, worker_id, shift_id)
+    assert on_roster(restarted, response["Replacement"]["WorkerID"], shift_id)
+    assert rosters(restarted) == rosters(service)
+
+
+def test_reoptimize_keeps_earlier_repairs_and_replays_later_ones(schedule):
+    service = RepairService()
+    worker_id, shift_id, _ = absent_from_first_shift(service, result_rows())
+
+    # The run excludes the absence, so loading its result must not replay that repair again
+    past = os.path.getmtime(optimize_schedule.RESULT_FILE) - 60
+    os.utime(optimize_schedule.RESULT_FILE, (past, past))
+    outcome = asyncio.run(reoptimize(service, []))
+    assert outcome["Status"] == "loaded"
+    rows = result_rows()
+    assert worker_id not in set(rows.loc[rows["ShiftID"] == shift_id, "WorkerID"])
+    assert service.scheduled == len(rows)
+    assert not on_roster(service, worker_id, shift_id)
+
+    # A repair newer than the result is replayed onto it
+    later = rows[rows["ShiftID"] != shift_id]
+    worker_id, shift_id, response = absent_from_first_shift(service, later)
+    restarted = RepairService()
+    assert not on_roster(restarted, worker_id, shift_id)
+    assert on_roster(restarted, response["Replacement"]["WorkerID"], shift_id)
+    assert rosters(restarted) == rosters(service)
+
+
+def test_reoptimize_that_writes_nothing_keeps_the_schedule(schedule):
+    service = RepairService()
+    before = rosters(service)
+    outcome = asyncio.run(reoptimize(service, ["--compare", "--time-limit", "1"]))
+    assert outcome["Status"] == "failed"
+    assert rosters(service) == before
+
+
+def test_unknown_repair_rows_are_skipped(schedule):
+    worker_id, shift_id = result_rows().iloc[0][["WorkerID", "ShiftID"]]
+    with open(ASSIGNMENTS_FILE, "a", newline="") as f:
+        csv.writer(f, lineterminator="\n").writerows([
+            ["R000041", "W9999", "", "", shift_id, "Absent"],             # a worker no longer in workers.csv
+            ["R000042", worker_id, "", "", "S9999", "Absent"],            # a shift no longer in shifts.csv
+            ["R000043", worker_id, "D999", "WP999", shift_id, "Assigned"],
+        ])
+
+    service = RepairService()
+    assert service.scheduled == len(result_rows())
+    assert on_roster(service, worker_id, shift_id)
+    assert service.next_id == 44
@@ -0,0 +1,49 @@
+# ml/tests/test_rolling.py
+
+import numpy as np
+import pytest
+
+from generate_all import generate_drivers, generate_shifts, generate_workers, generate_workplaces, name_pools
+from optimize_schedule import optimize_rolling, rule_violations, solution_indices, work_rules
+
+WINDOW_DAYS, OVERLAP_DAYS = 3, 1   # short windows, so rest, streaks and driver weeks all cross their boundaries
+
+
+def instance(seed, n_workers, n_drivers, n_workplaces, n_weeks):
+    rng = np.random.default_rng(seed)
+    names = name_pools(seed)
+    return (generate_workers(n_workers, rng, names), generate_drivers(n_drivers, rng, names),
+            generate_workplaces(n_workplaces, rng, names), generate_shifts(n_weeks))
+
+
+def horizon_violations(rows, workers, drivers, workplaces, shifts):
+    """Rule-breaking (worker, shift) and (driver, shift) pairs of the whole result, checked without any window."""
+    solution = solution_indices(rows, workers, drivers, workplaces, shifts)
+    drop, close = rule_violations(solution, work_rules(shifts, drivers))
+    return len(drop), len(close)
+
+
+@pytest.mark.parametrize("backend, seed, size", [
+    ("flow", 1, (20, 5, 3, 2)),
+    ("flow", 2, (20, 5, 3, 2)),
+    ("flow", 1, (40, 8, 4, 2)),
+    ("cpsat", 1, (20, 4, 3, 1)),
+])
+def test_rolling_windows_carry_the_work_rules(workdir, backend, seed, size):
+    workers, drivers, workplaces, shifts = instance(seed, *size)
+
+    free = optimize_rolling(workers, drivers, workplaces, shifts, WINDOW_DAYS, OVERLAP_DAYS, backend=backend,
+                            time_limit=10)
+    assert horizon_violations(free, workers, drivers, workplaces, shifts) != (0, 0), "the rules do not bind"
+
+    rows = optimize_rolling(workers, drivers, workplaces, shifts, WINDOW_DAYS, OVERLAP_DAYS, backend=backend,
+                            enforce_rules=True, time_limit=10)
+    assert rows is not None
+    assert set(rows["ShiftID"]) == set(shifts["ShiftID"])   # every window committed its days
+    assert horizon_violations(rows, workers, drivers, workplaces, shifts) == (0, 0)
+
+
+def test_rolling_rejects_an_overlap_as_long_as_the_window(workdir):
+    workers, drivers, workplaces, shifts = instance(1, 20, 5, 3, 1)
+    with pytest.raises(ValueError):
+        optimize_rolling(workers, drivers, workplaces, shifts, WINDOW_DAYS, WINDOW_DAYS)
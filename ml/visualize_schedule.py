@@ -1,52 +1,214 @@
 # ml/visualize_schedule.py
 
-import pandas as pd
-import matplotlib.pyplot as plt
+import argparse
+import multiprocessing
 import os
+import time
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection
+from matplotlib.colors import LogNorm
+
+from storage import ZONES, load
+from spatial import zone_codes
 
 OUTPUT_DIR = "data/plots"
-os.makedirs(OUTPUT_DIR, exist_ok=True)
+PLOT_FILE = f"{OUTPUT_DIR}/optimized_routes.png"
+TILE_DIR = f"{OUTPUT_DIR}/tiles"   # <by>/<ShiftID or DriverID>.png and <by>/index.csv
+
+# PARAMETERS
+DENSITY_THRESHOLD = 20_000   # above this many segments, draw a density raster instead of lines
+DENSITY_BINS = 512           # raster cells along each axis
+SEGMENT_SAMPLES = 16         # points sampled along each segment for the raster
+CHUNK_SEGMENTS = 100_000     # segments rasterized at a time, bounding memory
+WORKER_POINTS = 50_000       # background workers drawn (sampled down to this)
+TILE_GROUPS = {"shift": "ShiftID", "driver": "DriverID"}
+
 
 # 1. Load datasets
-assignments = pd.read_csv("data/optimized_assignments.csv")
-workers = pd.read_csv("data/workers.csv")
-drivers = pd.read_csv("data/drivers.csv")
-workplaces = pd.read_csv("data/workplaces.csv")
-
-print("✅ Data loaded for visualization")
-
-# Merge assignments with coordinates
-merged = assignments.merge(workers[["WorkerID", "Latitude", "Longitude"]], on="WorkerID")
-merged = merged.merge(workplaces[["WorkplaceID", "Latitude", "Longitude"]], on="WorkplaceID", suffixes=("_worker", "_workplace"))
-merged = merged.merge(drivers[["DriverID"]], on="DriverID")
-
-# 2. Plot base
-plt.figure(figsize=(8, 6))
-
-# Workers
-plt.scatter(workers["Longitude"], workers["Latitude"], c="blue", label="Workers", alpha=0.6, s=20)
-
-# Workplaces
-plt.scatter(workplaces["Longitude"], workplaces["Latitude"], c="red", marker="*", label="Workplaces", s=120)
-
-# Drivers (just to show, positions not tracked → random small offset near workers)
-plt.scatter(workers.sample(len(drivers), random_state=42)["Longitude"] + 0.001,
-            workers.sample(len(drivers), random_state=42)["Latitude"] + 0.001,
-            c="green", marker="^", label="Drivers", s=80)
-
-# Connections: worker → workplace
-for _, row in merged.iterrows():
-    plt.plot([row["Longitude_worker"], row["Longitude_workplace"]],
-             [row["Latitude_worker"], row["Latitude_workplace"]],
-             c="gray", alpha=0.3, linewidth=0.7)
-
-plt.xlabel("Longitude")
-plt.ylabel("Latitude")
-plt.title("Optimized Worker Assignments (Workers → Workplaces)")
-plt.legend()
-plt.grid(True)
-
-# 3. Save plot
-plot_path = f"{OUTPUT_DIR}/optimized_routes.png"
-plt.savefig(plot_path)
-print(f"✅ Visualization saved at {plot_path}")
+def load_inputs():
+    workers = load("workers", columns=["WorkerID", "Latitude", "Longitude"])
+    drivers = load("drivers", columns=["DriverID", "PreferredZone"])
+    workplaces = load("workplaces", columns=["WorkplaceID", "Latitude", "Longitude"])
+    print("✅ Data loaded for visualization")
+    return workers, drivers, workplaces
+
+
+# 2. Segments as one (n, 2, 2) array of (lon, lat) start and end points, plus the
+# ShiftID and DriverID of each segment to cut tiles by
+def assignment_segments(assignments, workers, workplaces):
+    """Worker → workplace line of each assignment; rows with unknown IDs are skipped."""
+    wi = pd.Index(workers["WorkerID"]).get_indexer(assignments["WorkerID"])
+    wpi = pd.Index(workplaces["WorkplaceID"]).get_indexer(assignments["WorkplaceID"])
+    known = (wi >= 0) & (wpi >= 0)
+    start = workers[["Longitude", "Latitude"]].to_numpy()[wi[known]]
+    end = workplaces[["Longitude", "Latitude"]].to_numpy()[wpi[known]]
+    keys = assignments.loc[known, list(TILE_GROUPS.values())].astype(str).reset_index(drop=True)
+    return np.stack([start, end], axis=1), keys
+
+
+def route_segments(routes):
+    """Legs between consecutive stops of the driver routes written by routing.py."""
+    points = routes[["Longitude", "Latitude"]].to_numpy(dtype=np.float64)
+    leg = routes["Stop"].to_numpy() > 0   # stops are listed in route order, each route from Stop 0
+    ends = np.flatnonzero(leg)
+    keys = routes.loc[leg, list(TILE_GROUPS.values())].astype(str).reset_index(drop=True)
+    return np.stack([points[ends - 1], points[ends]], axis=1), keys
+
+
+def driver_positions(drivers, seed=42):
+    """Drivers' positions are not tracked → small random offset around their preferred zone's center."""
+    centers = np.array([ZONES.get(zone, (np.nan, np.nan)) for zone in drivers["PreferredZone"].astype(str)])
+    offsets = np.random.default_rng(seed).normal(0, 0.003, size=centers.shape)
+    return (centers + offsets)[:, ::-1]   # (lon, lat)
+
+
+def map_extent(*point_sets, margin=0.02):
+    """(lon min, lon max, lat min, lat max) around all (lon, lat) points, shared by the plot and its tiles."""
+    points = np.concatenate([p.reshape(-1, 2) for p in point_sets])
+    low, high = np.nanmin(points, axis=0), np.nanmax(points, axis=0)
+    pad = (high - low) * margin + 1e-6
+    return (low[0] - pad[0], high[0] + pad[0], low[1] - pad[1], high[1] + pad[1])
+
+
+# 3. Draw
+def density_raster(segments, extent, bins=DENSITY_BINS, samples=SEGMENT_SAMPLES):
+    """Segments per raster cell: points sampled along each segment, binned chunk by chunk."""
+    counts = np.zeros((bins, bins))
+    t = np.linspace(0, 1, samples)[None, :, None]
+    for lo in range(0, len(segments), CHUNK_SEGMENTS):
+        chunk = segments[lo:lo + CHUNK_SEGMENTS]
+        points = (chunk[:, :1] + t * (chunk[:, 1:] - chunk[:, :1])).reshape(-1, 2)
+        counts += np.histogram2d(points[:, 0], points[:, 1], bins=bins, range=[extent[:2], extent[2:]])[0]
+    return counts / samples
+
+
+def draw_segments(ax, segments, extent, threshold=DENSITY_THRESHOLD, bins=DENSITY_BINS):
+    """All segments as one LineCollection, or as a density raster above `threshold` segments.
+
+    Returns the mode used ("lines" or "density").
+    """
+    if len(segments) <= threshold:
+        ax.add_collection(LineCollection(segments, colors="gray", alpha=0.3, linewidths=0.7))
+        return "lines"
+    counts = np.ma.masked_equal(density_raster(segments, extent, bins).T, 0)
+    image = ax.imshow(counts, origin="lower", extent=extent, aspect="auto", cmap="viridis", norm=LogNorm(),
+                      interpolation="nearest", alpha=0.85, zorder=1.5)   # over the worker points
+    ax.figure.colorbar(image, ax=ax, label="Segments per cell")
+    return "density"
+
+
+def draw_points(ax, workplaces, workers=None, drivers=None, seed=42):
+    """Workers (colored by zone, sampled to WORKER_POINTS), workplaces and drivers."""
+    if workers is not None:
+        sampled = len(workers) > WORKER_POINTS
+        if sampled:
+            workers = workers.iloc[np.random.default_rng(seed).choice(len(workers), WORKER_POINTS, replace=False)]
+        codes = zone_codes(workers)
+        for code, zone in enumerate(ZONES):
+            in_zone = codes == code
+            ax.scatter(workers.loc[in_zone, "Longitude"], workers.loc[in_zone, "Latitude"],
+                       label=f"Workers ({zone})", alpha=0.6, s=2 if sampled else 20)
+    ax.scatter(workplaces["Longitude"], workplaces["Latitude"], c="red", marker="*", label="Workplaces",
+               s=120 if len(workplaces) <= 50 else 20, zorder=3)
+    if drivers is not None:
+        positions = driver_positions(drivers, seed)
+        ax.scatter(positions[:, 0], positions[:, 1], c="green", marker="^", label="Drivers",
+                   s=80 if len(drivers) <= 200 else 8, zorder=3)
+
+
+def render(path, segments, title, extent, workplaces, workers=None, drivers=None, threshold=DENSITY_THRESHOLD,
+           bins=DENSITY_BINS):
+    """Save one map of the segments over the points; returns the segment mode used."""
+    fig, ax = plt.subplots(figsize=(8, 6))
+    draw_points(ax, workplaces, workers, drivers)
+    mode = draw_segments(ax, segments, extent, threshold, bins)
+    ax.set_xlim(extent[:2])
+    ax.set_ylim(extent[2:])
+    ax.set_xlabel("Longitude")
+    ax.set_ylabel("Latitude")
+    ax.set_title(title)
+    ax.legend(loc="upper right")
+    ax.grid(True)
+    fig.savefig(path)
+    plt.close(fig)
+    return mode
+
+
+# 4. Tiles: one image per shift or driver, rendered in a process pool on the same extent
+# Set in each pool process by init_tile_worker, so tasks only carry their segment indices
+_segments = _workplaces = _extent = None
+_threshold, _bins = DENSITY_THRESHOLD, DENSITY_BINS
+
+
+def init_tile_worker(segments, workplaces, extent, threshold, bins):
+    global _segments, _workplaces, _extent, _threshold, _bins
+    _segments, _workplaces, _extent, _threshold, _bins = segments, workplaces, extent, threshold, bins
+
+
+def render_tile(task):
+    """Pool task: one tile; returns (key, segments, mode, path)."""
+    key, index, path = task
+    mode = render(path, _segments[index], key, _extent, _workplaces, threshold=_threshold, bins=_bins)
+    return key, len(index), mode, path
+
+
+def render_tiles(segments, keys, by, workplaces, extent, processes=None, threshold=DENSITY_THRESHOLD,
+                 bins=DENSITY_BINS, tile_dir=TILE_DIR):
+    """A tile per ShiftID or DriverID (by = "shift" / "driver") and an index.csv listing them."""
+    column = TILE_GROUPS[by]
+    out = os.path.join(tile_dir, by)
+    os.makedirs(out, exist_ok=True)
+    groups = pd.RangeIndex(len(keys)).groupby(keys[column].to_numpy())
+    tasks = [(key, np.asarray(index), os.path.join(out, f"{key}.png")) for key, index in sorted(groups.items())]
+    init_args = (segments, workplaces[["Longitude", "Latitude"]], extent, threshold, bins)
+    with multiprocessing.Pool(processes, initializer=init_tile_worker, initargs=init_args) as pool:
+        results = pool.map(render_tile, tasks, chunksize=max(1, len(tasks) // (4 * (processes or os.cpu_count()))))
+    index = pd.DataFrame(results, columns=[column, "Segments", "Mode", "Path"])
+    index.to_csv(os.path.join(out, "index.csv"), index=False)
+    return index
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Map the optimized assignments or driver routes.")
+    parser.add_argument("--source", choices=["assignments", "routes"], default="assignments",
+                        help="Worker → workplace lines of optimized_assignments, or the legs of driver_routes")
+    parser.add_argument("--density-threshold", type=int, default=DENSITY_THRESHOLD,
+                        help="Segment count above which a density raster replaces the lines")
+    parser.add_argument("--bins", type=int, default=DENSITY_BINS, help="Density raster cells along each axis")
+    parser.add_argument("--tiles", nargs="+", choices=list(TILE_GROUPS), default=[],
+                        help=f"Also render one image per shift and/or driver under {TILE_DIR}/")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Pool size for --tiles")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    workers, drivers, workplaces = load_inputs()
+    if args.source == "routes":
+        routes = load("driver_routes", columns=["DriverID", "ShiftID", "Stop", "Latitude", "Longitude"])
+        segments, keys = route_segments(routes)
+        title = "Driver Routes (Stops in Pickup Order)"
+    else:
+        assignments = load("optimized_assignments", columns=["WorkerID", "DriverID", "WorkplaceID", "ShiftID"])
+        segments, keys = assignment_segments(assignments, workers, workplaces)
+        title = "Optimized Worker Assignments (Workers → Workplaces)"
+    extent = map_extent(workers[["Longitude", "Latitude"]].to_numpy(), workplaces[["Longitude", "Latitude"]].to_numpy(),
+                        driver_positions(drivers), segments)
+
+    start = time.perf_counter()
+    mode = render(PLOT_FILE, segments, title, extent, workplaces, workers, drivers, args.density_threshold, args.bins)
+    print(f"✅ Visualization of {len(segments)} segments ({mode}) saved at {PLOT_FILE} "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    for by in args.tiles:
+        start = time.perf_counter()
+        index = render_tiles(segments, keys, by, workplaces, extent, args.processes, args.density_threshold, args.bins)
+        print(f"✅ {len(index)} {by} tiles saved under {TILE_DIR}/{by} in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+# notifier/notify.py
+
+import argparse
+import asyncio
+import hashlib
+import os
+import random
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+from string import Template
+
+import pandas as pd
+
+DATA_DIR = os.environ.get("DATA_DIR", "data")
+JOURNAL_FILE = f"{DATA_DIR}/notifier_journal.tsv"   # one line per sent message: key, content digest
+FAILED_FILE = f"{DATA_DIR}/notifier_failed.csv"
+
+# PARAMETERS
+SMTP_HOST = os.environ.get("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.environ.get("SMTP_PORT", 1025))
+SMTP_USER = os.environ.get("SMTP_USER")
+SMTP_PASSWORD = os.environ.get("SMTP_PASSWORD")
+SMTP_STARTTLS = os.environ.get("SMTP_STARTTLS", "0") == "1"
+SENDER = os.environ.get("NOTIFY_SENDER", "scheduler@example.com")
+CONTACT_DOMAIN = "example.com"   # <id>@workers.<domain> / <id>@drivers.<domain> when no --contacts file
+CONNECTIONS = 8                  # pooled SMTP sessions = messages in flight
+MESSAGES_PER_CONNECTION = 500    # reopen a session after this many messages (relays cap them)
+MAX_ATTEMPTS = 4
+RETRY_SECONDS = 1.0              # first retry delay, doubled on each attempt
+SMTP_TIMEOUT = 30
+
+# Templates, compiled once: per-row lines are built column-wise for all rows at once,
+# then each recipient's lines are joined into a body
+SUBJECT = Template("Your schedule: $first → $last")
+WORKER_BODY = Template("Hello $name,\n\nYou are scheduled for $count shifts:\n\n$lines\n\n"
+                       "Your driver will pick you up before each shift.\n")
+DRIVER_BODY = Template("Hello $name,\n\nYou have $count pickups:\n\n$lines\n\n"
+                       "Please confirm any change with the planning team.\n")
+
+
+# 1. Load
+def read(name, columns):
+    return pd.read_csv(os.path.join(DATA_DIR, f"{name}.csv"), usecols=columns, dtype=str)
+
+
+def load_schedule(weeks=None):
+    """Optimized assignments with the shift, worker, driver and workplace details of each row."""
+    rows = read("optimized_assignments", ["WorkerID", "DriverID", "WorkplaceID", "ShiftID"])
+    shifts = read("shifts", ["ShiftID", "Week", "Day", "ShiftType", "StartTime", "EndTime"])
+    if weeks:
+        shifts = shifts[shifts["Week"].astype(int).isin(weeks)]
+    rows = rows.merge(shifts.reset_index(names="Order"), on="ShiftID")   # Order: shifts.csv is in time order
+    for name, key in (("workers", "WorkerID"), ("drivers", "DriverID"), ("workplaces", "WorkplaceID")):
+        rows = rows.merge(read(name, [key, "Name"]).rename(columns={"Name": f"{key[:-2]}Name"}), on=key, how="left")
+    print(f"✅ {len(rows)} assignments loaded")
+    return rows.sort_values(["Order", "WorkplaceID"], kind="stable").reset_index(drop=True)
+
+
+def load_contacts(path):
+    """ID → e-mail address from a CSV with ID and Email columns."""
+    contacts = pd.read_csv(path, dtype=str)
+    return pd.Series(contacts["Email"].to_numpy(), index=contacts["ID"])
+
+
+# 2. Render: one message per worker and one per driver
+def messages(rows, kind, contacts=None):
+    """DataFrame of (Key, To, Subject, Body) for every worker (kind="worker") or driver (kind="driver")."""
+    when = "Week " + rows["Week"] + " " + rows["Day"] + " " + rows["ShiftType"] + " " \
+        + rows["StartTime"] + "-" + rows["EndTime"]
+    if kind == "worker":
+        key, name, body = "WorkerID", "WorkerName", WORKER_BODY
+        lines = "- " + when + ": " + rows["WorkplaceName"].fillna(rows["WorkplaceID"]) + " (" + rows["WorkplaceID"] \
+            + "), driver " + rows["DriverName"].fillna(rows["DriverID"])
+    else:
+        key, name, body = "DriverID", "DriverName", DRIVER_BODY
+        lines = "- " + when + ": " + rows["WorkerName"].fillna(rows["WorkerID"]) + " (" + rows["WorkerID"] \
+            + ") to " + rows["WorkplaceName"].fillna(rows["WorkplaceID"])
+
+    grouped = rows.assign(Line=lines, When=when).groupby(key, sort=True)
+    per = grouped.agg(Name=(name, "first"), Count=("Line", "size"), First=("When", "first"), Last=("When", "last"))
+    per["Lines"] = grouped["Line"].agg("\n".join)
+    ids = per.index.to_series()
+    to = contacts.reindex(ids).fillna("") if contacts is not None else pd.Series("", index=ids)
+    default = ids.str.lower() + f"@{kind}s.{CONTACT_DOMAIN}"
+    return pd.DataFrame({
+        "Key": f"{kind}:" + ids,
+        "To": to.where(to != "", default),
+        "Subject": [SUBJECT.substitute(first=f, last=l) for f, l in zip(per["First"], per["Last"])],
+        "Body": [body.substitute(name=n if isinstance(n, str) else i, count=c, lines=t)
+                 for i, n, c, t in zip(ids, per["Name"], per["Count"], per["Lines"])],
+    }).reset_index(drop=True)
+
+
+def digest(subject, body):
+    return hashlib.sha1(f"{subject}\n{body}".encode()).hexdigest()[:16]
+
+
+# 3. Journal: a message is skipped when the same key was sent with the same content,
+# so an interrupted run resumes where it stopped and a changed schedule is re-sent
+def read_journal(path=JOURNAL_FILE):
+    if not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {tuple(line.rstrip("\n").split("\t")) for line in f if line.strip()}
+
+
+# 4. Send: CONNECTIONS tasks, each owning one SMTP session from the pool; the
+# blocking smtplib calls run in a thread per session, so at most CONNECTIONS
+# messages are in flight
+class PooledConnection:
+    """An SMTP session reused for many messages; reopened after errors or MESSAGES_PER_CONNECTION sends."""
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.smtp, self.sent = None, 0
+
+    def send(self, message):
+        if self.smtp is None or self.sent >= MESSAGES_PER_CONNECTION:
+            self.close()
+            self.smtp = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+            if SMTP_STARTTLS:
+                self.smtp.starttls()
+            if SMTP_USER:
+                self.smtp.login(SMTP_USER, SMTP_PASSWORD)
+            self.sent = 0
+        self.smtp.send_message(message)
+        self.sent += 1
+
+    def close(self):
+        if self.smtp is not None:
+            try:
+                self.smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.smtp = None
+
+
+def email(row):
+    message = EmailMessage()
+    message["From"], message["To"], message["Subject"] = SENDER, row.To, row.Subject
+    message.set_content(row.Body)
+    return message
+
+
+def is_permanent(error):
+    """5xx replies and refused recipients will fail again; anything else is worth a retry."""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+async def deliver(loop, executor, connection, message):
+    """Send one message, retrying temporary failures; returns (error or None, attempts)."""
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            await loop.run_in_executor(executor, connection.send, message)
+            return None, attempt
+        except OSError as error:   # smtplib errors included
+            if not isinstance(error, smtplib.SMTPResponseException):   # the session itself broke
+                await loop.run_in_executor(executor, connection.close)
+            if is_permanent(error) or attempt == MAX_ATTEMPTS:
+                return error, attempt
+            # Exponential backoff with jitter, so retries of many sessions do not line up
+            await asyncio.sleep(RETRY_SECONDS * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+
+
+async def send_all(outbox, journal_path=JOURNAL_FILE, host=SMTP_HOST, port=SMTP_PORT, connections=CONNECTIONS,
+                   report_every=1000):
+    """Send every row of outbox, appending each success to the journal; returns the failed rows."""
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    for row in outbox.itertuples(index=False):
+        queue.put_nowait(row)
+    failed, sent = [], 0
+    start = time.perf_counter()
+
+    async def sender(executor, journal):
+        nonlocal sent
+        connection = PooledConnection(host, port)
+        try:
+            while not queue.empty():
+                row = queue.get_nowait()
+                error, attempts = await deliver(loop, executor, connection, email(row))
+                if error is not None:
+                    failed.append({"Key": row.Key, "To": row.To, "Error": repr(error), "Attempts": attempts})
+                    continue
+                journal.write(f"{row.Key}\t{digest(row.Subject, row.Body)}\n")
+                sent += 1
+                if sent % report_every == 0:
+                    print(f"📨 {sent}/{len(outbox)} sent ({sent / (time.perf_counter() - start):.0f}/s)", flush=True)
+        finally:
+            await loop.run_in_executor(executor, connection.close)
+
+    connections = max(1, min(connections, len(outbox)))
+    # Line-buffered: each sent message is in the journal before the next send, so a crash never re-sends it
+    with ThreadPoolExecutor(connections) as executor, open(journal_path, "a", buffering=1) as journal:
+        await asyncio.gather(*(sender(executor, journal) for _ in range(connections)))
+    elapsed = time.perf_counter() - start
+    print(f"✅ {sent} messages sent in {elapsed:.2f}s ({sent / max(elapsed, 1e-9):.0f}/s) "
+          f"over {connections} connections, {len(failed)} failed")
+    return pd.DataFrame(failed, columns=["Key", "To", "Error", "Attempts"])
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="E-mail each worker and driver their optimized shifts.")
+    parser.add_argument("--week", type=int, nargs="+", help="Only notify shifts of these weeks")
+    parser.add_argument("--to", choices=["workers", "drivers", "both"], default="both")
+    parser.add_argument("--contacts", help="CSV with ID and Email columns (default: <id>@<kind>s."
+                                           f"{CONTACT_DOMAIN})")
+    parser.add_argument("--host", default=SMTP_HOST)
+    parser.add_argument("--port", type=int, default=SMTP_PORT)
+    parser.add_argument("--connections", type=int, default=CONNECTIONS,
+                        help="Pooled SMTP sessions, i.e. messages in flight")
+    parser.add_argument("--journal", default=JOURNAL_FILE, help="Progress journal; sent messages are skipped")
+    parser.add_argument("--fresh", action="store_true", help="Ignore the journal and send everything again")
+    parser.add_argument("--dry-run", action="store_true", help="Render the messages and print one of each kind")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    start = time.perf_counter()
+    rows = load_schedule(args.week)
+    contacts = load_contacts(args.contacts) if args.contacts else None
+    kinds = ["worker", "driver"] if args.to == "both" else [args.to[:-1]]
+    outbox = pd.concat([messages(rows, kind, contacts) for kind in kinds], ignore_index=True)
+    print(f"✅ {len(outbox)} messages rendered in {time.perf_counter() - start:.2f}s")
+
+    if args.dry_run:
+        for kind in kinds:
+            first = outbox[outbox["Key"].str.startswith(kind)].head(1)
+            for row in first.itertuples(index=False):
+                print(f"\nTo: {row.To}\nSubject: {row.Subject}\n\n{row.Body}")
+    else:
+        if args.fresh and os.path.exists(args.journal):
+            os.remove(args.journal)
+        done = read_journal(args.journal)
+        pending = [(key, digest(s, b)) not in done for key, s, b in zip(outbox["Key"], outbox["Subject"], outbox["Body"])]
+        outbox = outbox[pending]
+        print(f"♻️ {len(pending) - len(outbox)} messages already sent according to {args.journal}, {len(outbox)} to send")
+        try:
+            failed = asyncio.run(send_all(outbox, args.journal, args.host, args.port, args.connections)) \
+                if len(outbox) else []
+        except KeyboardInterrupt:
+            raise SystemExit(f"⚠️ Interrupted: sent messages are in {args.journal}, run again to resume")
+        if len(failed):
+            failed.to_csv(FAILED_FILE, index=False)
+            print(f"⚠️ {len(failed)} messages failed, listed in {FAILED_FILE}; a new run retries them")
@@ -0,0 +1,102 @@
+# notifier/smtp_sink.py
+
+import argparse
+import asyncio
+import os
+import random
+import time
+
+# Local SMTP stand-in for notify.py: accepts every message and keeps a count, or
+# stores them as .eml files. It can add latency per message and fail a share of
+# them with a temporary error, to exercise concurrency and retries.
+
+
+class Sink:
+    def __init__(self, delay=0.0, fail_rate=0.0, save_dir=None, seed=None):
+        self.delay, self.fail_rate, self.save_dir = delay, fail_rate, save_dir
+        self.rng = random.Random(seed)
+        self.received = self.refused = self.sessions = 0
+        self.started = time.perf_counter()
+
+    async def handle(self, reader, writer):
+        self.sessions += 1
+
+        async def reply(line):
+            writer.write(f"{line}\r\n".encode())
+            await writer.drain()
+
+        await reply("220 smtp-sink ESMTP")
+        recipients = []
+        try:
+            while line := await reader.readline():
+                command = line.decode(errors="replace").strip()
+                verb = command[:4].upper()
+                if verb == "EHLO":
+                    await reply("250-smtp-sink\r\n250 8BITMIME")
+                elif verb == "HELO":
+                    await reply("250 smtp-sink")
+                elif verb == "MAIL":
+                    recipients = []
+                    if self.rng.random() < self.fail_rate:
+                        self.refused += 1
+                        await reply("451 4.3.0 Temporary failure, try again")
+                    else:
+                        await reply("250 OK")
+                elif verb == "RCPT":
+                    recipients.append(command[8:].strip(" <>"))
+                    await reply("250 OK")
+                elif verb == "DATA":
+                    await reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while (chunk := await reader.readline()) not in (b".\r\n", b".\n", b""):
+                        data.append(chunk[1:] if chunk.startswith(b"..") else chunk)
+                    if self.delay:
+                        await asyncio.sleep(self.delay)
+                    self.received += 1
+                    if self.save_dir:
+                        with open(os.path.join(self.save_dir, f"{self.received:07d}.eml"), "wb") as f:
+                            f.writelines(data)
+                    await reply("250 OK queued")
+                elif verb in ("RSET", "NOOP"):
+                    await reply("250 OK")
+                elif verb == "QUIT":
+                    await reply("221 Bye")
+                    break
+                else:
+                    await reply("502 Command not implemented")
+        finally:
+            writer.close()
+
+    async def report(self, every):
+        while True:
+            await asyncio.sleep(every)
+            elapsed = time.perf_counter() - self.started
+            print(f"📬 {self.received} messages received ({self.received / elapsed:.0f}/s), "
+                  f"{self.refused} refused, {self.sessions} sessions", flush=True)
+
+
+async def serve(host, port, sink, report_every):
+    server = await asyncio.start_server(sink.handle, host, port)
+    print(f"✅ SMTP sink listening on {host}:{port}", flush=True)
+    async with server:
+        await asyncio.gather(server.serve_forever(), sink.report(report_every))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local SMTP server that accepts and counts messages.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1025)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds spent on each message, like a remote relay")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="Share of messages answered with a temporary 451 error")
+    parser.add_argument("--save-dir", help="Store every message as a .eml file in this directory")
+    parser.add_argument("--report-every", type=float, default=10.0, help="Seconds between counter prints")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+    if args.save_dir:
+        os.makedirs(args.save_dir, exist_ok=True)
+    try:
+        asyncio.run(serve(args.host, args.port, Sink(args.delay, args.fail_rate, args.save_dir, args.seed),
+                          args.report_every))
+    except KeyboardInterrupt:
+        pass